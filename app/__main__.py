@@ -0,0 +1,9 @@
+import sys
+from multiprocessing import freeze_support
+
+from app.cli import main
+
+if __name__ == "__main__":
+    # Necessário para o multiprocessing funcionar em executáveis (PyInstaller)
+    freeze_support()
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Linha de comando do FotoFinder, para servidores sem interface gráfica e tarefas agendadas (cron).
+
+Exemplos:
+    python -m app agrupar /fotos --destino /saida --precisao Preciso --min-fotos 3
+    python -m app agrupar /fotos --somente-previa --formato csv --saida grupos.csv
+    python -m app individual /fotos --referencia joao.jpg --nome Joao
+    python -m app lote /fotos --referencias /rostos --multiplas-pessoas --saida resultados.json
+    python -m app indexar /fotos
+    python -m app lote /fotos --referencias /rostos --indice --top-k 50 --modo-saida Manifesto
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+
+from .core.config import ConfiguracaoAnalise, MAPEAMENTO_EPS, MAPEAMENTO_DOWNSCALE
+from .core.clustering import MOTORES_AGRUPAMENTO
+from .core.encoding_cache import CACHE_FILE, perfil_adaptativo
+from .core.descoberta import EXTENSOES_PADRAO
+from .core.saida import MODOS_SAIDA
+from .core.processing import ProcessingEngine, EVENTO_STATUS, EVENTO_PREVIA, EVENTO_ERRO, EVENTO_FIM
+
+def _downscale(valor):
+    if valor in MAPEAMENTO_DOWNSCALE:
+        return MAPEAMENTO_DOWNSCALE[valor]
+    if valor.startswith("auto"):
+        # "auto" ou "auto:<megapixels>": perfil adaptativo com esse orçamento por imagem
+        _, _, megapixels = valor.partition(":")
+        try:
+            return perfil_adaptativo(float(megapixels) * 1_000_000) if megapixels else perfil_adaptativo()
+        except ValueError:
+            raise argparse.ArgumentTypeError("use auto ou auto:<megapixels>, ex.: auto:2")
+    try:
+        fator = float(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"use um número entre 0 e 1 ou um de {list(MAPEAMENTO_DOWNSCALE)}")
+    if not 0 < fator <= 1:
+        raise argparse.ArgumentTypeError("o fator de downscale deve estar entre 0 e 1")
+    return fator
+
+def criar_parser():
+    parser = argparse.ArgumentParser(prog="python -m app", description="FotoFinder - organização de fotos por reconhecimento facial.", formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument("origem", help="Pasta com as fotos a analisar")
+    comum.add_argument("--destino", help="Pasta onde as cópias serão criadas (padrão: a própria origem)")
+    comum.add_argument("--precisao", choices=list(MAPEAMENTO_EPS), default="Equilibrado")
+    comum.add_argument("--downscale", type=_downscale, default=0.5, help="Fator de redução (0-1), Original/Rápido/Muito Rápido ou auto[:megapixels] (resolução escolhida por imagem). Padrão: 0.5")
+    comum.add_argument("--hibrido", action="store_true", help="Detecta na imagem reduzida e codifica na resolução original")
+    comum.add_argument("--rajadas", action="store_true", help="Analisa uma foto por sequência de fotos quase idênticas e reaproveita os rostos nas demais")
+    comum.add_argument("--prefiltro", action="store_true", help="Descarta antes fotos sem rostos (paisagens, capturas de tela) com uma detecção rápida em baixa resolução")
+    comum.add_argument("--tempo-limite", type=float, default=180, metavar="SEG", help="Tempo máximo por imagem; acima disso o worker é substituído e a imagem conta como falha (padrão: %(default)s, 0 = sem limite)")
+    comum.add_argument("--sem-subpastas", action="store_true", help="Não procura imagens nas subpastas da origem")
+    comum.add_argument("--extensoes", default=",".join(EXTENSOES_PADRAO), help="Extensões aceitas, separadas por vírgula (padrão: %(default)s)")
+    comum.add_argument("--incluir", action="append", default=[], metavar="GLOB", help="Processa apenas arquivos que casam com o padrão (pode repetir)")
+    comum.add_argument("--excluir", action="append", default=[], metavar="GLOB", help="Ignora arquivos ou pastas que casam com o padrão (pode repetir)")
+    comum.add_argument("--modo-saida", choices=MODOS_SAIDA, default="Copiar", help="Como gravar os resultados no destino (padrão: %(default)s)")
+    comum.add_argument("--threads-copia", type=int, default=4, help="Threads usadas nas cópias (padrão: %(default)s)")
+    comum.add_argument("--cache", default=CACHE_FILE, help=f"Arquivo do cache de codificações (padrão: {CACHE_FILE})")
+    comum.add_argument("--cache-hash", action="store_true", help="Confere as entradas do cache também pelo hash do conteúdo do arquivo (mais lento, detecta arquivos trocados com o mesmo tamanho e data)")
+    comum.add_argument("--sem-cache", action="store_true", help="Não usa o cache de codificações")
+    comum.add_argument("--formato", choices=["json", "csv"], default="json", help="Formato da saída")
+    comum.add_argument("--saida", help="Arquivo de saída (padrão: stdout)")
+    comum.add_argument("--silencioso", action="store_true", help="Não mostra o progresso no stderr")
+    comum.add_argument("--estatisticas", action="store_true", help="Mostra no stderr os tempos por etapa (p50/p95), as imagens mais lentas e as falhas")
+    comum.add_argument("--trace", metavar="ARQUIVO", help="Grava o tempo de cada imagem: .jsonl (JSON por linha) ou .json (Chrome trace)")
+    comum.add_argument("--pasta-indice", help="Pasta do índice da biblioteca (padrão: ~/.fotofinder/indices/<hash da origem>)")
+
+    sub = parser.add_subparsers(dest="modo", required=True)
+    p_agrupar = sub.add_parser("agrupar", aliases=["cluster"], parents=[comum], help="Agrupa todas as pessoas automaticamente")
+    p_agrupar.add_argument("--min-fotos", type=int, default=2, help="Mínimo de fotos por grupo")
+    p_agrupar.add_argument("--motor", choices=MOTORES_AGRUPAMENTO, default="Automático", help="Motor de agrupamento")
+    p_agrupar.add_argument("--somente-previa", action="store_true", help="Apenas lista os grupos, sem copiar arquivos")
+    p_agrupar.add_argument("--memoria-rostos", type=int, default=1024, metavar="MB", help="Memória máxima das codificações; acima disso elas vão para o disco (padrão: %(default)s, 0 = sem limite)")
+    p_agrupar.add_argument("--recomecar", action="store_true", help="Ignora o progresso salvo de uma análise interrompida desta pasta e começa do zero")
+    p_agrupar.add_argument("--pasta-temporaria", help="Pasta dos arquivos de codificações que passam do limite de memória (padrão: a temporária do sistema)")
+
+    p_individual = sub.add_parser("individual", parents=[comum], help="Busca uma pessoa a partir de uma foto de referência")
+    p_individual.add_argument("--referencia", required=True, help="Foto de referência da pessoa")
+    p_individual.add_argument("--nome", required=True, help="Nome da pessoa (nome da pasta de destino)")
+
+    p_lote = sub.add_parser("lote", aliases=["batch"], parents=[comum], help="Busca todas as pessoas de uma pasta de referências")
+    p_lote.add_argument("--referencias", required=True, help="Pasta com uma foto por pessoa (o nome do arquivo é o nome da pessoa) ou subpastas com várias fotos de cada pessoa")
+    p_lote.add_argument("--multiplas-pessoas", action="store_true", help="Copia fotos de grupo para a pasta de cada pessoa reconhecida")
+
+    for p_busca in (p_individual, p_lote):
+        p_busca.add_argument("--indice", action="store_true", help="Busca no índice da biblioteca (criado com 'indexar') em vez de analisar as fotos")
+        p_busca.add_argument("--top-k", type=int, help="Com --indice, grava só as N fotos mais parecidas de cada pessoa")
+
+    sub.add_parser("indexar", aliases=["index"], parents=[comum], help="Cria ou atualiza o índice de rostos da biblioteca para buscas instantâneas")
+    return parser
+
+def montar_configuracao(args):
+    return ConfiguracaoAnalise(
+        pasta_origem=args.origem,
+        pasta_destino=args.destino,
+        precisao=args.precisao,
+        min_fotos_por_grupo=getattr(args, "min_fotos", 2),
+        downscale_factor=args.downscale,
+        hibrido=args.hibrido,
+        agrupar_rajadas=args.rajadas,
+        prefiltro=args.prefiltro,
+        tempo_limite_imagem=args.tempo_limite or None,
+        motor_agrupamento=getattr(args, "motor", "Automático"),
+        memoria_rostos_mb=getattr(args, "memoria_rostos", 1024) or None,
+        pasta_temporaria=getattr(args, "pasta_temporaria", None),
+        retomar=not getattr(args, "recomecar", False),
+        recursivo=not args.sem_subpastas,
+        extensoes=tuple(e.strip() for e in args.extensoes.split(",") if e.strip()),
+        incluir=tuple(args.incluir),
+        excluir=tuple(args.excluir),
+        modo_saida=args.modo_saida,
+        threads_copia=args.threads_copia,
+        foto_referencia=getattr(args, "referencia", None),
+        nome_pessoa=getattr(args, "nome", ""),
+        pasta_referencias=getattr(args, "referencias", None),
+        multiplas_pessoas=getattr(args, "multiplas_pessoas", False),
+        cache_db=None if args.sem_cache else args.cache,
+        cache_hash=args.cache_hash,
+        arquivo_trace=args.trace,
+        usar_indice=getattr(args, "indice", False),
+        pasta_indice=args.pasta_indice,
+        top_k=getattr(args, "top_k", None),
+    )
+
+def escrever_saida(registros, mensagem, formato, destino):
+    arquivo = open(destino, "w", newline="", encoding="utf-8") if destino else sys.stdout
+    try:
+        if formato == "csv":
+            writer = csv.DictWriter(arquivo, fieldnames=["grupo", "origem", "destino"])
+            writer.writeheader()
+            writer.writerows(registros)
+        else:
+            json.dump({"mensagem": mensagem, "resultados": registros}, arquivo, ensure_ascii=False, indent=2)
+            arquivo.write("\n")
+    finally:
+        if destino:
+            arquivo.close()
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    for pasta in (args.origem, getattr(args, "referencias", None)):
+        if pasta is not None and not os.path.isdir(pasta):
+            parser.error(f"pasta não encontrada: {pasta}")
+    if getattr(args, "referencia", None) and not os.path.isfile(args.referencia):
+        parser.error(f"arquivo não encontrado: {args.referencia}")
+    config = montar_configuracao(args)
+    estado = {"mensagem": "", "erro": False, "previa": None}
+
+    def ao_evento(tipo, *dados):
+        if tipo == EVENTO_STATUS and not args.silencioso:
+            texto, progresso = dados
+            print(f"[{progresso * 100:5.1f}%] {texto}" if progresso is not None else texto, file=sys.stderr)
+        elif tipo == EVENTO_ERRO:
+            estado["erro"] = True
+            print(f"{dados[0]}: {dados[1]}", file=sys.stderr)
+        elif tipo == EVENTO_PREVIA:
+            estado["previa"] = dados
+        elif tipo == EVENTO_FIM:
+            estado["mensagem"] = dados[0]
+
+    engine = ProcessingEngine(ao_evento)
+    if args.modo in ("agrupar", "cluster"):
+        def executar():
+            engine.executar_busca_cluster(config)
+            if engine.sessao is not None and not args.somente_previa and not engine.stop_event.is_set():
+                engine.copiar_grupos(config)
+    elif args.modo in ("indexar", "index"):
+        def executar(): engine.indexar_biblioteca(config)
+    elif args.modo == "individual":
+        def executar(): engine.executar_busca_individual(config)
+    else:
+        def executar(): engine.executar_busca_lote(config)
+
+    # O engine roda em outra thread para que Ctrl+C interrompa a análise de forma limpa
+    thread = threading.Thread(target=executar, daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(0.5)
+    except KeyboardInterrupt:
+        print("Interrompendo análise...", file=sys.stderr)
+        engine.parar()
+        thread.join()
+        engine.fechar()
+        return 130
+    engine.fechar()
+
+    registros = engine.resultados
+    if args.modo in ("agrupar", "cluster") and args.somente_previa and estado["previa"]:
+        grupos, isolados = estado["previa"]
+        registros = [{"grupo": f"Pessoa_{labelID + 1:02d}", "origem": caminho, "destino": None} for labelID, caminhos in grupos.items() for caminho in caminhos]
+        registros += [{"grupo": "Isolados", "origem": caminho, "destino": None} for caminho in isolados]
+
+    if not args.silencioso:
+        print(estado["mensagem"], file=sys.stderr)
+    if args.estatisticas:
+        print(engine.estatisticas.texto_resumo(), file=sys.stderr)
+    escrever_saida(registros, estado["mensagem"], args.formato, args.saida)
+    return 1 if estado["erro"] else 0
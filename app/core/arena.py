@@ -0,0 +1,99 @@
+# app/core/arena.py
+
+import os
+
+import numpy as np
+
+# Cada rosto ocupa uma linha: codificação float32 e caixa (top, right, bottom, left) int32
+DTYPE_ROSTO = np.dtype([("encoding", "<f4", (128,)), ("caixa", "<i4", (4,))])
+# Linhas por arquivo de arena (segmento, ~8,6 MB). Os segmentos já lidos são apagados,
+# então a arena ocupa no máximo uns dois segmentos por worker, e não todos os rostos da execução
+LINHAS_POR_SEGMENTO = 16384
+
+# Lado do worker: [pasta, descritor do arquivo, segmento, linhas já gravadas no segmento] do processo atual
+_escrita = None
+
+def caminho_arena(pasta, pid, segmento):
+    return os.path.join(pasta, f"arena_{pid}_{segmento}.bin")
+
+def espaco_arena(num_processos):
+    """Espaço máximo (bytes) ocupado pela arena de uma execução com 'num_processos' workers."""
+    return 2 * num_processos * LINHAS_POR_SEGMENTO * DTYPE_ROSTO.itemsize
+
+def _abrir_segmento(pasta, segmento):
+    fd = os.open(caminho_arena(pasta, os.getpid(), segmento), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    return [pasta, fd, segmento, 0]
+
+def gravar_rostos(pasta, encodings, caixas):
+    """
+    Executado no worker: acrescenta os rostos de uma imagem ao segmento de arena atual
+    deste processo em 'pasta' e retorna o bloco (pid, segmento, linha inicial, quantidade),
+    que é tudo o que precisa voltar pelo pipe. Cada worker só escreve nos próprios
+    arquivos, então não há disputa entre processos; a escrita termina antes do bloco
+    ser enviado. Quando o segmento enche, o worker passa para o seguinte.
+    """
+    global _escrita
+    if _escrita is None or _escrita[0] != pasta:
+        # Nova execução (nova pasta): os arquivos da execução anterior já foram descartados
+        if _escrita is not None:
+            os.close(_escrita[1])
+        _escrita = _abrir_segmento(pasta, 0)
+    qtd = len(encodings)
+    if qtd and _escrita[3] and _escrita[3] + qtd > LINHAS_POR_SEGMENTO:
+        os.close(_escrita[1])
+        _escrita = _abrir_segmento(pasta, _escrita[2] + 1)
+    inicio = _escrita[3]
+    if qtd:
+        linhas = np.empty(qtd, dtype=DTYPE_ROSTO)
+        linhas["encoding"] = np.asarray(encodings, dtype=np.float32).reshape(qtd, 128)
+        linhas["caixa"] = np.asarray(caixas, dtype=np.int32).reshape(qtd, 4)
+        dados = memoryview(linhas.tobytes())
+        try:
+            while dados:
+                dados = dados[os.write(_escrita[1], dados):]
+        except OSError:
+            # Ex.: /dev/shm cheio. Descarta a parte gravada, senão todos os blocos
+            # seguintes deste worker seriam lidos deslocados
+            os.ftruncate(_escrita[1], inicio * DTYPE_ROSTO.itemsize)
+            raise
+        _escrita[3] += qtd
+    return (os.getpid(), _escrita[2], inicio, qtd)
+
+class LeitorArena:
+    """
+    Lado do processo principal: lê os blocos gravados pelos workers em uma pasta de
+    arena, através de np.memmap. ler() devolve um array estruturado (DTYPE_ROSTO) com
+    os campos "encoding" (qtd, 128) e "caixa" (qtd, 4), sem criar objetos por rosto.
+    O mapeamento de cada arquivo é refeito apenas quando um bloco passa do fim mapeado.
+    Os resultados de cada worker chegam na ordem em que foram gravados, então quando
+    aparece um bloco do segmento seguinte o anterior já foi lido e é apagado; por isso
+    as linhas devolvidas devem ser copiadas antes da próxima leitura.
+    """
+    def __init__(self, pasta):
+        self.pasta = pasta
+        # {pid: (segmento, memmap)}
+        self._mapas = {}
+
+    def ler(self, bloco):
+        pid, segmento, inicio, qtd = bloco
+        if not qtd:
+            return np.empty(0, dtype=DTYPE_ROSTO)
+        atual = self._mapas.get(pid)
+        if atual is not None and atual[0] != segmento:
+            del self._mapas[pid]
+            self._descartar_segmento(pid, atual[0])
+            atual = None
+        if atual is None or len(atual[1]) < inicio + qtd:
+            atual = (segmento, np.memmap(caminho_arena(self.pasta, pid, segmento), dtype=DTYPE_ROSTO, mode="r"))
+            self._mapas[pid] = atual
+        return atual[1][inicio:inicio + qtd]
+
+    def _descartar_segmento(self, pid, segmento):
+        try:
+            os.remove(caminho_arena(self.pasta, pid, segmento))
+        except OSError:
+            # Windows: o arquivo ainda mapeado fica para o descarte da pasta da arena
+            pass
+
+    def fechar(self):
+        self._mapas.clear()
@@ -0,0 +1,179 @@
+# app/core/clustering.py
+
+import numpy as np
+
+try:
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.neighbors import radius_neighbors_graph
+except ImportError:
+    print("Erro: Bibliotecas de processamento não encontradas. Instale com 'pip install scikit-learn'.")
+    exit()
+
+MOTORES_AGRUPAMENTO = ["Automático", "Padrão", "Blocos", "Particionado"]
+
+# Limites usados pelo modo "Automático" para escolher o motor pelo número de rostos
+LIMITE_MOTOR_BLOCOS = 50_000
+LIMITE_MOTOR_PARTICIONADO = 300_000
+
+def escolher_motor(motor, num_rostos, em_disco=False):
+    """
+    Resolve o motor "Automático" pelo número de rostos. Codificações em disco (np.memmap)
+    nunca usam o "Padrão", que copiaria a matriz inteira para a memória.
+    """
+    if motor != "Automático":
+        return motor
+    if num_rostos >= LIMITE_MOTOR_PARTICIONADO:
+        return "Particionado"
+    if num_rostos >= LIMITE_MOTOR_BLOCOS or em_disco:
+        return "Blocos"
+    return "Padrão"
+
+def _pares_no_raio(A, B, raio, mesmo_bloco):
+    """
+    Retorna (i, j, distancia) dos pares de A x B com distância <= raio.
+    A distância é estimada pelo produto matricial e recalculada exatamente apenas
+    para os candidatos, evitando erros de arredondamento do float32 na fronteira.
+    """
+    normas_a = np.einsum("ij,ij->i", A, A)
+    normas_b = np.einsum("ij,ij->i", B, B)
+    d2 = normas_a[:, None] + normas_b[None, :] - 2.0 * (A @ B.T)
+    folga = (raio + 1e-3) ** 2
+    if mesmo_bloco:
+        # Considera cada par uma única vez e ignora o próprio ponto
+        d2[np.tril_indices(len(A))] = np.inf
+    i, j = np.nonzero(d2 <= folga)
+    if len(i) == 0:
+        return i, j, np.empty(0, dtype=np.float32)
+    dist = np.linalg.norm(A[i] - B[j], axis=1).astype(np.float32)
+    ok = dist <= raio
+    return i[ok], j[ok], dist[ok]
+
+def _montar_grafo(linhas, colunas, distancias, n):
+    """Monta o grafo esparso simétrico (CSR) a partir das listas de pares (i < j)."""
+    linhas = np.concatenate(linhas) if linhas else np.empty(0, dtype=np.int64)
+    colunas = np.concatenate(colunas) if colunas else np.empty(0, dtype=np.int64)
+    distancias = np.concatenate(distancias) if distancias else np.empty(0, dtype=np.float32)
+    grafo = sparse.coo_matrix(
+        (np.concatenate([distancias, distancias]), (np.concatenate([linhas, colunas]), np.concatenate([colunas, linhas]))),
+        shape=(n, n),
+    )
+    # A conversão de COO para CSR preserva os zeros explícitos (rostos idênticos)
+    return grafo.tocsr()
+
+def grafo_por_blocos(X, raio, tamanho_bloco=4096, progresso=None):
+    """
+    Grafo de vizinhança por produto matricial em blocos. A memória usada é limitada
+    a tamanho_bloco x tamanho_bloco distâncias por vez, mais as arestas encontradas.
+    progresso(fração), se informado, é chamado a cada faixa de linhas concluída.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    n = len(X)
+    linhas, colunas, distancias = [], [], []
+    for ini_a in range(0, n, tamanho_bloco):
+        A = np.ascontiguousarray(X[ini_a:ini_a + tamanho_bloco])
+        for ini_b in range(ini_a, n, tamanho_bloco):
+            B = np.ascontiguousarray(X[ini_b:ini_b + tamanho_bloco])
+            i, j, dist = _pares_no_raio(A, B, raio, mesmo_bloco=(ini_a == ini_b))
+            linhas.append(i + ini_a); colunas.append(j + ini_b); distancias.append(dist)
+        if progresso is not None:
+            progresso(min(1.0, (ini_a + tamanho_bloco) / n))
+    return _montar_grafo(linhas, colunas, distancias, n)
+
+def grafo_particionado(X, raio, num_particoes=None, tamanho_bloco=4096, random_state=0, progresso=None):
+    """
+    Grafo de vizinhança em dois estágios. Primeiro os rostos são divididos em
+    partições com k-means; depois as distâncias exatas são calculadas em blocos
+    dentro de cada partição e apenas entre partições que podem conter vizinhos
+    (distância entre centróides <= raio_p + raio_q + eps, pela desigualdade
+    triangular). O resultado é idêntico ao de grafo_por_blocos.
+    progresso(fração), se informado, é chamado a cada partição concluída.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    n = len(X)
+    if num_particoes is None:
+        num_particoes = max(1, int(np.sqrt(n) / 4))
+    if num_particoes <= 1 or n <= tamanho_bloco:
+        return grafo_por_blocos(X, raio, tamanho_bloco, progresso)
+
+    kmeans = MiniBatchKMeans(n_clusters=num_particoes, batch_size=max(1024, 4 * num_particoes), n_init=1, random_state=random_state)
+    kmeans.fit(X[np.random.default_rng(random_state).choice(n, size=min(n, 100 * num_particoes), replace=False)])
+    particao = np.empty(n, dtype=np.int32)
+    for ini in range(0, n, tamanho_bloco):
+        particao[ini:ini + tamanho_bloco] = kmeans.predict(X[ini:ini + tamanho_bloco])
+    centros = kmeans.cluster_centers_.astype(np.float32)
+
+    membros = [np.where(particao == p)[0] for p in range(num_particoes)]
+    raios = np.array([np.linalg.norm(X[m] - centros[p], axis=1).max() if len(m) else 0.0 for p, m in enumerate(membros)], dtype=np.float32)
+
+    linhas, colunas, distancias = [], [], []
+    for p in range(num_particoes):
+        if not len(membros[p]): continue
+        dist_centros = np.linalg.norm(centros - centros[p], axis=1)
+        candidatas = np.where((dist_centros <= raios[p] + raios + raio) & (np.arange(num_particoes) >= p))[0]
+        for q in candidatas:
+            if not len(membros[q]): continue
+            for ini_a in range(0, len(membros[p]), tamanho_bloco):
+                idx_a = membros[p][ini_a:ini_a + tamanho_bloco]
+                inicio_b = ini_a if q == p else 0
+                for ini_b in range(inicio_b, len(membros[q]), tamanho_bloco):
+                    idx_b = membros[q][ini_b:ini_b + tamanho_bloco]
+                    i, j, dist = _pares_no_raio(X[idx_a], X[idx_b], raio, mesmo_bloco=(q == p and ini_a == ini_b))
+                    linhas.append(idx_a[i]); colunas.append(idx_b[j]); distancias.append(dist)
+        if progresso is not None:
+            progresso((p + 1) / num_particoes)
+    return _montar_grafo(linhas, colunas, distancias, n)
+
+def grafo_vizinhanca(X, raio, motor="Automático", progresso=None):
+    """
+    Retorna o grafo esparso (CSR) com as distâncias entre rostos a no máximo 'raio'.
+    progresso(fração) só é chamado pelos motores em blocos e particionado.
+    """
+    motor = escolher_motor(motor, len(X), isinstance(X, np.memmap))
+    if motor == "Blocos":
+        return grafo_por_blocos(X, raio, progresso=progresso)
+    if motor == "Particionado":
+        return grafo_particionado(X, raio, progresso=progresso)
+    return radius_neighbors_graph(np.asarray(X, dtype=np.float32), raio, mode="distance", n_jobs=-1).tocsr()
+
+def dbscan_de_grafo(grafo, eps, min_samples):
+    """
+    DBSCAN sobre um grafo de vizinhança pré-calculado com raio >= eps.
+    Segue a semântica do sklearn: o próprio ponto conta para min_samples, pontos de
+    borda recebem o grupo de um ponto núcleo vizinho (o mais próximo) e rostos
+    isolados recebem -1. Os grupos são numerados pela ordem do primeiro ponto núcleo.
+    """
+    n = grafo.shape[0]
+    linhas = np.repeat(np.arange(n), np.diff(grafo.indptr))
+    dentro = grafo.data <= eps
+    linhas, colunas, dist = linhas[dentro], grafo.indices[dentro], grafo.data[dentro]
+
+    nucleo = (np.bincount(linhas, minlength=n) + 1) >= min_samples
+    labels = np.full(n, -1, dtype=np.intp)
+    if not nucleo.any():
+        return labels
+
+    ligacoes = nucleo[linhas] & nucleo[colunas]
+    grafo_nucleos = sparse.coo_matrix(
+        (np.ones(ligacoes.sum(), dtype=np.int8), (linhas[ligacoes], colunas[ligacoes])), shape=(n, n)
+    ).tocsr()
+    _, componentes = connected_components(grafo_nucleos, directed=False)
+
+    # Renumera os componentes de núcleos em ordem de aparição
+    idx_nucleos = np.where(nucleo)[0]
+    comp_nucleos = componentes[idx_nucleos]
+    _, primeiros = np.unique(comp_nucleos, return_index=True)
+    ordem = np.empty(componentes.max() + 1, dtype=np.intp)
+    ordem[comp_nucleos[np.sort(primeiros)]] = np.arange(len(primeiros))
+    labels[idx_nucleos] = ordem[comp_nucleos]
+
+    # Pontos de borda: vizinho núcleo mais próximo
+    borda = ~nucleo[linhas] & nucleo[colunas]
+    if borda.any():
+        l_b, c_b, d_b = linhas[borda], colunas[borda], dist[borda]
+        ordenacao = np.lexsort((d_b, l_b))
+        l_b, c_b = l_b[ordenacao], c_b[ordenacao]
+        primeiro = np.r_[True, l_b[1:] != l_b[:-1]]
+        labels[l_b[primeiro]] = labels[c_b[primeiro]]
+    return labels
@@ -0,0 +1,82 @@
+# app/core/config.py
+
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+
+from .encoding_cache import CACHE_FILE, perfil_adaptativo
+from .descoberta import EXTENSOES_PADRAO
+
+MAPEAMENTO_EPS = {"Preciso": 0.45, "Equilibrado": 0.5, "Abrangente": 0.6}
+MAPEAMENTO_TOLERANCIA = {"Preciso": 0.5, "Equilibrado": 0.6, "Abrangente": 0.68}
+MAPEAMENTO_DOWNSCALE = {"Original": 1.0, "Rápido": 0.5, "Muito Rápido": 0.25, "Adaptativo": perfil_adaptativo()}
+
+@dataclass
+class ConfiguracaoAnalise:
+    """
+    Parâmetros de uma análise. É tudo o que o ProcessingEngine precisa saber,
+    seja a análise iniciada pela interface gráfica ou pela linha de comando.
+    """
+    pasta_origem: str
+    pasta_destino: Optional[str] = None
+    precisao: str = "Equilibrado"
+    min_fotos_por_grupo: int = 2
+    # Fator fixo (0-1) ou perfil adaptativo "auto:<pixels>" (ver perfil_adaptativo)
+    downscale_factor: Union[float, str] = 0.5
+    hibrido: bool = False
+    # Analisa só uma foto de cada sequência de fotos quase idênticas (ver app/core/rajadas.py)
+    agrupar_rajadas: bool = False
+    # Descarta fotos sem rostos com uma detecção barata numa decodificação minúscula
+    prefiltro: bool = False
+    motor_agrupamento: str = "Automático"
+    # Segundos sem resposta numa imagem até o worker ser substituído e a imagem contar como falha (None desativa)
+    tempo_limite_imagem: Optional[float] = 180
+    # Memória máxima (MB) das codificações no agrupamento; acima disso elas vão para o disco
+    memoria_rostos_mb: Optional[int] = 1024
+    # Pasta dos arquivos temporários das codificações (None = pasta temporária do sistema)
+    pasta_temporaria: Optional[str] = None
+    # Descoberta de arquivos
+    recursivo: bool = True
+    extensoes: Tuple[str, ...] = EXTENSOES_PADRAO
+    incluir: Tuple[str, ...] = ()
+    excluir: Tuple[str, ...] = ()
+    # Saída: Copiar, Hardlink, Symlink, Reflink ou Manifesto (ver app/core/saida.py)
+    modo_saida: str = "Copiar"
+    threads_copia: int = 4
+    # Busca Individual
+    foto_referencia: Optional[str] = None
+    nome_pessoa: str = ""
+    # Busca em Lote
+    pasta_referencias: Optional[str] = None
+    multiplas_pessoas: bool = False
+    # Busca no índice da biblioteca (ver app/core/indice_biblioteca.py) em vez de varrer a pasta
+    usar_indice: bool = False
+    # Pasta do índice (None = ~/.fotofinder/indices/<hash da pasta de origem>)
+    pasta_indice: Optional[str] = None
+    # Máximo de fotos por pessoa na busca pelo índice (None = todas dentro da tolerância)
+    top_k: Optional[int] = None
+    # Caminho do cache de codificações em disco (None desativa o cache)
+    cache_db: Optional[str] = CACHE_FILE
+    # Confere as entradas do cache também pelo hash do conteúdo (arquivos restaurados com o mesmo mtime)
+    cache_hash: bool = False
+    # Retoma a análise de agrupamento interrompida da mesma pasta (ver app/core/diario.py)
+    retomar: bool = True
+    # Arquivo de trace com os tempos de cada imagem: .jsonl ou Chrome trace (.json)
+    arquivo_trace: Optional[str] = None
+
+    def __post_init__(self):
+        if self.precisao not in MAPEAMENTO_EPS:
+            raise ValueError(f"Precisão inválida: {self.precisao!r}. Use uma de {list(MAPEAMENTO_EPS)}.")
+        if self.min_fotos_por_grupo < 1:
+            self.min_fotos_por_grupo = 2
+
+    @property
+    def eps(self):
+        return MAPEAMENTO_EPS[self.precisao]
+
+    @property
+    def tolerancia(self):
+        return MAPEAMENTO_TOLERANCIA[self.precisao]
+
+    @property
+    def base_destino(self):
+        return self.pasta_destino if self.pasta_destino else self.pasta_origem
@@ -0,0 +1,88 @@
+# app/core/descoberta.py
+
+import os
+from fnmatch import fnmatch
+
+EXTENSOES_PADRAO = ('.png', '.jpg', '.jpeg')
+
+def _casa_algum(caminho_relativo, nome, padroes):
+    return any(fnmatch(caminho_relativo, p) or fnmatch(nome, p) for p in padroes)
+
+def descobrir_imagens(raiz, extensoes=EXTENSOES_PADRAO, incluir=(), excluir=(), recursivo=True, excluir_pastas=()):
+    """
+    Gerador que percorre 'raiz' com os.scandir e devolve os caminhos das imagens à
+    medida que são encontrados, sem montar a lista completa antes.
+    Os padrões glob de incluir/excluir são testados contra o caminho relativo à raiz
+    (com '/') e contra o nome do arquivo; um padrão de exclusão que casa com uma
+    pasta faz com que ela inteira seja ignorada. Os padrões de 'excluir_pastas' valem
+    só para pastas e só contra o caminho relativo inteiro (ex.: "Pessoa_*" ignora
+    raiz/Pessoa_01, mas não raiz/2024/Pessoa_01). Erros de permissão são ignorados.
+    """
+    extensoes = tuple(e.lower() if e.startswith(".") else f".{e.lower()}" for e in extensoes)
+    pendentes = [raiz]
+    while pendentes:
+        pasta = pendentes.pop()
+        try:
+            entradas = os.scandir(pasta)
+        except OSError:
+            continue
+        subpastas = []
+        with entradas:
+            for entrada in entradas:
+                relativo = os.path.relpath(entrada.path, raiz).replace(os.sep, "/")
+                try:
+                    if entrada.is_dir(follow_symlinks=False):
+                        if recursivo and not _casa_algum(relativo, entrada.name, excluir) and not any(fnmatch(relativo, p) for p in excluir_pastas):
+                            subpastas.append(entrada.path)
+                        continue
+                    if not entrada.is_file():
+                        continue
+                except OSError:
+                    continue
+                if not entrada.name.lower().endswith(extensoes):
+                    continue
+                if incluir and not _casa_algum(relativo, entrada.name, incluir):
+                    continue
+                if excluir and _casa_algum(relativo, entrada.name, excluir):
+                    continue
+                yield entrada.path
+        # Percorre as subpastas em ordem alfabética (a pilha é invertida)
+        pendentes.extend(sorted(subpastas, reverse=True))
+
+def listar_referencias(pasta, extensoes=EXTENSOES_PADRAO):
+    """
+    Lista as fotos de referência de uma pasta como [(nome da pessoa, caminho)].
+    Cada imagem na raiz é uma pessoa (o nome do arquivo, sem extensão); cada subpasta
+    é uma pessoa com várias fotos (o nome da pasta), incluindo as suas subpastas.
+    """
+    referencias = []
+    try:
+        entradas = sorted(os.scandir(pasta), key=lambda e: e.name)
+    except OSError:
+        return referencias
+    extensoes_arquivo = tuple(e.lower() if e.startswith(".") else f".{e.lower()}" for e in extensoes)
+    for entrada in entradas:
+        try:
+            if entrada.is_dir():
+                referencias.extend((entrada.name, caminho) for caminho in descobrir_imagens(entrada.path, extensoes))
+            elif entrada.is_file() and entrada.name.lower().endswith(extensoes_arquivo):
+                referencias.append((os.path.splitext(entrada.name)[0], entrada.path))
+        except OSError:
+            continue
+    return referencias
+
+class ContadorDescoberta:
+    """
+    Envolve o gerador de descoberta contando quantos arquivos já foram encontrados.
+    Pode ser consumido pela thread do Pool enquanto a thread do engine lê os contadores.
+    """
+    def __init__(self, gerador):
+        self._gerador = gerador
+        self.descobertos = 0
+        self.concluido = False
+
+    def __iter__(self):
+        for caminho in self._gerador:
+            self.descobertos += 1
+            yield caminho
+        self.concluido = True
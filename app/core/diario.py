@@ -0,0 +1,164 @@
+# app/core/diario.py
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+from .encoding_cache import CACHE_DIR, chave_perfil
+
+PASTA_DIARIOS = os.path.join(CACHE_DIR, "diarios")
+# Tempo máximo (s) entre dois checkpoints: é o trabalho perdido numa queda do programa
+INTERVALO_CHECKPOINT = 5.0
+# Checkpoint antecipado quando muitos registros se acumulam antes do intervalo
+MAX_PENDENTES = 1000
+
+def caminho_diario_padrao(pasta_origem):
+    """Diário das análises de uma pasta: ~/.fotofinder/diarios/<sha1 do caminho absoluto>.sqlite3."""
+    chave = hashlib.sha1(os.path.abspath(pasta_origem).encode("utf-8", "surrogateescape")).hexdigest()
+    return os.path.join(PASTA_DIARIOS, chave + ".sqlite3")
+
+def assinatura_extracao(config):
+    """Identifica as opções que alteram os rostos extraídos de cada imagem."""
+    return json.dumps({"perfil": chave_perfil(config.downscale_factor, config.hibrido), "prefiltro": bool(config.prefiltro)}, sort_keys=True)
+
+class DiarioExecucao:
+    """
+    Diário de uma análise de agrupamento, para retomar execuções interrompidas (botão
+    Parar, queda do programa ou do computador). Guarda em SQLite as imagens já
+    processadas (tamanho, mtime e os rostos encontrados) e os arquivos já gravados em
+    cada pasta de grupo. Os registros são confirmados em checkpoints, a cada
+    INTERVALO_CHECKPOINT segundos ou MAX_PENDENTES registros, e em fechar(). Uma
+    análise que termina chama concluir_extracao(): o diário só sobra de execuções
+    interrompidas (ou de uma cópia interrompida).
+    Se a assinatura (assinatura_extracao) for outra, ou com retomar=False, o conteúdo
+    anterior é descartado. Pode ser usado por várias threads: as cópias registram as
+    saídas a partir das threads delas.
+    """
+    def __init__(self, caminho, assinatura, retomar=True):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (chave TEXT PRIMARY KEY, valor TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS imagens (caminho TEXT PRIMARY KEY, tamanho INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, encodings BLOB, caixas BLOB)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS saidas (origem TEXT NOT NULL, pasta TEXT NOT NULL, destino TEXT NOT NULL, PRIMARY KEY (origem, pasta))")
+        self._lock = threading.Lock()
+        self._imagens_pendentes = []
+        self._saidas_pendentes = []
+        self._ultimo_checkpoint = time.monotonic()
+        linha = self.conn.execute("SELECT valor FROM info WHERE chave = 'assinatura'").fetchone()
+        if not retomar or linha is None or linha[0] != assinatura:
+            self.conn.execute("DELETE FROM imagens")
+            self.conn.execute("DELETE FROM saidas")
+            self.conn.execute("INSERT OR REPLACE INTO info (chave, valor) VALUES ('assinatura', ?)", (assinatura,))
+        self.conn.commit()
+        # {caminho: (tamanho, mtime_ns)} das imagens já processadas
+        self.imagens = {c: (t, m) for c, t, m in self.conn.execute("SELECT caminho, tamanho, mtime_ns FROM imagens")}
+
+    def ja_processada(self, caminho):
+        """True se a imagem está no diário e não mudou desde então."""
+        salvo = self.imagens.get(caminho)
+        if salvo is None:
+            return False
+        try:
+            st = os.stat(caminho)
+        except OSError:
+            return False
+        return salvo == (st.st_size, st.st_mtime_ns)
+
+    def rostos(self, caminhos):
+        """Gera (caminho, encodings (n, 128) float32, caixas (n, 4) int32) das imagens de 'caminhos' no diário."""
+        self.checkpoint()
+        cursor = self.conn.execute("SELECT caminho, encodings, caixas FROM imagens")
+        while True:
+            linhas = cursor.fetchmany(1000)
+            if not linhas:
+                return
+            for caminho, encodings, caixas in linhas:
+                if caminho in caminhos:
+                    yield (caminho, np.frombuffer(encodings, dtype=np.float32).reshape(-1, 128),
+                           np.frombuffer(caixas, dtype=np.int32).reshape(-1, 4))
+
+    def registrar_imagem(self, caminho, encodings, caixas):
+        try:
+            st = os.stat(caminho)
+        except OSError:
+            return
+        self.imagens[caminho] = (st.st_size, st.st_mtime_ns)
+        registro = (caminho, st.st_size, st.st_mtime_ns,
+                    np.ascontiguousarray(encodings, dtype=np.float32).tobytes(),
+                    np.ascontiguousarray(caixas, dtype=np.int32).tobytes())
+        with self._lock:
+            self._imagens_pendentes.append(registro)
+            self._checkpoint_se_necessario()
+
+    def saidas(self):
+        """{(origem, pasta do grupo): destino} dos arquivos já gravados."""
+        with self._lock:
+            self._checkpoint()
+            return {(o, p): d for o, p, d in self.conn.execute("SELECT origem, pasta, destino FROM saidas")}
+
+    def registrar_saida(self, origem, pasta, destino):
+        with self._lock:
+            self._saidas_pendentes.append((origem, pasta, destino))
+            self._checkpoint_se_necessario()
+
+    def _checkpoint_se_necessario(self):
+        pendentes = len(self._imagens_pendentes) + len(self._saidas_pendentes)
+        if pendentes >= MAX_PENDENTES or time.monotonic() - self._ultimo_checkpoint >= INTERVALO_CHECKPOINT:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        if self._imagens_pendentes:
+            self.conn.executemany("INSERT OR REPLACE INTO imagens (caminho, tamanho, mtime_ns, encodings, caixas) VALUES (?, ?, ?, ?, ?)", self._imagens_pendentes)
+        if self._saidas_pendentes:
+            self.conn.executemany("INSERT OR REPLACE INTO saidas (origem, pasta, destino) VALUES (?, ?, ?)", self._saidas_pendentes)
+        self.conn.commit()
+        self._imagens_pendentes, self._saidas_pendentes = [], []
+        self._ultimo_checkpoint = time.monotonic()
+
+    def checkpoint(self):
+        with self._lock:
+            self._checkpoint()
+
+    def fechar(self):
+        with self._lock:
+            if self.conn is not None:
+                self._checkpoint()
+                self.conn.close()
+                self.conn = None
+
+    def concluir_extracao(self):
+        """
+        Chamado quando todas as imagens foram processadas: não há mais o que retomar na
+        análise, então as imagens saem do diário. Se restarem arquivos gravados de uma
+        cópia interrompida, o diário continua para a próxima cópia; senão é apagado.
+        """
+        with self._lock:
+            self._imagens_pendentes = []
+            self.conn.execute("DELETE FROM imagens")
+            self._checkpoint()
+            tem_saidas = self.conn.execute("SELECT 1 FROM saidas LIMIT 1").fetchone() is not None
+        self.imagens = {}
+        if tem_saidas:
+            self.fechar()
+        else:
+            self.descartar()
+
+    def descartar(self):
+        """Apaga o diário (a execução terminou e não há nada a retomar)."""
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        for sufixo in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.caminho + sufixo)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,119 @@
+# app/core/encoding_cache.py
+
+import os
+import sqlite3
+import hashlib
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".fotofinder")
+CACHE_FILE = os.path.join(CACHE_DIR, "encodings.sqlite3")
+# Incrementar quando o formato da tabela mudar; entradas antigas são descartadas
+SCHEMA_VERSION = 4
+
+# Perfil adaptativo: em vez de um fator fixo, downscale_factor é "auto:<orçamento de pixels>"
+PREFIXO_ADAPTATIVO = "auto:"
+ORCAMENTO_PIXELS_PADRAO = 2_000_000
+
+def perfil_adaptativo(orcamento_pixels=ORCAMENTO_PIXELS_PADRAO):
+    return f"{PREFIXO_ADAPTATIVO}{int(orcamento_pixels)}"
+
+def orcamento_adaptativo(downscale_factor):
+    """Orçamento de pixels do perfil adaptativo, ou None se downscale_factor for um fator fixo."""
+    if isinstance(downscale_factor, str) and downscale_factor.startswith(PREFIXO_ADAPTATIVO):
+        return int(downscale_factor[len(PREFIXO_ADAPTATIVO):])
+    return None
+
+def chave_perfil(downscale_factor, hibrido=False):
+    """Identifica as opções de processamento que alteram as codificações geradas."""
+    if orcamento_adaptativo(downscale_factor) is not None:
+        # O perfil adaptativo escolhe a resolução de cada imagem; o modo híbrido não se aplica
+        return downscale_factor
+    chave = f"{float(downscale_factor):g}"
+    return f"{chave}/hibrido" if hibrido and downscale_factor < 1.0 else chave
+
+class EncodingCache:
+    """
+    Armazena em disco (SQLite) as codificações de rosto já calculadas.
+    A chave é caminho + tamanho + mtime + perfil de processamento (fator de downscale
+    e modo do pipeline, ver chave_perfil) e, com usar_hash=True, o hash do conteúdo do
+    arquivo. Imagens sem rostos também são gravadas, para que não sejam decodificadas
+    novamente na próxima execução.
+    Cada processo deve abrir a sua própria instância (conexões SQLite não podem ser
+    compartilhadas entre processos).
+    """
+    def __init__(self, caminho_db=CACHE_FILE, usar_hash=False):
+        self.caminho_db = caminho_db
+        self.usar_hash = usar_hash
+        os.makedirs(os.path.dirname(os.path.abspath(caminho_db)), exist_ok=True)
+        self.conn = sqlite3.connect(caminho_db, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS encodings")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS encodings ("
+            " caminho TEXT NOT NULL,"
+            " perfil TEXT NOT NULL,"
+            " tamanho INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " hash TEXT,"
+            " num_rostos INTEGER NOT NULL,"
+            " dados BLOB,"
+            " caixas BLOB,"
+            " PRIMARY KEY (caminho, perfil))"
+        )
+        self.conn.commit()
+
+    def _identidade(self, caminho_imagem):
+        st = os.stat(caminho_imagem)
+        return os.path.abspath(caminho_imagem), st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def _hash_arquivo(caminho_imagem):
+        h = hashlib.sha1()
+        with open(caminho_imagem, "rb") as f:
+            for bloco in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloco)
+        return h.hexdigest()
+
+    def get(self, caminho_imagem, perfil):
+        """
+        Retorna (encodings, caixas) salvos ou None se não houver entrada válida.
+        As caixas são tuplas (top, right, bottom, left) na resolução original.
+        """
+        try:
+            caminho, tamanho, mtime_ns = self._identidade(caminho_imagem)
+            row = self.conn.execute(
+                "SELECT tamanho, mtime_ns, hash, num_rostos, dados, caixas FROM encodings WHERE caminho = ? AND perfil = ?",
+                (caminho, str(perfil)),
+            ).fetchone()
+        except (OSError, sqlite3.Error):
+            return None
+        if row is None or row[0] != tamanho or row[1] != mtime_ns:
+            return None
+        if self.usar_hash and row[2] != self._hash_arquivo(caminho_imagem):
+            return None
+        if row[3] == 0:
+            return [], []
+        matriz = np.frombuffer(row[4], dtype=np.float32).reshape(row[3], 128)
+        caixas = np.frombuffer(row[5], dtype=np.int32).reshape(row[3], 4)
+        return [enc.astype(np.float64) for enc in matriz], [tuple(int(c) for c in caixa) for caixa in caixas]
+
+    def put(self, caminho_imagem, perfil, encodings, caixas):
+        try:
+            caminho, tamanho, mtime_ns = self._identidade(caminho_imagem)
+            hash_arquivo = self._hash_arquivo(caminho_imagem) if self.usar_hash else None
+            dados = np.asarray(encodings, dtype=np.float32).tobytes() if len(encodings) else None
+            dados_caixas = np.asarray(caixas, dtype=np.int32).tobytes() if len(caixas) else None
+            self.conn.execute(
+                "INSERT OR REPLACE INTO encodings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (caminho, str(perfil), tamanho, mtime_ns, hash_arquivo, len(encodings), dados, dados_caixas),
+            )
+            self.conn.commit()
+        except (OSError, sqlite3.Error):
+            # O cache é apenas uma otimização; falhas de escrita não interrompem a análise
+            pass
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,155 @@
+# app/core/estatisticas.py
+
+import os
+import json
+import heapq
+import threading
+from collections import Counter
+
+import numpy as np
+
+# Etapas medidas pelos workers, na ordem em que acontecem em cada imagem
+ETAPAS = ["cache", "prefiltro", "decodificar", "detectar", "codificar", "comparar"]
+
+class EstatisticasExecucao:
+    """
+    Agrega os registros de tempo/status que os workers devolvem para cada imagem
+    ({"caminho", "status", "motivo", "etapas": {etapa: segundos}, "total", ...}).
+    Mantém percentis por etapa, as imagens mais lentas e as falhas por motivo, e pode
+    ser consultada durante a análise. Também recebe os tempos medidos no processo
+    principal (IPC dos lotes e gravação dos arquivos), possivelmente de outras threads.
+    """
+    def __init__(self, num_mais_lentas=10):
+        self.tempos = {}
+        self.status = Counter()
+        self.falhas = Counter()
+        self.exemplos_falha = {}
+        self.num_mais_lentas = num_mais_lentas
+        self._mais_lentas = []
+        self._lock = threading.Lock()
+
+    def registrar(self, registro):
+        with self._lock:
+            self.status[registro["status"]] += 1
+            for etapa, segundos in registro["etapas"].items():
+                self.tempos.setdefault(etapa, []).append(segundos)
+            self.tempos.setdefault("total", []).append(registro["total"])
+            if registro["status"] == "erro":
+                self.falhas[registro["motivo"]] += 1
+                self.exemplos_falha.setdefault(registro["motivo"], (registro["caminho"], registro.get("detalhe", "")))
+            item = (registro["total"], registro["caminho"])
+            if len(self._mais_lentas) < self.num_mais_lentas:
+                heapq.heappush(self._mais_lentas, item)
+            elif item > self._mais_lentas[0]:
+                heapq.heapreplace(self._mais_lentas, item)
+
+    def registrar_etapa(self, etapa, segundos):
+        """Tempo de uma etapa medida fora dos workers (ex.: 'ipc', 'gravar')."""
+        with self._lock:
+            self.tempos.setdefault(etapa, []).append(segundos)
+
+    @property
+    def total_falhas(self):
+        return sum(self.falhas.values())
+
+    def percentis(self):
+        """{etapa: {"n", "p50_ms", "p95_ms", "total_s"}}"""
+        with self._lock:
+            tempos = {etapa: np.asarray(valores) for etapa, valores in self.tempos.items()}
+        resultado = {}
+        for etapa, valores in tempos.items():
+            p50, p95 = np.percentile(valores, [50, 95]) * 1000
+            resultado[etapa] = {"n": len(valores), "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "total_s": round(float(valores.sum()), 3)}
+        return resultado
+
+    def mais_lentas(self):
+        with self._lock:
+            return [{"caminho": caminho, "segundos": round(total, 3)} for total, caminho in sorted(self._mais_lentas, reverse=True)]
+
+    def resumo(self):
+        with self._lock:
+            status, falhas = dict(self.status), dict(self.falhas)
+            exemplos = {motivo: {"caminho": c, "detalhe": d} for motivo, (c, d) in self.exemplos_falha.items()}
+        return {"status": status, "falhas": falhas, "exemplos_falha": exemplos, "etapas": self.percentis(), "mais_lentas": self.mais_lentas()}
+
+    def texto_falhas(self):
+        if not self.falhas:
+            return ""
+        motivos = ", ".join(f"{motivo}: {n}" for motivo, n in self.falhas.most_common())
+        return f" {self.total_falhas} arquivo(s) não puderam ser lidos ({motivos})."
+
+    def texto_resumo(self):
+        """Resumo legível, uma etapa por linha."""
+        linhas = [f"{'etapa':<12} {'n':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'total (s)':>10}"]
+        for etapa, p in self.percentis().items():
+            linhas.append(f"{etapa:<12} {p['n']:>8} {p['p50_ms']:>10.1f} {p['p95_ms']:>10.1f} {p['total_s']:>10.2f}")
+        lentas = self.mais_lentas()
+        if lentas:
+            linhas.append("Imagens mais lentas:")
+            linhas += [f"  {item['segundos']:8.3f}s  {item['caminho']}" for item in lentas]
+        for motivo, n in self.falhas.most_common():
+            caminho, detalhe = self.exemplos_falha[motivo]
+            linhas.append(f"Falhas {motivo}: {n} (ex.: {caminho}: {detalhe})")
+        return "\n".join(linhas)
+
+class TraceExecucao:
+    """
+    Grava os registros de cada imagem para análise posterior. O formato vem da extensão:
+    - .jsonl: um registro JSON por linha;
+    - outra (ex.: .json): formato Chrome trace (chrome://tracing, Perfetto), com uma
+      fatia por etapa em uma linha do tempo por processo worker.
+    O arquivo é gravado em streaming; no formato Chrome o ']' final é opcional.
+    """
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.chrome = not caminho.lower().endswith(".jsonl")
+        pasta = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(pasta, exist_ok=True)
+        self._arquivo = open(caminho, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        if self.chrome:
+            self._arquivo.write("[\n")
+
+    def _eventos_chrome(self, registro):
+        inicio = registro["inicio"] * 1e6
+        args = {"caminho": registro["caminho"], "status": registro["status"]}
+        if registro.get("motivo"):
+            args["motivo"] = registro["motivo"]
+        eventos = [{"name": os.path.basename(registro["caminho"]), "cat": "imagem", "ph": "X", "ts": inicio,
+                    "dur": registro["total"] * 1e6, "pid": registro["pid"], "tid": registro["pid"], "args": args}]
+        for etapa, segundos in registro["etapas"].items():
+            eventos.append({"name": etapa, "cat": "etapa", "ph": "X", "ts": inicio, "dur": segundos * 1e6,
+                            "pid": registro["pid"], "tid": registro["pid"]})
+            inicio += segundos * 1e6
+        return eventos
+
+    def gravar(self, registro):
+        with self._lock:
+            if self.chrome:
+                for evento in self._eventos_chrome(registro):
+                    self._arquivo.write(json.dumps(evento, ensure_ascii=False) + ",\n")
+            else:
+                self._arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    def gravar_evento(self, nome, inicio, duracao, **args):
+        """Fatia medida no processo principal (ex.: gravação de um arquivo)."""
+        with self._lock:
+            if self.chrome:
+                evento = {"name": nome, "cat": "principal", "ph": "X", "ts": inicio * 1e6, "dur": duracao * 1e6,
+                          "pid": os.getpid(), "tid": threading.get_ident() % 100000, "args": args}
+            else:
+                evento = {"evento": nome, "inicio": inicio, "total": duracao, **args}
+            self._arquivo.write(json.dumps(evento, ensure_ascii=False) + (",\n" if self.chrome else "\n"))
+
+    def descarregar(self):
+        with self._lock:
+            self._arquivo.flush()
+
+    def fechar(self):
+        with self._lock:
+            if self._arquivo.closed:
+                return
+            if self.chrome:
+                # Evento de metadados no fim, para que o JSON termine sem vírgula sobrando
+                self._arquivo.write(json.dumps({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "FotoFinder"}}) + "\n]\n")
+            self._arquivo.close()
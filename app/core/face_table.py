@@ -0,0 +1,152 @@
+# app/core/face_table.py
+
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+# Memória ocupada por rosto: codificação float32, caixa int32 e índice do caminho int32
+BYTES_POR_ROSTO = 128 * 4 + 4 * 4 + 4
+# Máximo de rostos mantidos na memória depois que a tabela passa para o disco
+MAX_ROSTOS_BUFFER = 65536
+
+# Arquivos da tabela em disco: (atributo, nome do arquivo, dtype, colunas)
+_ARQUIVOS = (
+    ("_encodings", "encodings.f32", np.float32, 128),
+    ("_caixas", "caixas.i32", np.int32, 4),
+    ("_indice_caminho", "indice_caminho.i32", np.int32, None),
+)
+
+class FaceTable:
+    """
+    Tabela compacta de rostos encontrados em uma execução.
+    Guarda as codificações em uma matriz float32 contígua (N, 128), o índice do
+    arquivo de origem de cada rosto (int32), a lista de caminhos sem repetições e
+    as coordenadas (top, right, bottom, left) de cada rosto na imagem original.
+    Com limite_memoria (em bytes), quando as matrizes passariam do limite os rostos vão
+    para arquivos em uma pasta temporária (em pasta_temporaria, ou a do sistema) e só um
+    buffer limitado fica na memória. Nesse caso encodings, caixas e indice_caminho são
+    np.memmap dos arquivos, lidos sob demanda pelo agrupamento. A pasta é apagada
+    quando a tabela deixa de ser usada.
+    """
+    def __init__(self, capacidade_inicial=1024, limite_memoria=None, pasta_temporaria=None):
+        capacidade_inicial = max(1, capacidade_inicial)
+        if limite_memoria is not None:
+            capacidade_inicial = max(1, min(capacidade_inicial, limite_memoria // BYTES_POR_ROSTO))
+        self._encodings = np.empty((capacidade_inicial, 128), dtype=np.float32)
+        self._caixas = np.empty((capacidade_inicial, 4), dtype=np.int32)
+        self._indice_caminho = np.empty(capacidade_inicial, dtype=np.int32)
+        self.caminhos = []
+        self._indice_por_caminho = {}
+        self.n = 0
+        self.limite_memoria = limite_memoria
+        self.pasta_temporaria = pasta_temporaria
+        # Pasta dos arquivos, quando a tabela passa para o disco, e quantos rostos já estão neles
+        self.pasta_disco = None
+        self._gravados = 0
+        self._mapas = None
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def em_disco(self):
+        return self.pasta_disco is not None
+
+    def _garantir_capacidade(self, quantidade):
+        """Garante espaço no buffer para mais 'quantidade' rostos."""
+        capacidade = len(self._indice_caminho)
+        no_buffer = self.n - self._gravados
+        if no_buffer + quantidade <= capacidade:
+            return
+        if self.em_disco:
+            self._descarregar()
+            no_buffer = 0
+            if quantidade <= capacidade:
+                return
+        nova = capacidade
+        while nova < no_buffer + quantidade:
+            nova *= 2
+        if not self.em_disco and self.limite_memoria is not None and nova * BYTES_POR_ROSTO > self.limite_memoria:
+            self._passar_para_disco()
+            self._garantir_capacidade(quantidade)
+            return
+        self._encodings = np.resize(self._encodings, (nova, 128))
+        self._caixas = np.resize(self._caixas, (nova, 4))
+        self._indice_caminho = np.resize(self._indice_caminho, nova)
+
+    def _passar_para_disco(self):
+        self.pasta_disco = tempfile.mkdtemp(prefix="fotofinder_rostos_", dir=self.pasta_temporaria)
+        weakref.finalize(self, shutil.rmtree, self.pasta_disco, True)
+        for _, nome, _, _ in _ARQUIVOS:
+            open(os.path.join(self.pasta_disco, nome), "wb").close()
+        self._descarregar()
+        # Daqui em diante só o buffer fica na memória, dentro do limite
+        tamanho_buffer = max(1, min(MAX_ROSTOS_BUFFER, self.limite_memoria // BYTES_POR_ROSTO))
+        self._encodings = np.empty((tamanho_buffer, 128), dtype=np.float32)
+        self._caixas = np.empty((tamanho_buffer, 4), dtype=np.int32)
+        self._indice_caminho = np.empty(tamanho_buffer, dtype=np.int32)
+
+    def _descarregar(self):
+        """Acrescenta aos arquivos os rostos que estão no buffer."""
+        no_buffer = self.n - self._gravados
+        if not no_buffer:
+            return
+        for atributo, nome, _, _ in _ARQUIVOS:
+            with open(os.path.join(self.pasta_disco, nome), "ab") as f:
+                f.write(np.ascontiguousarray(getattr(self, atributo)[:no_buffer]).tobytes())
+        self._gravados = self.n
+        self._mapas = None
+
+    def _matriz(self, atributo):
+        if not self.em_disco:
+            return getattr(self, atributo)[:self.n]
+        self._descarregar()
+        if self._mapas is None:
+            self._mapas = {}
+            for nome_atributo, nome, dtype, colunas in _ARQUIVOS:
+                forma = (self.n, colunas) if colunas else (self.n,)
+                self._mapas[nome_atributo] = np.memmap(os.path.join(self.pasta_disco, nome), dtype=dtype, mode="r", shape=forma)
+        return self._mapas[atributo]
+
+    def indice_do_caminho(self, caminho):
+        """Retorna o índice do caminho na lista interna, registrando-o se for novo."""
+        idx = self._indice_por_caminho.get(caminho)
+        if idx is None:
+            idx = len(self.caminhos)
+            self.caminhos.append(caminho)
+            self._indice_por_caminho[caminho] = idx
+        return idx
+
+    def adicionar(self, caminho, encodings, caixas):
+        """Adiciona todos os rostos de uma imagem à tabela."""
+        qtd = len(encodings)
+        if qtd == 0:
+            return
+        idx_caminho = self.indice_do_caminho(caminho)
+        self._garantir_capacidade(qtd)
+        pos = self.n - self._gravados
+        self._encodings[pos:pos + qtd] = np.asarray(encodings, dtype=np.float32)
+        self._caixas[pos:pos + qtd] = np.asarray(caixas, dtype=np.int32).reshape(qtd, 4)
+        self._indice_caminho[pos:pos + qtd] = idx_caminho
+        self.n += qtd
+
+    @property
+    def encodings(self):
+        return self._matriz("_encodings")
+
+    @property
+    def caixas(self):
+        return self._matriz("_caixas")
+
+    @property
+    def indice_caminho(self):
+        return self._matriz("_indice_caminho")
+
+    def caminhos_dos_rostos(self, idxs_rostos):
+        """Retorna os caminhos (sem repetição, em ordem de aparição) dos rostos indicados."""
+        idxs_caminho = self.indice_caminho[np.asarray(idxs_rostos, dtype=np.intp)]
+        _, primeiros = np.unique(idxs_caminho, return_index=True)
+        return [self.caminhos[idxs_caminho[i]] for i in np.sort(primeiros)]
@@ -0,0 +1,283 @@
+# app/core/indice_biblioteca.py
+
+import os
+import hashlib
+import sqlite3
+
+import numpy as np
+
+from .encoding_cache import CACHE_DIR
+
+PASTA_INDICES = os.path.join(CACHE_DIR, "indices")
+ARQUIVO_ROSTOS = "rostos.f32"
+# Arquivo de cada linha de rostos.f32 (int32, -1 para linhas sem arquivo), lido por np.memmap nas buscas
+ARQUIVO_LINHAS = "linhas.i32"
+ARQUIVO_METADADOS = "indice.sqlite3"
+DIMENSAO = 128
+# Compacta o arquivo de codificações quando mais da metade das linhas é lixo
+FRACAO_LIXO_COMPACTAR = 0.5
+
+def pasta_indice_padrao(pasta_biblioteca):
+    """Pasta do índice de uma biblioteca: ~/.fotofinder/indices/<sha1 do caminho absoluto>."""
+    chave = hashlib.sha1(os.path.abspath(pasta_biblioteca).encode("utf-8", "surrogateescape")).hexdigest()
+    return os.path.join(PASTA_INDICES, chave)
+
+class IndiceBiblioteca:
+    """
+    Índice persistente dos rostos de uma biblioteca de fotos, para buscas sem decodificar
+    imagens. As codificações ficam em um arquivo float32 (N, 128) que só cresce (lido com
+    np.memmap) e os metadados (arquivo -> tamanho/mtime, linha -> arquivo e caixa) em SQLite.
+    O arquivo de cada linha também fica num int32 ao lado das codificações (linhas.i32),
+    para que a busca não monte esse mapa linha a linha a partir do SQLite; ele é gravado
+    em salvar() e refeito a partir do SQLite se uma gravação tiver sido interrompida.
+    Quando uma foto muda ou é removida, as linhas antigas viram lixo (sem arquivo) e são
+    descartadas na próxima compactação.
+    Deve ser usado por uma única thread; a tabela de arquivos fica também em memória
+    (self.arquivos) para ser consultada pela thread que alimenta o Pool.
+    """
+    def __init__(self, pasta):
+        self.pasta = pasta
+        os.makedirs(pasta, exist_ok=True)
+        self.caminho_rostos = os.path.join(pasta, ARQUIVO_ROSTOS)
+        self.caminho_linhas = os.path.join(pasta, ARQUIVO_LINHAS)
+        self.conn = sqlite3.connect(os.path.join(pasta, ARQUIVO_METADADOS))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS arquivos (id INTEGER PRIMARY KEY, caminho TEXT UNIQUE NOT NULL, tamanho INTEGER NOT NULL, mtime_ns INTEGER NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rostos (linha INTEGER PRIMARY KEY, arquivo_id INTEGER NOT NULL, topo INTEGER, direita INTEGER, base INTEGER, esquerda INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS rostos_arquivo ON rostos (arquivo_id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (chave TEXT PRIMARY KEY, valor TEXT)")
+        self.conn.commit()
+        # {caminho: (id, tamanho, mtime_ns)}
+        self.arquivos = {c: (i, t, m) for i, c, t, m in self.conn.execute("SELECT id, caminho, tamanho, mtime_ns FROM arquivos")}
+        self.num_linhas = self.conn.execute("SELECT COALESCE(MAX(linha) + 1, 0) FROM rostos").fetchone()[0]
+        self._descartar_linhas_orfas()
+        self._matriz = None
+        self._linha_arquivo = None
+        # Alterações do mapa linha -> arquivo ainda não gravadas em linhas.i32
+        self._linhas_novas = []
+        self._linhas_removidas = []
+        self._verificar_mapa_linhas()
+
+    @staticmethod
+    def existe(pasta):
+        return os.path.isfile(os.path.join(pasta, ARQUIVO_METADADOS))
+
+    def _descartar_linhas_orfas(self):
+        # Uma gravação interrompida pode ter deixado codificações sem metadados no fim do arquivo
+        tamanho_esperado = self.num_linhas * DIMENSAO * 4
+        if os.path.exists(self.caminho_rostos) and os.path.getsize(self.caminho_rostos) != tamanho_esperado:
+            with open(self.caminho_rostos, "r+b") as f:
+                f.truncate(tamanho_esperado)
+
+    # --- Mapa linha -> arquivo ---
+    def _verificar_mapa_linhas(self):
+        # O info "mapa_linhas" só tem o número de linhas depois que linhas.i32 foi gravado
+        # junto com o SQLite; senão (gravação interrompida, índice antigo) o mapa é refeito
+        tamanho = os.path.getsize(self.caminho_linhas) if os.path.exists(self.caminho_linhas) else -1
+        if self.obter_info("mapa_linhas") == str(self.num_linhas) and tamanho == self.num_linhas * 4:
+            return
+        mapa = np.full(self.num_linhas, -1, dtype=np.int32)
+        for linha, arquivo_id in self.conn.execute("SELECT linha, arquivo_id FROM rostos"):
+            mapa[linha] = arquivo_id
+        self._substituir_mapa_linhas(mapa)
+        self.definir_info("mapa_linhas", self.num_linhas)
+        self.conn.commit()
+
+    def _substituir_mapa_linhas(self, mapa):
+        temporario = self.caminho_linhas + ".tmp"
+        mapa.astype(np.int32).tofile(temporario)
+        self._invalidar()
+        os.replace(temporario, self.caminho_linhas)
+
+    def _gravar_mapa_linhas(self):
+        """Acrescenta as linhas novas e marca com -1 as removidas em linhas.i32."""
+        if self._linhas_novas:
+            with open(self.caminho_linhas, "ab") as f:
+                for ids in self._linhas_novas:
+                    f.write(ids.tobytes())
+        if self._linhas_removidas:
+            self._invalidar()
+            mapa = np.memmap(self.caminho_linhas, dtype=np.int32, mode="r+")
+            mapa[np.asarray(self._linhas_removidas, dtype=np.int64)] = -1
+            mapa.flush()
+            del mapa
+        self._linhas_novas, self._linhas_removidas = [], []
+        self._invalidar()
+
+    # --- Informações ---
+    def obter_info(self, chave, padrao=None):
+        linha = self.conn.execute("SELECT valor FROM info WHERE chave = ?", (chave,)).fetchone()
+        return linha[0] if linha else padrao
+
+    def definir_info(self, chave, valor):
+        self.conn.execute("INSERT OR REPLACE INTO info (chave, valor) VALUES (?, ?)", (chave, str(valor)))
+
+    @property
+    def num_rostos(self):
+        return self.conn.execute("SELECT COUNT(*) FROM rostos").fetchone()[0]
+
+    # --- Atualização ---
+    def precisa_atualizar(self, caminho):
+        """True se a foto não está no índice ou mudou desde a indexação."""
+        salvo = self.arquivos.get(caminho)
+        if salvo is None:
+            return True
+        try:
+            st = os.stat(caminho)
+        except OSError:
+            return True
+        return (salvo[1], salvo[2]) != (st.st_size, st.st_mtime_ns)
+
+    def limpar(self):
+        """Remove tudo (ex.: ao reindexar com outro perfil de codificação)."""
+        self.conn.execute("DELETE FROM rostos")
+        self.conn.execute("DELETE FROM arquivos")
+        self.definir_info("mapa_linhas", 0)
+        self.conn.commit()
+        open(self.caminho_rostos, "wb").close()
+        open(self.caminho_linhas, "wb").close()
+        self._linhas_novas, self._linhas_removidas = [], []
+        self.arquivos, self.num_linhas = {}, 0
+        self._invalidar()
+
+    def adicionar(self, caminho, encodings, caixas):
+        """Grava (ou substitui) os rostos de uma foto. Chame salvar() para confirmar."""
+        st = os.stat(caminho)
+        self._remover_rostos(caminho)
+        salvo = self.arquivos.get(caminho)
+        if salvo is None:
+            arquivo_id = self.conn.execute("INSERT INTO arquivos (caminho, tamanho, mtime_ns) VALUES (?, ?, ?)", (caminho, st.st_size, st.st_mtime_ns)).lastrowid
+        else:
+            arquivo_id = salvo[0]
+            self.conn.execute("UPDATE arquivos SET tamanho = ?, mtime_ns = ? WHERE id = ?", (st.st_size, st.st_mtime_ns, arquivo_id))
+        self.arquivos[caminho] = (arquivo_id, st.st_size, st.st_mtime_ns)
+        if len(encodings):
+            matriz = np.asarray(encodings, dtype=np.float32).reshape(-1, DIMENSAO)
+            with open(self.caminho_rostos, "ab") as f:
+                f.write(matriz.tobytes())
+            linhas = range(self.num_linhas, self.num_linhas + len(matriz))
+            self.conn.executemany("INSERT INTO rostos (linha, arquivo_id, topo, direita, base, esquerda) VALUES (?, ?, ?, ?, ?, ?)",
+                                  [(linha, arquivo_id, *map(int, caixa)) for linha, caixa in zip(linhas, caixas)])
+            self._linhas_novas.append(np.full(len(matriz), arquivo_id, dtype=np.int32))
+            self.num_linhas += len(matriz)
+        self._invalidar()
+
+    def _remover_rostos(self, caminho):
+        salvo = self.arquivos.get(caminho)
+        if salvo is not None:
+            self._linhas_removidas.extend(l for (l,) in self.conn.execute("SELECT linha FROM rostos WHERE arquivo_id = ?", (salvo[0],)))
+            self.conn.execute("DELETE FROM rostos WHERE arquivo_id = ?", (salvo[0],))
+
+    def remover_ausentes(self, vistos):
+        """Remove do índice as fotos que não foram encontradas na última varredura."""
+        ausentes = [c for c in self.arquivos if c not in vistos]
+        for caminho in ausentes:
+            self._remover_rostos(caminho)
+            self.conn.execute("DELETE FROM arquivos WHERE caminho = ?", (caminho,))
+            del self.arquivos[caminho]
+        self._invalidar()
+        return len(ausentes)
+
+    def salvar(self):
+        if not self._linhas_novas and not self._linhas_removidas:
+            self.conn.commit()
+            return
+        # Enquanto linhas.i32 não acompanhar o SQLite, o info fica sem o número de linhas
+        self.definir_info("mapa_linhas", "")
+        self.conn.commit()
+        self._gravar_mapa_linhas()
+        self.definir_info("mapa_linhas", self.num_linhas)
+        self.conn.commit()
+
+    def compactar_se_necessario(self):
+        """Reescreve o arquivo de codificações sem as linhas de fotos alteradas ou removidas."""
+        ativas = self.num_rostos
+        if self.num_linhas == 0 or (self.num_linhas - ativas) / self.num_linhas < FRACAO_LIXO_COMPACTAR:
+            return False
+        self.salvar()
+        linhas = np.fromiter((l for (l,) in self.conn.execute("SELECT linha FROM rostos ORDER BY linha")), dtype=np.int64, count=ativas)
+        antiga = np.memmap(self.caminho_rostos, dtype=np.float32, mode="r", shape=(self.num_linhas, DIMENSAO)) if self.num_linhas else None
+        temporario = self.caminho_rostos + ".tmp"
+        with open(temporario, "wb") as f:
+            for inicio in range(0, ativas, 65536):
+                f.write(np.ascontiguousarray(antiga[linhas[inicio:inicio + 65536]]).tobytes())
+        del antiga
+        self.definir_info("mapa_linhas", "")
+        self.conn.commit()
+        self._invalidar()
+        os.replace(temporario, self.caminho_rostos)
+        self._substituir_mapa_linhas(np.fromfile(self.caminho_linhas, dtype=np.int32)[linhas])
+        # Renumera as linhas na mesma ordem (a nova linha é a posição na lista)
+        self.conn.execute("UPDATE rostos SET linha = -1 - linha")
+        self.conn.executemany("UPDATE rostos SET linha = ? WHERE linha = ?", [(nova, -1 - int(antiga_linha)) for nova, antiga_linha in enumerate(linhas)])
+        self.num_linhas = ativas
+        self.definir_info("mapa_linhas", self.num_linhas)
+        self.conn.commit()
+        return True
+
+    # --- Consulta ---
+    def _invalidar(self):
+        self._matriz = None
+        self._linha_arquivo = None
+
+    def _carregar(self):
+        if self._matriz is None:
+            self._matriz = np.memmap(self.caminho_rostos, dtype=np.float32, mode="r", shape=(self.num_linhas, DIMENSAO)) if self.num_linhas else np.zeros((0, DIMENSAO), np.float32)
+            self._linha_arquivo = np.memmap(self.caminho_linhas, dtype=np.int32, mode="r", shape=(self.num_linhas,)) if self.num_linhas else np.zeros(0, np.int32)
+        return self._matriz, self._linha_arquivo
+
+    def consultar(self, referencias, tolerancia, top_k=None, exclusivo=True, tamanho_bloco=65536):
+        """
+        Busca as pessoas de 'referencias' = (nomes, matriz float32 (R, 128)) no índice;
+        nomes repetidos formam a galeria de uma pessoa.
+        Como na busca por varredura, cada rosto é atribuído à referência mais próxima
+        dentro da tolerância. Com exclusivo=True cada foto fica só com a pessoa de menor
+        distância; senão, vai para todas as pessoas reconhecidas nela.
+        Retorna {nome: [(caminho, distância)]}, em ordem crescente de distância e com no
+        máximo top_k fotos por pessoa.
+        """
+        nomes_linhas, refs = referencias
+        # Pessoas com várias fotos de referência ocupam várias linhas: cada linha aponta para a pessoa
+        nomes = list(dict.fromkeys(nomes_linhas))
+        posicao = {nome: i for i, nome in enumerate(nomes)}
+        pessoa_da_linha = np.array([posicao[n] for n in nomes_linhas], dtype=np.int64)
+        matriz, linha_arquivo = self._carregar()
+        refs = np.asarray(refs, dtype=np.float32)
+        normas_refs = (refs * refs).sum(axis=1)
+        achados_linha, achados_pessoa, achados_dist = [], [], []
+        for inicio in range(0, len(matriz), tamanho_bloco):
+            bloco = np.asarray(matriz[inicio:inicio + tamanho_bloco])
+            d2 = (bloco * bloco).sum(axis=1)[:, None] + normas_refs[None, :] - 2.0 * (bloco @ refs.T)
+            ref = d2.argmin(axis=1)
+            dist = np.sqrt(np.maximum(d2[np.arange(len(bloco)), ref], 0.0))
+            pessoa = pessoa_da_linha[ref]
+            validos = np.flatnonzero((dist <= tolerancia) & (linha_arquivo[inicio:inicio + len(bloco)] >= 0))
+            achados_linha.append(validos + inicio)
+            achados_pessoa.append(pessoa[validos])
+            achados_dist.append(dist[validos])
+        if not achados_linha or not sum(len(a) for a in achados_linha):
+            return {nome: [] for nome in nomes}
+        arquivo = linha_arquivo[np.concatenate(achados_linha)].astype(np.int64)
+        pessoa = np.concatenate(achados_pessoa)
+        dist = np.concatenate(achados_dist)
+
+        # Menor distância por (arquivo, pessoa) - ou só por arquivo, no modo exclusivo
+        ordem = np.lexsort((dist, pessoa, arquivo)) if not exclusivo else np.lexsort((dist, arquivo))
+        arquivo, pessoa, dist = arquivo[ordem], pessoa[ordem], dist[ordem]
+        chave = arquivo if exclusivo else arquivo * len(nomes) + pessoa
+        primeiro = np.ones(len(chave), dtype=bool)
+        primeiro[1:] = chave[1:] != chave[:-1]
+        arquivo, pessoa, dist = arquivo[primeiro], pessoa[primeiro], dist[primeiro]
+
+        caminhos = {i: c for c, (i, _, _) in self.arquivos.items()}
+        resultado = {}
+        for p, nome in enumerate(nomes):
+            selecao = np.flatnonzero(pessoa == p)
+            selecao = selecao[np.argsort(dist[selecao], kind="stable")][:top_k]
+            resultado[nome] = [(caminhos[int(arquivo[i])], float(dist[i])) for i in selecao]
+        return resultado
+
+    def fechar(self):
+        self._invalidar()
+        self.conn.close()
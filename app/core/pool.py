@@ -0,0 +1,387 @@
+# app/core/pool.py
+
+import os
+import json
+import time
+import queue
+import shutil
+import tempfile
+import itertools
+import threading
+import importlib.util
+import multiprocessing
+from collections import deque, namedtuple
+from multiprocessing import cpu_count
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from ..workers.face_workers import inicializar_worker, registro_de_falha
+from .arena import espaco_arena
+
+# Motivos registrados para as imagens que travam ou derrubam um worker
+MOTIVO_TEMPO_ESGOTADO = "TempoEsgotado"
+MOTIVO_WORKER_ENCERRADO = "WorkerEncerrado"
+# Quantas tarefas são lidas de cada vez para serem ordenadas por tamanho
+JANELA_ORDENACAO = 256
+# Intervalo máximo entre as verificações de interrupção e de tempo limite
+INTERVALO_SUPERVISAO = 0.2
+# Tarefas lidas à frente pela thread de alimentação (descoberta e ordenação por tamanho)
+MAX_TAREFAS_FILA = 2 * JANELA_ORDENACAO
+
+# Mensagens enviadas pelos workers, além do resultado de cada item
+_FimLote = namedtuple("_FimLote", "duracao espera fim")
+_FalhaItem = namedtuple("_FalhaItem", "motivo detalhe")
+# Exceção do iterador de tarefas, repassada da thread de alimentação ao supervisor
+_ErroAlimentacao = namedtuple("_ErroAlimentacao", "erro")
+
+def caminho_da_tarefa(tarefa):
+    """Caminho da imagem de uma tarefa: a própria tarefa ou o primeiro item da tupla de argumentos."""
+    return tarefa if isinstance(tarefa, str) else tarefa[0]
+
+def _tamanho_tarefa(tarefa):
+    try:
+        return os.stat(caminho_da_tarefa(tarefa)).st_size
+    except (OSError, TypeError, IndexError):
+        return 0
+
+def ordenar_por_tamanho(tarefas, janela=JANELA_ORDENACAO):
+    """
+    Lê as tarefas em janelas de 'janela' itens e devolve cada janela da maior para a
+    menor imagem (tamanho do arquivo, pelo stat). As imagens pesadas começam primeiro e
+    as pequenas preenchem o fim, sem esperar a descoberta terminar para ordenar.
+    Em PoolPersistente.executar é consumido pela thread de alimentação, então os stat
+    de cada janela não atrasam a supervisão dos workers.
+    """
+    iterador = iter(tarefas)
+    while True:
+        bloco = list(itertools.islice(iterador, janela))
+        if not bloco:
+            return
+        yield from sorted(bloco, key=_tamanho_tarefa, reverse=True)
+
+def _laco_worker(conexao):
+    """
+    Laço de cada processo worker: recebe (instante do envio, função, lote), devolve um
+    resultado por item assim que fica pronto (o supervisor acompanha o progresso) e
+    termina o lote com _FimLote(duração, espera até começar, instante do fim).
+    """
+    inicializar_worker()
+    while True:
+        try:
+            mensagem = conexao.recv()
+        except (EOFError, OSError):
+            return
+        if mensagem is None:
+            return
+        enviado, worker, lote = mensagem
+        espera = time.time() - enviado
+        inicio = time.perf_counter()
+        for item in lote:
+            try:
+                resultado = worker(item)
+            except Exception as e:
+                resultado = _FalhaItem(type(e).__name__, str(e)[:200])
+            conexao.send(resultado)
+        conexao.send(_FimLote(time.perf_counter() - inicio, espera, time.time()))
+
+class _Alimentador:
+    """
+    Thread que consome o iterador de tarefas (descoberta dos arquivos e ordenação por
+    tamanho, com um stat por arquivo) e coloca as tarefas numa fila limitada. Em pastas
+    de rede ou discos lentos, o laço de supervisão continua atendendo a interrupção, os
+    tempos limite e os resultados enquanto as tarefas chegam.
+    """
+    _FIM = object()
+
+    def __init__(self, tarefas, tamanho_fila=MAX_TAREFAS_FILA):
+        self.fila = queue.Queue(tamanho_fila)
+        self.esgotado = False
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._alimentar, args=(tarefas,), daemon=True)
+        self._thread.start()
+
+    def _colocar(self, item):
+        while not self._parar.is_set():
+            try:
+                self.fila.put(item, timeout=INTERVALO_SUPERVISAO)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _alimentar(self, tarefas):
+        try:
+            for tarefa in tarefas:
+                if not self._colocar(tarefa):
+                    return
+        except Exception as e:
+            self._colocar(_ErroAlimentacao(e))
+            return
+        self._colocar(self._FIM)
+
+    def obter(self, quantidade, espera=0.0):
+        """
+        Retorna até 'quantidade' tarefas já disponíveis, esperando no máximo 'espera'
+        segundos pela primeira. Repassa a exceção do iterador de tarefas, se houver.
+        """
+        itens = []
+        while len(itens) < quantidade and not self.esgotado:
+            try:
+                item = self.fila.get(timeout=espera) if espera and not itens else self.fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._FIM:
+                self.esgotado = True
+            elif isinstance(item, _ErroAlimentacao):
+                self.esgotado = True
+                raise item.erro
+            else:
+                itens.append(item)
+        return itens
+
+    def fechar(self):
+        # A thread termina na próxima tarefa que tentar colocar na fila
+        self._parar.set()
+
+class _Worker:
+    """Processo worker e o lote que ele está executando (None se estiver livre)."""
+    def __init__(self, contexto):
+        self.conexao, conexao_filho = contexto.Pipe()
+        self.processo = contexto.Process(target=_laco_worker, args=(conexao_filho,), daemon=True)
+        self.processo.start()
+        conexao_filho.close()
+        self.lote = None
+        self.recebidos = []
+        self.inicio_lote = 0.0
+        self.ultimo_progresso = 0.0
+
+    def enviar(self, worker, lote):
+        self.conexao.send((time.time(), worker, lote))
+        self.lote, self.recebidos = lote, []
+        self.inicio_lote = self.ultimo_progresso = time.monotonic()
+
+    def encerrar(self, forcar=False):
+        if forcar:
+            self.processo.kill()
+        else:
+            try:
+                self.conexao.send(None)
+            except OSError:
+                pass
+            self.processo.join(5)
+            if self.processo.is_alive():
+                self.processo.kill()
+        self.processo.join()
+        self.conexao.close()
+
+class PoolPersistente:
+    """
+    Processos worker mantidos pelo ProcessingEngine entre execuções. Os workers
+    importam o face_recognition/dlib e carregam os modelos uma única vez (no
+    inicializador) e são reaproveitados por todas as análises seguintes.
+    Diferente do multiprocessing.Pool, cada worker é supervisionado: os lotes são
+    entregues a quem estiver livre, o progresso é acompanhado item a item e um worker
+    que passa do tempo limite em uma imagem (ou morre) é encerrado e substituído; a
+    imagem é registrada como falha e o resto do lote volta para a fila.
+    Também publica as codificações de referência em um arquivo mapeado em memória,
+    que cada worker carrega uma única vez, em vez de recebê-las em cada tarefa, e cria
+    as pastas de arena em que os workers gravam os rostos encontrados (ver app/core/arena.py).
+    """
+    def __init__(self, num_processos=None):
+        self.num_processos = num_processos or max(1, cpu_count() - 1)
+        self._contexto = multiprocessing.get_context()
+        self._workers = []
+        self._pasta_temp = None
+        self._contador_referencias = itertools.count()
+        self._pasta_arena = None
+        self.workers_substituidos = 0
+
+    def obter(self):
+        """Inicia os workers, se ainda não estiverem rodando, e retorna a lista deles."""
+        if not self._workers:
+            # Verificado aqui, e não na importação, para não carregar o dlib no processo principal
+            if importlib.util.find_spec("face_recognition") is None:
+                raise ImportError("Bibliotecas de reconhecimento facial não encontradas. Instale com 'pip install face_recognition'.")
+            self._workers = [_Worker(self._contexto) for _ in range(self.num_processos)]
+        return self._workers
+
+    def reiniciar(self):
+        """Encerra os workers imediatamente (usado ao interromper uma análise)."""
+        for worker in self._workers:
+            worker.encerrar(forcar=True)
+        self._workers = []
+
+    def fechar(self):
+        for worker in self._workers:
+            worker.encerrar()
+        self._workers = []
+        if self._pasta_temp is not None:
+            shutil.rmtree(self._pasta_temp, ignore_errors=True)
+            self._pasta_temp = None
+        self.descartar_arena()
+
+    def _substituir(self, posicao, motivo, devolvidas):
+        """
+        Encerra o worker da 'posicao' e inicia outro no lugar. O item em execução vira
+        uma falha com 'motivo' e os itens seguintes do lote voltam para o início da fila.
+        Retorna o lote parcial no formato de executar().
+        """
+        worker = self._workers[posicao]
+        lote, recebidos = worker.lote, worker.recebidos
+        worker.encerrar(forcar=True)
+        self._workers[posicao] = _Worker(self._contexto)
+        self.workers_substituidos += 1
+        if lote is None:
+            return None
+        indice = len(recebidos)
+        devolvidas.extendleft(reversed(lote[indice + 1:]))
+        agora = time.monotonic()
+        detalhe = f"sem resposta por {agora - worker.ultimo_progresso:.0f}s" if motivo == MOTIVO_TEMPO_ESGOTADO else "o processo worker foi encerrado"
+        falha = (None, registro_de_falha(caminho_da_tarefa(lote[indice]), motivo, detalhe, agora - worker.ultimo_progresso, worker.processo.pid))
+        return recebidos + [falha], agora - worker.inicio_lote, 0.0, time.time()
+
+    def _converter_falha(self, worker, resultado):
+        # Exceção não tratada pela função do worker: vira a falha da imagem correspondente
+        tarefa = worker.lote[len(worker.recebidos)]
+        return (None, registro_de_falha(caminho_da_tarefa(tarefa), resultado.motivo, resultado.detalhe, time.monotonic() - worker.ultimo_progresso, worker.processo.pid))
+
+    def executar(self, worker, tarefas, despacho, parar, tempo_limite=None):
+        """
+        Executa worker(tarefa) para cada tarefa, distribuindo lotes com o tamanho sugerido
+        por 'despacho' (DespachoAdaptativo) para os workers livres, e gera
+        (resultados do lote, duração, espera, instante do fim) a cada lote concluído.
+        Cada resultado é o que a função do worker retornou, ou (None, registro de falha)
+        para as imagens que passaram de 'tempo_limite' segundos sem resposta ou derrubaram
+        o worker. Se 'parar' (threading.Event) for acionado, os workers são encerrados
+        imediatamente e a geração termina. As tarefas são lidas por uma thread de
+        alimentação (_Alimentador), para que um iterador lento não atrase a supervisão.
+        """
+        workers = self.obter()
+        alimentador = _Alimentador(tarefas)
+        devolvidas = deque()
+        concluido = False
+        try:
+            while True:
+                if parar.is_set():
+                    return
+                # Entrega um lote a cada worker livre: primeiro os itens devolvidos, depois os novos
+                for posicao in range(len(workers)):
+                    if workers[posicao].lote is not None:
+                        continue
+                    tamanho = despacho.tamanho_lote()
+                    lote = [devolvidas.popleft() for _ in range(min(tamanho, len(devolvidas)))]
+                    if len(lote) < tamanho:
+                        lote += alimentador.obter(tamanho - len(lote))
+                    if not lote:
+                        break
+                    try:
+                        workers[posicao].enviar(worker, lote)
+                    except OSError:
+                        # O worker morreu enquanto estava livre
+                        self._substituir(posicao, MOTIVO_WORKER_ENCERRADO, devolvidas)
+                        devolvidas.extendleft(reversed(lote))
+                ocupados = {w.conexao: posicao for posicao, w in enumerate(workers) if w.lote is not None}
+                if not ocupados:
+                    if alimentador.esgotado and not devolvidas:
+                        concluido = True
+                        return
+                    # Todos livres, à espera da descoberta: a próxima tarefa entra na fila
+                    # das devolvidas, que é distribuída antes das novas
+                    devolvidas.extend(alimentador.obter(1, espera=INTERVALO_SUPERVISAO))
+                    continue
+
+                for conexao in wait(list(ocupados), timeout=INTERVALO_SUPERVISAO):
+                    posicao = ocupados[conexao]
+                    atual = workers[posicao]
+                    try:
+                        mensagem = conexao.recv()
+                    except (EOFError, OSError):
+                        parcial = self._substituir(posicao, MOTIVO_WORKER_ENCERRADO, devolvidas)
+                        if parcial is not None:
+                            yield parcial
+                        continue
+                    if isinstance(mensagem, _FimLote):
+                        resultados = atual.recebidos
+                        atual.lote, atual.recebidos = None, []
+                        yield resultados, mensagem.duracao, mensagem.espera, mensagem.fim
+                        continue
+                    if isinstance(mensagem, _FalhaItem):
+                        mensagem = self._converter_falha(atual, mensagem)
+                    atual.recebidos.append(mensagem)
+                    atual.ultimo_progresso = time.monotonic()
+
+                if tempo_limite:
+                    agora = time.monotonic()
+                    for posicao, atual in enumerate(workers):
+                        if atual.lote is not None and agora - atual.ultimo_progresso > tempo_limite:
+                            yield self._substituir(posicao, MOTIVO_TEMPO_ESGOTADO, devolvidas)
+        finally:
+            alimentador.fechar()
+            # Interrompido (ou abandonado por quem consome) com lotes em andamento:
+            # os workers são encerrados para que nenhum resultado antigo sobre nos pipes
+            if not concluido and any(w.lote is not None for w in self._workers):
+                self.reiniciar()
+
+    def publicar_referencias(self, referencias):
+        """
+        Grava (nomes, matriz) em disco e retorna o caminho a ser passado aos workers.
+        Cada publicação usa um arquivo novo, para que os workers percebam a troca.
+        """
+        nomes, matriz = referencias
+        if self._pasta_temp is None:
+            self._pasta_temp = tempfile.mkdtemp(prefix="fotofinder_")
+        for antigo in os.listdir(self._pasta_temp):
+            os.remove(os.path.join(self._pasta_temp, antigo))
+        caminho = os.path.join(self._pasta_temp, f"referencias_{next(self._contador_referencias)}.npy")
+        np.save(caminho, np.ascontiguousarray(matriz, dtype=np.float32))
+        with open(caminho + ".json", "w", encoding="utf-8") as f:
+            json.dump(list(nomes), f, ensure_ascii=False)
+        return caminho
+
+    def descartar_arena(self):
+        """Apaga a pasta de arena da última execução (os rostos já foram copiados dela)."""
+        if self._pasta_arena is not None:
+            shutil.rmtree(self._pasta_arena, ignore_errors=True)
+            self._pasta_arena = None
+
+    def nova_arena(self, pasta_temporaria=None):
+        """
+        Cria a pasta de arena de uma execução, descartando a da execução anterior.
+        No Linux fica em /dev/shm (memória compartilhada), para que os arquivos mapeados
+        pelos workers e pelo processo principal não passem pelo disco, desde que caibam
+        lá os segmentos em uso (espaco_arena); senão vai para 'pasta_temporaria' (ou a
+        pasta temporária do sistema).
+        """
+        self.descartar_arena()
+        base = pasta_temporaria
+        if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+            livre = os.statvfs("/dev/shm")
+            if livre.f_bavail * livre.f_frsize >= espaco_arena(self.num_processos):
+                base = "/dev/shm"
+        self._pasta_arena = tempfile.mkdtemp(prefix="fotofinder_arena_", dir=base)
+        return self._pasta_arena
+
+class DespachoAdaptativo:
+    """
+    Escolhe o tamanho dos lotes entregues aos workers, para reduzir o custo de IPC.
+    O tamanho se adapta ao tempo médio por tarefa medido nos resultados: tarefas lentas
+    (imagens novas) vão uma a uma, tarefas rápidas (acertos de cache) vão em lotes
+    maiores, mantendo cada lote perto de 'tempo_alvo' segundos.
+    """
+    def __init__(self, num_processos, tempo_alvo=0.25, tamanho_maximo=64):
+        self.num_processos = num_processos
+        self.tempo_alvo = tempo_alvo
+        self.tamanho_maximo = tamanho_maximo
+        self.tempo_medio = None
+
+    def tamanho_lote(self):
+        if self.tempo_medio is None:
+            return 1
+        return int(min(self.tamanho_maximo, max(1, self.tempo_alvo / max(self.tempo_medio, 1e-6))))
+
+    def registrar(self, duracao, quantidade):
+        """Chamado pelo engine para cada lote concluído."""
+        if quantidade:
+            tempo = duracao / quantidade
+            self.tempo_medio = tempo if self.tempo_medio is None else 0.7 * self.tempo_medio + 0.3 * tempo
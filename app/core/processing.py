@@ -1,195 +1,589 @@
 # app/core/processing.py
 
 import os
-import shutil
-import numpy as np
+import glob
+import time
+import threading
 import functools
-from multiprocessing import Pool, cpu_count
 
-try:
-    import face_recognition
-    from sklearn.cluster import DBSCAN
-except ImportError:
-    print("Erro: Bibliotecas de processamento não encontradas. Instale com 'pip install face_recognition scikit-learn'.")
-    exit()
-    
-from ..workers.face_workers import processar_imagem_cluster_worker, processar_imagem_busca_worker
+from ..workers.face_workers import processar_imagem_cluster_worker, processar_imagem_busca_worker, calcular_assinatura_worker, codificar_referencia_worker, montar_matriz_referencias
+from .config import MAPEAMENTO_EPS
+from .descoberta import descobrir_imagens, listar_referencias, ContadorDescoberta
+from .saida import SaidaArquivos
+from .pool import PoolPersistente, DespachoAdaptativo, ordenar_por_tamanho
+from .estatisticas import EstatisticasExecucao, TraceExecucao
+from .face_table import FaceTable
+from .sessao import SessaoAgrupamento
+from .rajadas import agrupar_rajadas
+from .arena import LeitorArena
+from .indice_biblioteca import IndiceBiblioteca, pasta_indice_padrao
+from .encoding_cache import chave_perfil
+from .diario import DiarioExecucao, caminho_diario_padrao, assinatura_extracao
+
+# Eventos emitidos pelo ProcessingEngine através do callback(tipo, *args)
+EVENTO_STATUS = "status"        # (texto, progresso) - progresso entre 0 e 1
+EVENTO_RESULTADO = "resultado"  # (caminho_destino, caminho_origem, grupo) - destino None no modo Manifesto
+EVENTO_PREVIA = "previa"        # (grupos, isolados) - prévia do agrupamento, nada copiado ainda
+EVENTO_ERRO = "erro"            # (titulo, mensagem)
+EVENTO_FIM = "fim"              # (mensagem,)
 
 class ProcessingEngine:
     """
     Contém a lógica de negócio principal para análise e agrupamento de fotos.
-    Opera de forma desacoplada da UI, recebendo uma instância da janela principal
-    para enviar atualizações de progresso.
+    Não depende da UI: recebe os parâmetros em uma ConfiguracaoAnalise e informa
+    progresso e resultados pelo callback(tipo, *args), com os tipos EVENTO_*.
+    A interface gráfica e a linha de comando são apenas consumidores destes eventos.
     """
-    def __init__(self, app_instance):
-        self.app = app_instance
+    def __init__(self, callback=None, num_processos=None):
+        self.callback = callback
+        self.stop_event = threading.Event()
+        # Workers mantidos entre as análises (modelos do dlib já carregados)
+        self.pool = PoolPersistente(num_processos)
+        self.cache_ativo = True
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.fotos_reaproveitadas = 0
+        # Última análise de agrupamento, usada para reagrupar sem reprocessar as imagens
+        self.sessao = None
+        # (caminho, assinatura) do diário da sessão, usado na cópia dos grupos
+        self.diario_sessao = None
+        self.imagens_retomadas = 0
+        # Arquivos gerados na última execução: [{"grupo", "origem", "destino"}]
+        self.resultados = []
+        # Tempos por etapa e falhas da análise atual (pode ser consultado durante a execução)
+        self.estatisticas = EstatisticasExecucao()
+        self.trace = None
+        self.tempo_limite_imagem = None
+
+    def _emitir(self, tipo, *args):
+        if self.callback:
+            self.callback(tipo, *args)
+
+    def _status(self, texto, progresso):
+        self._emitir(EVENTO_STATUS, texto, progresso)
+
+    def _finalizar(self, mensagem):
+        if self.trace is not None:
+            self.trace.descarregar()
+        self._emitir(EVENTO_FIM, mensagem + self.estatisticas.texto_falhas())
+
+    def _registrar_resultado(self, caminho_destino, caminho_origem, grupo):
+        self.resultados.append({"grupo": grupo, "origem": caminho_origem, "destino": caminho_destino})
+        self._emitir(EVENTO_RESULTADO, caminho_destino, caminho_origem, grupo)
+
+    def _iniciar_execucao(self, config, nova_analise=True):
+        """
+        Zera os contadores da execução. Com nova_analise=False (cópia dos grupos de uma
+        análise já feita) as estatísticas continuam acumulando sobre as da análise.
+        """
+        self.cache_ativo = bool(config.cache_db)
+        self.cache_hits, self.cache_misses = 0, 0
+        self.resultados = []
+        self.fotos_reaproveitadas = 0
+        self.tempo_limite_imagem = config.tempo_limite_imagem
+        if nova_analise:
+            self.estatisticas = EstatisticasExecucao()
+        self._abrir_trace(config.arquivo_trace)
+
+    def _abrir_trace(self, caminho):
+        # O mesmo arquivo continua aberto entre a análise e a cópia dos grupos
+        if self.trace is not None and (caminho is None or self.trace.caminho != caminho):
+            self.trace.fechar()
+            self.trace = None
+        if caminho and self.trace is None:
+            self.trace = TraceExecucao(caminho)
+
+    def _registrar_imagem(self, registro):
+        self.estatisticas.registrar(registro)
+        if self.trace is not None:
+            self.trace.gravar(registro)
+
+    def _registrar_gravacao(self, origem, destino, inicio, duracao):
+        self.estatisticas.registrar_etapa("gravar", duracao)
+        if self.trace is not None:
+            self.trace.gravar_evento("gravar", inicio, duracao, origem=origem, destino=destino)
+
+    def parar(self):
+        self.stop_event.set()
 
-    def executar_busca_cluster(self):
-        mapeamento_eps = {"Preciso": 0.45, "Equilibrado": 0.5, "Abrangente": 0.6}
-        eps = mapeamento_eps[self.app.seg_button_precisao.get()]
+    def fechar(self):
+        """Encerra o Pool persistente e o trace. Deve ser chamado ao sair da aplicação."""
+        self.pool.fechar()
+        self._abrir_trace(None)
+
+    def _processar_no_pool(self, worker, tarefas):
+        """
+        Distribui as tarefas nos workers persistentes, das maiores imagens para as menores
+        (tamanho do arquivo, em janelas de JANELA_ORDENACAO), em lotes de tamanho adaptativo
+        entregues a quem estiver livre, e devolve os resultados individuais à medida que
+        ficam prontos. Uma imagem que passa de tempo_limite_imagem segundos sem resposta
+        tem o worker substituído e gera None (com a falha registrada nas estatísticas).
+        Os registros de tempo de cada imagem e os tempos de fila/IPC de cada lote vão para
+        as estatísticas. Se a análise for interrompida, encerra os workers e para de gerar
+        resultados; quem chama deve verificar stop_event ao final.
+        """
+        despacho = DespachoAdaptativo(self.pool.num_processos)
+        lotes = self.pool.executar(worker, ordenar_por_tamanho(tarefas), despacho, self.stop_event, self.tempo_limite_imagem)
+        for resultados_lote, duracao, espera, fim in lotes:
+            despacho.registrar(duracao, len(resultados_lote))
+            self.estatisticas.registrar_etapa("fila", espera)
+            self.estatisticas.registrar_etapa("ipc", max(0.0, time.time() - fim))
+            if self.stop_event.is_set():
+                lotes.close()
+                return
+            for res, registro in resultados_lote:
+                if registro is not None:
+                    self._registrar_imagem(registro)
+                yield res
+
+    def _extrair_rostos(self, config, caminhos):
+        """
+        Detecta e codifica os rostos das imagens no Pool. Os workers gravam as codificações
+        numa arena em memória compartilhada e o engine as lê por np.memmap, sem serializar
+        arrays pelo pipe. Gera (caminho, linhas, cache_hit) para as imagens lidas e None
+        para as que falharam; 'linhas' é um array estruturado com os campos "encoding" e
+        "caixa" e deve ser copiado antes de pedir o próximo resultado.
+        """
+        pasta_arena = self.pool.nova_arena(config.pasta_temporaria)
+        leitor = LeitorArena(pasta_arena)
+        args_para_worker = ((path, config.downscale_factor, config.cache_db, config.cache_hash, config.hibrido, config.prefiltro, pasta_arena) for path in caminhos)
         try:
-            min_fotos_por_grupo = int(self.app.min_fotos_var.get())
-            if min_fotos_por_grupo < 1: min_fotos_por_grupo = 2
-        except (ValueError, TypeError):
-            min_fotos_por_grupo = 2
-        
-        downscale_factor = self.app.get_downscale_factor()
+            for res in self._processar_no_pool(processar_imagem_cluster_worker, args_para_worker):
+                if res:
+                    caminho_imagem, bloco, cache_hit = res
+                    self._registrar_cache(cache_hit)
+                    res = (caminho_imagem, leitor.ler(bloco), cache_hit)
+                yield res
+        finally:
+            leitor.fechar()
+            self.pool.descartar_arena()
+
+    def _registrar_cache(self, cache_hit):
+        if cache_hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def _texto_cache(self):
+        if not self.cache_ativo:
+            return ""
+        return f" (cache: {self.cache_hits} acertos, {self.cache_misses} novas)"
+
+    def _descobrir_imagens(self, config, pastas_saida=()):
+        """
+        Inicia a descoberta (em streaming) das imagens da pasta de origem.
+        Quando as cópias são criadas dentro da própria origem, as pastas de saída
+        (padrões glob, relativos ao destino) são ignoradas para que resultados
+        anteriores não sejam reprocessados; só as que ficam direto no destino.
+        """
+        origem, destino = os.path.abspath(config.pasta_origem), os.path.abspath(config.base_destino)
+        excluir_pastas = []
+        if destino == origem:
+            excluir_pastas = list(pastas_saida)
+        elif destino.startswith(origem + os.sep):
+            excluir_pastas = [glob.escape(os.path.relpath(destino, origem).replace(os.sep, "/"))]
+        return ContadorDescoberta(descobrir_imagens(config.pasta_origem, config.extensoes, config.incluir, config.excluir, config.recursivo, excluir_pastas))
+
+    def _texto_descoberta(self, contador, processadas):
+        andamento = "" if contador.concluido else " (procurando mais arquivos...)"
+        falhas = f", {self.estatisticas.total_falhas} ilegíveis" if self.estatisticas.total_falhas else ""
+        return f"{processadas} de {contador.descobertos} imagens{falhas}{andamento}"
+
+    def _separar_rajadas(self, contador):
+        """
+        Pré-passo das rajadas: calcula a assinatura perceptual (decodificação minúscula)
+        de todas as imagens encontradas e agrupa as quase idênticas. Só os representantes
+        passam pela detecção e codificação; os rostos deles são reaproveitados nos membros.
+        Retorna (ContadorDescoberta dos representantes, {representante: [membros]}).
+        """
+        assinaturas, sem_assinatura = [], []
+        for i, res in enumerate(self._processar_no_pool(calcular_assinatura_worker, contador)):
+            if res is None:
+                continue
+            caminho, dhash, tamanho, miniatura, duracao = res
+            self.estatisticas.registrar_etapa("assinatura", duracao)
+            if dhash is None:
+                sem_assinatura.append(caminho)
+            else:
+                assinaturas.append((caminho, dhash, tamanho, miniatura))
+            if i % 50 == 0:
+                self._status(f"Procurando fotos repetidas: {self._texto_descoberta(contador, i + 1)}...", None)
+        # Ordem por caminho: o representante é a primeira foto da sequência
+        assinaturas.sort(key=lambda a: a[0])
+        representantes, membros = agrupar_rajadas(assinaturas)
+        for caminho in sem_assinatura:
+            representantes.append(caminho)
+            membros[caminho] = []
+        self.fotos_reaproveitadas = sum(len(m) for m in membros.values())
+        return ContadorDescoberta(iter(representantes)), membros
+
+    def _texto_rajadas(self):
+        return f" ({self.fotos_reaproveitadas} fotos repetidas reaproveitadas)" if self.fotos_reaproveitadas else ""
+
+    def _texto_prefiltro(self):
+        descartadas = self.estatisticas.status.get("prefiltro", 0)
+        return f" ({descartadas} fotos sem rostos descartadas pelo pré-filtro)" if descartadas else ""
+
+    def descartar_sessao(self):
+        self.sessao = None
+        self.diario_sessao = None
+
+    def _texto_retomada(self):
+        return f" ({self.imagens_retomadas} imagens retomadas da análise interrompida)" if self.imagens_retomadas else ""
+
+    def executar_busca_cluster(self, config):
+        """
+        Codifica os rostos da pasta de origem e cria uma sessão de agrupamento.
+        Os grupos são apenas emitidos como prévia (EVENTO_PREVIA); a cópia dos arquivos
+        acontece somente em copiar_grupos, quando o usuário confirmar.
+        As imagens processadas vão para o diário da pasta (app/core/diario.py): se a
+        análise for interrompida, a próxima com as mesmas opções só processa as que faltam.
+        Quando a análise termina, as imagens saem do diário.
+        """
+        self._iniciar_execucao(config)
+        self.sessao = None
+        self.diario_sessao = None
+        self.imagens_retomadas = 0
+        diario = DiarioExecucao(caminho_diario_padrao(config.pasta_origem), assinatura_extracao(config), config.retomar)
+        try:
+            self._agrupar_com_diario(config, diario)
+            if not self.stop_event.is_set():
+                diario.concluir_extracao()
+        finally:
+            diario.fechar()
+
+    def _agrupar_com_diario(self, config, diario):
+        self._status("Passo 1/4: Mapeando arquivos...", 0)
+        contador = self._descobrir_imagens(config, pastas_saida=["Pessoa_*", "_Rostos Isolados"])
+        membros = {}
+        if config.agrupar_rajadas:
+            contador, membros = self._separar_rajadas(contador)
+            if self.stop_event.is_set():
+                self._finalizar("Análise interrompida.")
+                return
+        limite_memoria = config.memoria_rostos_mb * 1024 * 1024 if config.memoria_rostos_mb else None
+        tabela = FaceTable(limite_memoria=limite_memoria, pasta_temporaria=config.pasta_temporaria)
+        processadas = 0
+        retomadas = set()
+
+        def pendentes():
+            # Imagens que já estão no diário (e não mudaram) não voltam para o Pool
+            for caminho in contador:
+                if diario.ja_processada(caminho):
+                    retomadas.add(caminho)
+                else:
+                    yield caminho
         
-        self.app.after(0, self.app.atualizar_status, "Passo 1/4: Mapeando arquivos...", 0)
-        caminhos_imagens = [os.path.join(self.app.caminho_pasta_fotos, f) for f in os.listdir(self.app.caminho_pasta_fotos) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        if not caminhos_imagens:
-            self.app.after(0, self.app.finalizar_busca, "Nenhuma imagem encontrada.")
+        # Os caminhos seguem direto do gerador para o Pool, à medida que são encontrados
+        for i, res in enumerate(self._extrair_rostos(config, pendentes())):
+            processadas = len(retomadas) + i + 1
+            if res:
+                caminho_imagem, linhas, _ = res
+                diario.registrar_imagem(caminho_imagem, linhas["encoding"], linhas["caixa"])
+                tabela.adicionar(caminho_imagem, linhas["encoding"], linhas["caixa"])
+                # Fotos da mesma rajada recebem os rostos do representante
+                for membro in membros.get(caminho_imagem, ()):
+                    tabela.adicionar(membro, linhas["encoding"], linhas["caixa"])
+            
+            # *** OTIMIZAÇÃO APLICADA AQUI ***
+            # Atualiza a UI apenas a cada 10 imagens para não sobrecarregar
+            if i % 10 == 0 or (contador.concluido and processadas == contador.descobertos):
+                progresso = 0.1 + (processadas / max(1, contador.descobertos)) * 0.6
+                self._status(f"Passo 2/4: Processando {self._texto_descoberta(contador, processadas)}...{self._texto_rajadas()}{self._texto_cache()}", progresso)
+
+        if self.stop_event.is_set():
+            self._finalizar("Análise interrompida. As imagens já processadas foram salvas e não serão processadas de novo na próxima análise desta pasta.")
             return
 
-        self.app.after(0, self.app.atualizar_status, f"Passo 2/4: Processando {len(caminhos_imagens)} imagens...", 0.1)
-        num_processos = max(1, cpu_count() - 1)
-        args_para_worker = [(path, downscale_factor) for path in caminhos_imagens]
-        
-        all_encodings, encoding_to_path = [], {}
-        total_imagens = len(caminhos_imagens)
-        
-        with Pool(processes=num_processos) as pool:
-            resultados = pool.imap_unordered(processar_imagem_cluster_worker, args_para_worker)
-            for i, res in enumerate(resultados):
-                if self.app.stop_event.is_set():
-                    pool.terminate()
-                    self.app.after(0, self.app.finalizar_busca, "Análise interrompida.")
-                    return
-                if res:
-                    caminho_imagem, encodings = res
-                    all_encodings.extend(encodings)
-                    for enc in encodings:
-                        encoding_to_path[tuple(enc)] = caminho_imagem
-                
-                # *** OTIMIZAÇÃO APLICADA AQUI ***
-                # Atualiza a UI apenas a cada 10 imagens para não sobrecarregar
-                if i % 10 == 0 or i == total_imagens - 1:
-                    progresso = 0.1 + (i / total_imagens) * 0.6
-                    self.app.after(0, self.app.progressbar.set, progresso)
-
-        if not all_encodings:
-            self.app.after(0, self.app.finalizar_busca, "Nenhum rosto encontrado.")
+        # Rostos das imagens processadas antes da interrupção
+        self.imagens_retomadas = len(retomadas)
+        for caminho_imagem, encodings, caixas in diario.rostos(retomadas):
+            tabela.adicionar(caminho_imagem, encodings, caixas)
+            for membro in membros.get(caminho_imagem, ()):
+                tabela.adicionar(membro, encodings, caixas)
+
+        if not contador.descobertos:
+            self._finalizar("Nenhuma imagem encontrada.")
             return
 
-        self.app.after(0, self.app.atualizar_status, "Passo 3/4: Criando grupos...", 0.7)
-        clt = DBSCAN(metric="euclidean", n_jobs=-1, eps=eps, min_samples=min_fotos_por_grupo)
-        clt.fit(all_encodings)
+        if not len(tabela):
+            self._finalizar("Nenhum rosto encontrado.")
+            return
+
+        em_disco = " em disco" if tabela.em_disco else ""
+        self._status(f"Passo 3/4: Criando grupos ({len(tabela)} rostos{em_disco})...", 0.7)
+        sessao = SessaoAgrupamento(tabela, max(MAPEAMENTO_EPS.values()), config.pasta_origem, config.motor_agrupamento, config.eps)
+        sessao.agrupar(config.eps, config.min_fotos_por_grupo)
+        grupos, isolados = sessao.grupos()
+        self.sessao = sessao
+        self.diario_sessao = (diario.caminho, assinatura_extracao(config))
+        
+        self._emitir(EVENTO_PREVIA, grupos, isolados)
+        self._finalizar(f"Prévia: {len(grupos)} grupos e {len(isolados)} rostos isolados. Ajuste a sensibilidade e clique em 'Copiar Grupos'.{self._texto_retomada()}{self._texto_rajadas()}{self._texto_prefiltro()}{self._texto_cache()}")
+
+    def reagrupar(self, config):
+        """
+        Reagrupa os rostos da sessão atual com a sensibilidade e o mínimo de fotos
+        da configuração, sem reprocessar as imagens. Roda na thread de processamento,
+        como a análise: a prévia e a mensagem final chegam como EVENTO_PREVIA e EVENTO_FIM.
+        Retorna (grupos, isolados) ou None se não houver sessão.
+        """
+        if self.sessao is None:
+            self._emitir(EVENTO_FIM, "Nenhuma análise de agrupamento para reagrupar.")
+            return None
+        progresso = None
+        if self.sessao.precisa_recalcular(config.eps):
+            # Sessão grande com o grafo calculado num raio menor: refazê-lo pode levar minutos
+            texto = f"Recalculando as vizinhanças de {len(self.sessao.tabela)} rostos para a nova sensibilidade..."
+            self._status(texto, 0.0)
+            progresso = lambda fracao: self._status(texto, 0.9 * fracao)
+        self.sessao.agrupar(config.eps, config.min_fotos_por_grupo, progresso)
+        grupos, isolados = self.sessao.grupos()
+        self._emitir(EVENTO_PREVIA, grupos, isolados)
+        self._emitir(EVENTO_FIM, f"Prévia: {len(grupos)} grupos e {len(isolados)} rostos isolados. Clique em 'Copiar Grupos' para confirmar.")
+        return grupos, isolados
+
+    def copiar_grupos(self, config):
+        """
+        Copia os arquivos de acordo com o agrupamento atual da sessão (Passo 4/4).
+        Cada arquivo gravado é registrado no diário da sessão; ao repetir uma cópia
+        interrompida, os já gravados são mantidos e só os que faltam são copiados.
+        O diário é apagado quando a cópia termina sem erros.
+        """
+        self._iniciar_execucao(config, nova_analise=False)
+        sessao = self.sessao
+        if sessao is None:
+            self._finalizar("Nenhuma análise de agrupamento para copiar.")
+            return
         
-        self.app.after(0, self.app.atualizar_status, "Passo 4/4: Copiando arquivos...", 0.9)
-        labelIDs = np.unique(clt.labels_)
-        base_destino = self.app.caminho_pasta_destino if self.app.caminho_pasta_destino else self.app.caminho_pasta_fotos
+        self._status("Passo 4/4: Copiando arquivos...", 0.9)
+        grupos, isolados = sessao.grupos()
+        base_destino = config.pasta_destino if config.pasta_destino else sessao.pasta_origem
         
-        num_grupos_principais = len(np.where(labelIDs > -1)[0])
-        for labelID in labelIDs:
-            if self.app.stop_event.is_set(): break
-            if labelID == -1: continue
-            idxs = np.where(clt.labels_ == labelID)[0]
-            pasta_pessoa = os.path.join(base_destino, f"Pessoa_{labelID + 1:02d}")
-            os.makedirs(pasta_pessoa, exist_ok=True)
-            paths_to_copy = {encoding_to_path[tuple(all_encodings[i])] for i in idxs}
+        diario = DiarioExecucao(*self.diario_sessao) if self.diario_sessao is not None else None
+        saida = SaidaArquivos(config.modo_saida, base_destino, self._registrar_resultado, config.threads_copia, self._registrar_gravacao, diario)
+        
+        num_grupos_principais = len(grupos)
+        for labelID, paths_to_copy in grupos.items():
+            if self.stop_event.is_set(): break
+            nome_grupo = f"Pessoa_{labelID + 1:02d}"
             for path in paths_to_copy:
-                dest_path = os.path.join(pasta_pessoa, os.path.basename(path))
-                if not os.path.exists(dest_path):
-                    shutil.copy(path, dest_path)
-                    self.app.after(0, self.app.adicionar_preview_foto, dest_path, f"{os.path.basename(path)} -> Pessoa_{labelID + 1:02d}")
+                saida.enviar(path, nome_grupo, nome_grupo)
 
         # *** LÓGICA DE CÓPIA DOS ISOLADOS CORRIGIDA AQUI ***
-        outlier_idxs = np.where(clt.labels_ == -1)[0]
+        # Cada imagem isolada vai para uma pasta separada, sem duplicatas
         num_isolados = 0
-        if len(outlier_idxs) > 0:
-            pasta_isolados_parent = os.path.join(base_destino, "_Rostos Isolados")
-            os.makedirs(pasta_isolados_parent, exist_ok=True)
-            
-            # Mapeia cada codificação de rosto isolado ao seu arquivo de origem
-            isolated_paths = [encoding_to_path[tuple(all_encodings[i])] for i in outlier_idxs]
-            
-            # Copia cada imagem isolada para uma pasta separada, sem duplicatas
-            copied_files_in_session = set()
-            for path in set(isolated_paths):
-                if self.app.stop_event.is_set(): break
-                if path in copied_files_in_session: continue
-                
-                num_isolados += 1
-                pasta_sub_isolado = os.path.join(pasta_isolados_parent, f"Rosto_{num_isolados:03d}")
-                os.makedirs(pasta_sub_isolado, exist_ok=True)
-                
-                dest_path = os.path.join(pasta_sub_isolado, os.path.basename(path))
-                if not os.path.exists(dest_path):
-                     shutil.copy(path, dest_path)
-                     self.app.after(0, self.app.adicionar_preview_foto, dest_path, f"Isolados/Rosto_{num_isolados:03d}")
-                copied_files_in_session.add(path)
-
-        if self.app.stop_event.is_set():
-            self.app.after(0, self.app.finalizar_busca, "Análise interrompida pelo usuário.")
+        for path in isolados:
+            if self.stop_event.is_set(): break
+            num_isolados += 1
+            saida.enviar(path, os.path.join("_Rostos Isolados", f"Rosto_{num_isolados:03d}"), f"Isolados/Rosto_{num_isolados:03d}")
+
+        if self.stop_event.is_set():
+            saida.cancelar()
         else:
-            self.app.after(0, self.app.finalizar_busca, f"Concluído! {num_grupos_principais} grupos e {num_isolados} rostos isolados encontrados.")
+            self._status("Passo 4/4: Aguardando a gravação dos arquivos...", 0.95)
+            saida.finalizar()
+        if diario is not None:
+            if self.stop_event.is_set() or saida.erros:
+                diario.fechar()
+            else:
+                diario.descartar()
+                self.diario_sessao = None
 
-    def executar_busca_individual(self):
+        if self.stop_event.is_set():
+            self._finalizar("Análise interrompida pelo usuário.")
+        else:
+            self._finalizar(f"Concluído! {num_grupos_principais} grupos e {num_isolados} rostos isolados encontrados.{saida.resumo()}")
+
+    def _carregar_referencias(self, config, referencias):
+        """
+        Codifica as fotos de referência [(nome, caminho)] em paralelo no Pool, usando o
+        cache de codificações. Retorna {nome: [encodings]} (a galeria de cada pessoa),
+        em ordem de nome; pessoas sem nenhum rosto encontrado ficam de fora.
+        """
+        nomes_por_caminho = {}
+        for nome, caminho in referencias:
+            nomes_por_caminho.setdefault(caminho, []).append(nome)
+        galerias = {}
+        args_para_worker = ((caminho, config.cache_db, config.cache_hash) for caminho in nomes_por_caminho)
+        for i, res in enumerate(self._processar_no_pool(codificar_referencia_worker, args_para_worker)):
+            if res and res[1] is not None:
+                caminho, encoding = res
+                for nome in nomes_por_caminho[caminho]:
+                    galerias.setdefault(nome, []).append(encoding)
+            if i % 10 == 0:
+                self._status(f"Carregando faces de referência: {i + 1} de {len(nomes_por_caminho)} fotos...", (i + 1) / len(nomes_por_caminho) * 0.05)
+        return {nome: galerias[nome] for nome in sorted(galerias)}
+
+    def executar_busca_individual(self, config):
+        self._iniciar_execucao(config)
         try:
-            encodings_ref = face_recognition.face_encodings(face_recognition.load_image_file(self.app.caminho_foto_referencia))
-            if not encodings_ref:
-                self.app.after(0, self.app.messagebox.showerror, "Erro", "Nenhum rosto encontrado na foto de referência.")
-                self.app.after(0, self.app.finalizar_busca, "Busca falhou.")
+            known_encodings = self._carregar_referencias(config, [(config.nome_pessoa.strip(), config.foto_referencia)])
+            if self.stop_event.is_set():
+                self._finalizar("Análise interrompida.")
+                return
+            if not known_encodings:
+                self._emitir(EVENTO_ERRO, "Erro", "Nenhum rosto encontrado na foto de referência.")
+                self._finalizar("Busca falhou.")
                 return
-            person_name = self.app.entry_nome_pessoa.get().strip()
-            self.executar_busca_paralela({person_name: encodings_ref[0]})
+            self.executar_busca_paralela(config, known_encodings)
         except Exception as e:
-            self.app.after(0, self.app.finalizar_busca, f"Erro crítico: {e}")
+            self._finalizar(f"Erro crítico: {e}")
 
-    def executar_busca_lote(self):
+    def executar_busca_lote(self, config):
+        self._iniciar_execucao(config)
         try:
-            self.app.after(0, self.app.atualizar_status, "Carregando faces de referência...", 0)
-            known_encodings = {}
-            ref_files = [f for f in os.listdir(self.app.caminho_pasta_referencia) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-            for filename in ref_files:
-                person_name, filepath = os.path.splitext(filename)[0], os.path.join(self.app.caminho_pasta_referencia, filename)
-                try:
-                    encoding = face_recognition.face_encodings(face_recognition.load_image_file(filepath))[0]
-                    known_encodings[person_name] = encoding
-                except IndexError:
-                    continue
+            self._status("Carregando faces de referência...", 0)
+            # Fotos soltas na pasta são uma pessoa cada; subpastas são galerias com várias fotos da mesma pessoa
+            known_encodings = self._carregar_referencias(config, listar_referencias(config.pasta_referencias, config.extensoes))
+            if self.stop_event.is_set():
+                self._finalizar("Análise interrompida.")
+                return
             if not known_encodings:
-                self.app.after(0, self.app.messagebox.showerror, "Erro", "Nenhum rosto válido encontrado na pasta de referências.")
-                self.app.after(0, self.app.finalizar_busca, "Busca falhou.")
+                self._emitir(EVENTO_ERRO, "Erro", "Nenhum rosto válido encontrado na pasta de referências.")
+                self._finalizar("Busca falhou.")
                 return
-            self.executar_busca_paralela(known_encodings)
+            self.executar_busca_paralela(config, known_encodings)
         except Exception as e:
-            self.app.after(0, self.app.finalizar_busca, f"Erro crítico: {e}")
-
-    def executar_busca_paralela(self, known_encodings):
-        mapeamento = {"Preciso": 0.5, "Equilibrado": 0.6, "Abrangente": 0.68}
-        tolerancia = mapeamento[self.app.seg_button_precisao.get()]
-        downscale_factor = self.app.get_downscale_factor()
-        base_destino = self.app.caminho_pasta_destino if self.app.caminho_pasta_destino else self.app.caminho_pasta_fotos
-        caminhos_imagens = [os.path.join(self.app.caminho_pasta_fotos, f) for f in os.listdir(self.app.caminho_pasta_fotos) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        if not caminhos_imagens:
-            self.app.after(0, self.app.finalizar_busca, "Nenhuma imagem encontrada.")
+            self._finalizar(f"Erro crítico: {e}")
+
+    def _pasta_indice(self, config):
+        return config.pasta_indice or pasta_indice_padrao(config.pasta_origem)
+
+    def indexar_biblioteca(self, config):
+        """
+        Cria ou atualiza o índice de rostos da pasta de origem (ver app/core/indice_biblioteca.py).
+        Só as fotos novas ou alteradas desde a última indexação são processadas; as que
+        sumiram da pasta saem do índice. As buscas com config.usar_indice consultam o
+        índice em vez de decodificar a biblioteca de novo.
+        """
+        self._iniciar_execucao(config)
+        indice = IndiceBiblioteca(self._pasta_indice(config))
+        try:
+            perfil = chave_perfil(config.downscale_factor, config.hibrido)
+            if indice.obter_info("perfil") != perfil:
+                # Codificações de perfis diferentes não devem ser comparadas entre si
+                indice.limpar()
+                indice.definir_info("perfil", perfil)
+            indice.definir_info("pasta_origem", os.path.abspath(config.pasta_origem))
+
+            self._status("Indexando: mapeando arquivos...", 0)
+            vistos = set()
+            def pendentes():
+                for caminho in self._descobrir_imagens(config):
+                    caminho = os.path.abspath(caminho)
+                    vistos.add(caminho)
+                    if indice.precisa_atualizar(caminho):
+                        yield caminho
+            contador = ContadorDescoberta(pendentes())
+            membros = {}
+            if config.agrupar_rajadas:
+                contador, membros = self._separar_rajadas(contador)
+
+            processadas = 0
+            for i, res in enumerate(self._extrair_rostos(config, contador)):
+                processadas = i + 1
+                if res:
+                    caminho_imagem, linhas, _ = res
+                    for caminho in [caminho_imagem] + membros.get(caminho_imagem, []):
+                        try:
+                            indice.adicionar(caminho, linhas["encoding"], linhas["caixa"])
+                        except OSError:
+                            continue
+                if i % 500 == 0:
+                    indice.salvar()
+                if i % 10 == 0 or (contador.concluido and processadas == contador.descobertos):
+                    self._status(f"Indexando {processadas} de {contador.descobertos} fotos novas ou alteradas ({len(vistos)} na biblioteca)...{self._texto_rajadas()}{self._texto_cache()}",
+                                 processadas / max(1, contador.descobertos))
+            indice.salvar()
+
+            if self.stop_event.is_set():
+                self._finalizar("Indexação interrompida. As fotos já processadas ficam no índice.")
+                return
+            removidas = indice.remover_ausentes(vistos)
+            indice.salvar()
+            indice.compactar_se_necessario()
+            self._finalizar(f"Índice atualizado: {len(indice.arquivos)} fotos e {indice.num_rostos} rostos "
+                            f"({processadas} processadas, {removidas} removidas).{self._texto_rajadas()}{self._texto_prefiltro()}{self._texto_cache()}")
+        finally:
+            indice.fechar()
+
+    def _buscar_no_indice(self, config, known_encodings):
+        """Busca as referências no índice da biblioteca, sem decodificar as fotos."""
+        pasta = self._pasta_indice(config)
+        if not IndiceBiblioteca.existe(pasta):
+            self._emitir(EVENTO_ERRO, "Erro", "A biblioteca ainda não foi indexada. Use 'Indexar Biblioteca' antes de buscar no índice.")
+            self._finalizar("Busca falhou.")
+            return
+        indice = IndiceBiblioteca(pasta)
+        try:
+            self._status("Consultando o índice da biblioteca...", 0.5)
+            inicio = time.perf_counter()
+            encontrados = indice.consultar(montar_matriz_referencias(known_encodings), config.tolerancia, config.top_k, exclusivo=not config.multiplas_pessoas)
+            self.estatisticas.registrar_etapa("consulta_indice", time.perf_counter() - inicio)
+            desatualizado = indice.obter_info("perfil") != chave_perfil(config.downscale_factor, config.hibrido)
+        finally:
+            indice.fechar()
+
+        saida = SaidaArquivos(config.modo_saida, config.base_destino, self._registrar_resultado, config.threads_copia, self._registrar_gravacao)
+        # Em ordem de distância: com top_k, os arquivos mais parecidos são gravados primeiro
+        for person_name, achados in encontrados.items():
+            for caminho, _ in achados:
+                if self.stop_event.is_set():
+                    break
+                saida.enviar(caminho, person_name, person_name)
+        if self.stop_event.is_set():
+            saida.cancelar()
+            self._finalizar("Análise interrompida.")
             return
+        self._status("Aguardando a gravação dos arquivos...", 1.0)
+        saida.finalizar()
+        aviso = " O índice foi criado com outra velocidade/modo; reindexe para resultados equivalentes." if desatualizado else ""
+        self._finalizar(f"Concluído! {len(self.resultados)} foto(s) encontrada(s) no índice.{aviso}{saida.resumo()}")
+
+    def executar_busca_paralela(self, config, known_encodings):
+        if config.usar_indice:
+            self._buscar_no_indice(config, known_encodings)
+            return
+        base_destino = config.base_destino
+        contador = self._descobrir_imagens(config, pastas_saida=[glob.escape(nome) for nome in known_encodings])
+        membros = {}
+        if config.agrupar_rajadas:
+            contador, membros = self._separar_rajadas(contador)
+            if self.stop_event.is_set():
+                self._finalizar("Análise interrompida.")
+                return
         
-        self.app.after(0, self.app.atualizar_status, f"Analisando {len(caminhos_imagens)} imagens...", 0)
-        num_processos = max(1, cpu_count() - 1)
-        worker_func = functools.partial(processar_imagem_busca_worker, known_encodings=known_encodings, tolerance=tolerancia, downscale_factor=downscale_factor)
+        self._status("Analisando imagens...", 0)
+        # A matriz de referências é montada uma única vez e publicada para os workers,
+        # que a carregam na primeira tarefa em vez de recebê-la em cada uma
+        referencias = self.pool.publicar_referencias(montar_matriz_referencias(known_encodings))
+        worker_func = functools.partial(processar_imagem_busca_worker, referencias=referencias, tolerance=config.tolerancia, downscale_factor=config.downscale_factor, cache_db=config.cache_db, cache_hash=config.cache_hash, retornar_todos=config.multiplas_pessoas, hibrido=config.hibrido, prefiltro=config.prefiltro)
         
-        total_imagens = len(caminhos_imagens)
-        with Pool(processes=num_processos) as pool:
-            resultados = pool.imap_unordered(worker_func, caminhos_imagens)
-            for i, res in enumerate(resultados):
-                if self.app.stop_event.is_set():
-                    pool.terminate()
-                    self.app.after(0, self.app.finalizar_busca, "Análise interrompida.")
-                    return
-                if res:
-                    caminho_origem, person_name = res
-                    pasta_pessoa = os.path.join(base_destino, person_name)
-                    os.makedirs(pasta_pessoa, exist_ok=True)
-                    nome_arquivo = os.path.basename(caminho_origem)
-                    caminho_destino_arquivo = os.path.join(pasta_pessoa, nome_arquivo)
-                    if not os.path.exists(caminho_destino_arquivo):
-                        shutil.copy(caminho_origem, caminho_destino_arquivo)
-                        self.app.after(0, self.app.adicionar_preview_foto, caminho_destino_arquivo, f"{nome_arquivo} -> {person_name}")
-                
-                # *** OTIMIZAÇÃO APLICADA AQUI TAMBÉM ***
-                if i % 10 == 0 or i == total_imagens - 1:
-                    self.app.after(0, self.app.progressbar.set, (i + 1) / total_imagens)
-
-        self.app.after(0, self.app.finalizar_busca, f"Concluído! {len(self.app.scroll_frame.winfo_children())} foto(s) encontrada(s).")
\ No newline at end of file
+        # As cópias rodam em threads próprias, sem bloquear o consumo dos resultados
+        saida = SaidaArquivos(config.modo_saida, base_destino, self._registrar_resultado, config.threads_copia, self._registrar_gravacao)
+        for i, res in enumerate(self._processar_no_pool(worker_func, contador)):
+            processadas = i + 1
+            if res:
+                self._registrar_cache(res[2])
+            if res and res[1]:
+                caminho_origem, pessoas, _ = res
+                for caminho in [caminho_origem] + membros.get(caminho_origem, []):
+                    for person_name in pessoas:
+                        saida.enviar(caminho, person_name, person_name)
+            
+            # *** OTIMIZAÇÃO APLICADA AQUI TAMBÉM ***
+            if i % 10 == 0 or (contador.concluido and processadas == contador.descobertos):
+                self._status(f"Analisando {self._texto_descoberta(contador, processadas)}... {len(self.resultados)} foto(s) encontrada(s).{self._texto_cache()}", processadas / max(1, contador.descobertos))
+
+        if self.stop_event.is_set():
+            saida.cancelar()
+            self._finalizar("Análise interrompida.")
+            return
+
+        self._status("Aguardando a gravação dos arquivos...", 1.0)
+        saida.finalizar()
+        if not contador.descobertos:
+            self._finalizar("Nenhuma imagem encontrada.")
+            return
+        self._finalizar(f"Concluído! {len(self.resultados)} foto(s) encontrada(s).{self._texto_rajadas()}{self._texto_prefiltro()}{self._texto_cache()}{saida.resumo()}")
@@ -0,0 +1,84 @@
+# app/core/rajadas.py
+
+import numpy as np
+
+# Distância de Hamming máxima entre os dHash de duas fotos da mesma rajada
+LIMITE_HAMMING_RAJADA = 4
+# Diferença média máxima (0-255) entre as miniaturas 16x16 em tons de cinza
+LIMITE_DIFERENCA_RAJADA = 10.0
+# Janela deslizante dos buckets: cada foto é comparada só com as MAX_COMPARACOES_BUCKET
+# anteriores do mesmo bucket (na ordem da entrada), o que limita o custo de buckets enormes
+# (ex.: muitas fotos pretas). Fotos parecidas mais distantes que isso na ordem só se juntam
+# através de fotos intermediárias já unidas a ambas; senão ficam em rajadas separadas
+MAX_COMPARACOES_BUCKET = 256
+
+def _faixas(limite):
+    """
+    Divide os 64 bits em limite+1 faixas: duas assinaturas a até 'limite' bits de
+    distância coincidem em pelo menos uma faixa inteira (princípio da casa dos pombos).
+    """
+    num_faixas = limite + 1
+    tamanhos = [64 // num_faixas + (1 if i < 64 % num_faixas else 0) for i in range(num_faixas)]
+    faixas, inicio = [], 0
+    for tamanho in tamanhos:
+        faixas.append((inicio, (1 << tamanho) - 1))
+        inicio += tamanho
+    return faixas
+
+class _UniaoBusca:
+    def __init__(self, n):
+        self.pai = list(range(n))
+
+    def raiz(self, i):
+        while self.pai[i] != i:
+            self.pai[i] = self.pai[self.pai[i]]
+            i = self.pai[i]
+        return i
+
+    def unir(self, a, b):
+        ra, rb = self.raiz(a), self.raiz(b)
+        if ra != rb:
+            # A raiz é sempre o menor índice, para o representante ser o primeiro da rajada
+            self.pai[max(ra, rb)] = min(ra, rb)
+
+def _parecidas(a, b, limite_hamming, limite_diferenca):
+    _, hash_a, tamanho_a, mini_a = a
+    _, hash_b, tamanho_b, mini_b = b
+    if tamanho_a != tamanho_b or bin(hash_a ^ hash_b).count("1") > limite_hamming:
+        return False
+    return float(np.abs(mini_a.astype(np.int16) - mini_b.astype(np.int16)).mean()) <= limite_diferenca
+
+def agrupar_rajadas(assinaturas, limite_hamming=LIMITE_HAMMING_RAJADA, limite_diferenca=LIMITE_DIFERENCA_RAJADA):
+    """
+    Agrupa fotos quase idênticas a partir de [(caminho, dhash, (largura, altura), miniatura)].
+    Os candidatos vêm de buckets LSH (faixas do dHash); cada par é verificado pela
+    distância de Hamming, pelo tamanho original e pela diferença das miniaturas, e os
+    pares aprovados são unidos (union-find). Para evitar que uma sequência longa se
+    afaste aos poucos do primeiro quadro, cada membro é conferido de novo com o
+    representante do grupo; quem não passa vira representante de si mesmo.
+    Retorna (representantes, {representante: [membros]}), na ordem da entrada.
+    """
+    n = len(assinaturas)
+    uniao = _UniaoBusca(n)
+    for deslocamento, mascara in _faixas(limite_hamming):
+        buckets = {}
+        for i, (_, dhash, _, _) in enumerate(assinaturas):
+            buckets.setdefault((dhash >> deslocamento) & mascara, []).append(i)
+        for indices in buckets.values():
+            if len(indices) < 2:
+                continue
+            for pos, i in enumerate(indices):
+                for j in indices[max(0, pos - MAX_COMPARACOES_BUCKET):pos]:
+                    if uniao.raiz(i) != uniao.raiz(j) and _parecidas(assinaturas[i], assinaturas[j], limite_hamming, limite_diferenca):
+                        uniao.unir(i, j)
+
+    representantes, membros = [], {}
+    for i in range(n):
+        raiz = uniao.raiz(i)
+        caminho = assinaturas[i][0]
+        if raiz != i and _parecidas(assinaturas[raiz], assinaturas[i], 2 * limite_hamming, limite_diferenca):
+            membros[assinaturas[raiz][0]].append(caminho)
+        else:
+            representantes.append(caminho)
+            membros[caminho] = []
+    return representantes, membros
@@ -0,0 +1,192 @@
+# app/core/saida.py
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+MODOS_SAIDA = ["Copiar", "Hardlink", "Symlink", "Reflink", "Manifesto"]
+MANIFESTO_JSON = "manifesto_fotofinder.json"
+MANIFESTO_CSV = "manifesto_fotofinder.csv"
+
+# Sufixo do arquivo temporário de uma cópia; o destino só aparece quando a cópia termina
+SUFIXO_PARCIAL = ".fotofinder_parcial"
+
+# ioctl FICLONE do Linux (Btrfs, XFS, bcachefs...)
+_FICLONE = 0x40049409
+
+def reflink(origem, destino):
+    """
+    Cria uma cópia 'copy-on-write' que compartilha os blocos do arquivo original.
+    Lança OSError se o sistema de arquivos não suportar.
+    """
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(origem, "rb") as f_origem, open(destino, "wb") as f_destino:
+            try:
+                fcntl.ioctl(f_destino.fileno(), _FICLONE, f_origem.fileno())
+            except OSError:
+                f_destino.close()
+                os.remove(destino)
+                raise
+    elif sys.platform == "darwin":
+        # APFS: 'cp -c' usa clonefile(2)
+        if subprocess.run(["cp", "-c", origem, destino], capture_output=True).returncode != 0:
+            raise OSError(f"reflink não suportado para {destino}")
+    else:
+        raise OSError("reflink não suportado nesta plataforma")
+
+def _copiar_atomico(copiar, origem, destino):
+    """
+    Grava num arquivo temporário ao lado do destino e o renomeia no fim, para que uma
+    interrupção nunca deixe uma cópia pela metade com o nome final.
+    """
+    parcial = destino + SUFIXO_PARCIAL
+    try:
+        copiar(origem, parcial)
+        os.replace(parcial, destino)
+    except BaseException:
+        try:
+            os.remove(parcial)
+        except OSError:
+            pass
+        raise
+
+class SaidaArquivos:
+    """
+    Etapa de saída das análises. Grava cada par (origem -> destino) de acordo com o modo:
+    - Copiar / Reflink: em um pool de threads, em paralelo com a análise;
+    - Hardlink / Symlink: na hora, pois são operações apenas de metadados;
+    - Manifesto: não toca nos arquivos, só registra pessoa -> arquivos em JSON e CSV.
+    Quando o link ou o reflink não é possível (outro disco, sistema de arquivos sem
+    suporte), o arquivo é copiado. ao_concluir(destino, origem, grupo) é chamado a cada
+    arquivo gravado, possivelmente a partir de outra thread; no modo Manifesto o destino
+    é None. ao_medir(origem, destino, inicio, duração) recebe o tempo de cada gravação.
+    As cópias são atômicas (arquivo temporário + rename). Com um 'diario' (DiarioExecucao),
+    cada arquivo gravado é registrado nele, e os já registrados numa execução interrompida
+    não são gravados de novo: voltam apenas como concluídos, com o mesmo destino.
+    """
+    def __init__(self, modo, base_destino, ao_concluir=None, num_threads=4, ao_medir=None, diario=None):
+        if modo not in MODOS_SAIDA:
+            raise ValueError(f"Modo de saída inválido: {modo!r}. Use um de {MODOS_SAIDA}.")
+        self.modo = modo
+        self.base_destino = base_destino
+        self.ao_concluir = ao_concluir
+        self.ao_medir = ao_medir
+        self.executor = ThreadPoolExecutor(max_workers=max(1, num_threads)) if modo in ("Copiar", "Reflink") else None
+        self.manifesto = []
+        self.erros = []
+        self.copias_alternativas = 0
+        self._reservados = set()
+        self._lock = threading.Lock()
+        self.diario = diario if modo != "Manifesto" else None
+        self.retomados = 0
+        # {(origem, pasta do grupo): destino} gravados antes da interrupção; os nomes ficam
+        # reservados para que outros arquivos não recebam os mesmos destinos
+        self._gravados = self.diario.saidas() if self.diario is not None else {}
+        self._reservados.update(self._gravados.values())
+
+    def _reservar_destino(self, destino):
+        """
+        Evita que dois arquivos diferentes com o mesmo nome (vindos de subpastas
+        diferentes) disputem o mesmo destino nesta execução. Retorna None se o destino
+        já existir no disco (resultado de uma execução anterior).
+        """
+        base, ext = os.path.splitext(destino)
+        sufixo = 1
+        while destino in self._reservados:
+            destino = f"{base}_{sufixo}{ext}"
+            sufixo += 1
+        self._reservados.add(destino)
+        if self.modo != "Manifesto" and os.path.lexists(destino):
+            return None
+        return destino
+
+    def enviar(self, origem, pasta_grupo, grupo):
+        """Agenda a gravação de 'origem' dentro de base_destino/pasta_grupo."""
+        pasta = os.path.join(self.base_destino, pasta_grupo)
+        destino = self._gravados.get((origem, pasta))
+        if destino is not None and os.path.lexists(destino):
+            self.retomados += 1
+            with self._lock:
+                self.manifesto.append({"grupo": grupo, "origem": origem, "destino": destino})
+            if self.ao_concluir: self.ao_concluir(destino, origem, grupo)
+            return
+        destino = self._reservar_destino(os.path.join(pasta, os.path.basename(origem)))
+        if destino is None:
+            return
+        if self.modo == "Manifesto":
+            self.manifesto.append({"grupo": grupo, "origem": origem, "destino": destino})
+            if self.ao_concluir: self.ao_concluir(None, origem, grupo)
+        elif self.executor is not None:
+            self.executor.submit(self._gravar, origem, destino, grupo, pasta)
+        else:
+            self._gravar(origem, destino, grupo, pasta)
+
+    def _gravar(self, origem, destino, grupo, pasta):
+        inicio, t0 = time.time(), time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            try:
+                if self.modo == "Hardlink":
+                    os.link(origem, destino)
+                elif self.modo == "Symlink":
+                    os.symlink(os.path.abspath(origem), destino)
+                elif self.modo == "Reflink":
+                    _copiar_atomico(reflink, origem, destino)
+                else:
+                    _copiar_atomico(shutil.copy, origem, destino)
+            except OSError:
+                if self.modo == "Copiar":
+                    raise
+                _copiar_atomico(shutil.copy, origem, destino)
+                with self._lock:
+                    self.copias_alternativas += 1
+        except Exception as e:
+            with self._lock:
+                self.erros.append((origem, str(e)))
+            return
+        with self._lock:
+            self.manifesto.append({"grupo": grupo, "origem": origem, "destino": destino})
+        if self.diario is not None: self.diario.registrar_saida(origem, pasta, destino)
+        if self.ao_medir: self.ao_medir(origem, destino, inicio, time.perf_counter() - t0)
+        if self.ao_concluir: self.ao_concluir(destino, origem, grupo)
+
+    def cancelar(self):
+        """Descarta as cópias ainda não iniciadas."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def finalizar(self):
+        """Aguarda as cópias pendentes e, no modo Manifesto, grava os arquivos de manifesto."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.modo == "Manifesto" and self.manifesto:
+            self.gravar_manifesto()
+
+    def gravar_manifesto(self):
+        os.makedirs(self.base_destino, exist_ok=True)
+        por_pessoa = {}
+        for item in self.manifesto:
+            por_pessoa.setdefault(item["grupo"], []).append(item["origem"])
+        with open(os.path.join(self.base_destino, MANIFESTO_JSON), "w", encoding="utf-8") as f:
+            json.dump(por_pessoa, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(self.base_destino, MANIFESTO_CSV), "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["grupo", "origem", "destino"])
+            writer.writeheader()
+            writer.writerows(self.manifesto)
+
+    def resumo(self):
+        partes = []
+        if self.retomados:
+            partes.append(f"{self.retomados} já gravados antes da interrupção")
+        if self.copias_alternativas:
+            partes.append(f"{self.copias_alternativas} copiados (link não suportado)")
+        if self.erros:
+            partes.append(f"{len(self.erros)} erros de gravação")
+        return f" [{', '.join(partes)}]" if partes else ""
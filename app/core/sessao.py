@@ -0,0 +1,87 @@
+# app/core/sessao.py
+
+import numpy as np
+
+from .clustering import grafo_vizinhanca, dbscan_de_grafo, escolher_motor, LIMITE_MOTOR_PARTICIONADO
+
+class SessaoAgrupamento:
+    """
+    Mantém as codificações da última análise de agrupamento e um grafo esparso de
+    vizinhança calculado no maior raio (eps) disponível. Com isso, uma mudança de
+    sensibilidade ou do mínimo de fotos por grupo reagrupa os rostos sem decodificar
+    nem codificar as imagens novamente.
+    A partir de LIMITE_MOTOR_PARTICIONADO rostos, o número de arestas cresce demais com
+    o raio: o grafo é calculado só no eps inicial e refeito quando um eps maior é pedido.
+    """
+    def __init__(self, tabela, raio_maximo, pasta_origem, motor="Automático", eps_inicial=None):
+        self.tabela = tabela
+        self.raio_maximo = raio_maximo
+        self.pasta_origem = pasta_origem
+        self.motor = escolher_motor(motor, len(tabela), tabela.em_disco)
+        self.raio_grafo = raio_maximo
+        if eps_inicial is not None and len(tabela) >= LIMITE_MOTOR_PARTICIONADO:
+            self.raio_grafo = min(eps_inicial, raio_maximo)
+        self.grafo = grafo_vizinhanca(tabela.encodings, self.raio_grafo, self.motor)
+        self.labels = None
+        self.eps = None
+        self.min_samples = None
+        self._ordem_caminhos = None
+        self._chaves_caminho = None
+
+    def precisa_recalcular(self, eps):
+        """True se agrupar(eps, ...) vai refazer o grafo (demorado com muitos rostos)."""
+        return eps > self.raio_grafo
+
+    def agrupar(self, eps, min_samples, progresso=None):
+        """
+        Executa o DBSCAN sobre o grafo pré-calculado. eps não pode exceder raio_maximo;
+        se for maior que o raio do grafo atual, o grafo é refeito com raio eps e
+        progresso(fração), se informado, acompanha o cálculo.
+        """
+        if eps > self.raio_maximo:
+            raise ValueError(f"eps {eps} maior que o raio máximo da sessão ({self.raio_maximo}).")
+        if self.precisa_recalcular(eps):
+            self.grafo = grafo_vizinhanca(self.tabela.encodings, eps, self.motor, progresso)
+            self.raio_grafo = eps
+        if self.labels is not None and (eps, min_samples) == (self.eps, self.min_samples):
+            return self.labels
+        self.labels = dbscan_de_grafo(self.grafo, eps, min_samples)
+        self.eps, self.min_samples = eps, min_samples
+        return self.labels
+
+    def grupos(self):
+        """
+        Retorna ({labelID: [caminhos]}, [caminhos isolados]) para o último agrupamento.
+        Os caminhos de cada grupo não se repetem. Grupos, caminhos e isolados vêm em ordem
+        de caminho, e não na ordem em que os rostos chegaram dos workers, para que a mesma
+        análise (inclusive retomada) gere sempre as mesmas pastas Pessoa_NN.
+        """
+        if not len(self.labels):
+            return {}, []
+        caminhos = self.tabela.caminhos
+        if self._chaves_caminho is None:
+            # Posição do caminho de cada rosto na ordem alfabética; a tabela não muda na sessão
+            self._ordem_caminhos = np.array(sorted(range(len(caminhos)), key=caminhos.__getitem__), dtype=np.intp)
+            posicao = np.empty(len(caminhos), dtype=np.intp)
+            posicao[self._ordem_caminhos] = np.arange(len(caminhos))
+            self._chaves_caminho = posicao[self.tabela.indice_caminho]
+        ordem_caminhos = self._ordem_caminhos
+        # Uma única ordenação por (label, caminho), em vez de um np.where por label
+        labels = np.asarray(self.labels)
+        chaves = self._chaves_caminho
+        ordem = np.lexsort((chaves, labels))
+        labels, chaves = labels[ordem], chaves[ordem]
+        # Vários rostos da mesma foto no mesmo grupo contam uma vez só
+        novos = np.ones(len(labels), dtype=bool)
+        novos[1:] = (labels[1:] != labels[:-1]) | (chaves[1:] != chaves[:-1])
+        labels, chaves = labels[novos], chaves[novos]
+        cortes = np.flatnonzero(np.diff(labels)) + 1
+        por_label, isolados = [], []
+        for inicio, fim in zip(np.r_[0, cortes], np.r_[cortes, len(labels)]):
+            nomes = [caminhos[i] for i in ordem_caminhos[chaves[inicio:fim]].tolist()]
+            if labels[inicio] == -1:
+                isolados = nomes
+            else:
+                por_label.append(nomes)
+        por_label.sort()
+        return dict(enumerate(por_label)), isolados
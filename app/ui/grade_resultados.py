@@ -0,0 +1,250 @@
+# app/ui/grade_resultados.py
+
+import os
+import sys
+import bisect
+import tkinter as tk
+
+import customtkinter as ctk
+from PIL import Image
+
+ALTURA_CABECALHO = 44
+ESPACAMENTO = 10
+# Tamanho do card além da miniatura: bordas, margens e o nome do arquivo
+ALTURA_EXTRA_CARD = 46
+LARGURA_EXTRA_CARD = 14
+# Linhas criadas acima e abaixo da área visível, para a rolagem não mostrar buracos
+LINHAS_EXTRAS = 2
+# Posição dos widgets livres (fora da área visível do canvas)
+_FORA_DA_TELA = (-10000, -10000)
+
+class CardMiniatura(ctk.CTkFrame):
+    """Card reaproveitável: a grade troca o arquivo exibido em vez de recriar o widget."""
+    def __init__(self, master, tamanho, ao_clicar, ao_duplo_clique, ao_menu):
+        super().__init__(master, border_width=2, border_color="gray50")
+        self.caminho = None
+        self.tamanho = tamanho
+        # Espaço reservado exibido até a miniatura ficar pronta
+        self._reservado = ctk.CTkImage(Image.new("RGB", (tamanho, tamanho), (64, 64, 64)), size=(tamanho, tamanho))
+        self.lbl_img = ctk.CTkLabel(self, image=self._reservado, text="...", width=tamanho, height=tamanho, wraplength=tamanho)
+        self.lbl_img.pack(padx=5, pady=5)
+        self.lbl_name = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=10), width=tamanho)
+        self.lbl_name.pack(padx=5, pady=(0, 5), fill="x")
+        for widget in [self, self.lbl_img, self.lbl_name]:
+            widget.bind("<Button-1>", lambda e: ao_clicar(e, self.caminho))
+            widget.bind("<Double-Button-1>", lambda e: ao_duplo_clique(self.caminho))
+            widget.bind("<Button-3>", lambda e: ao_menu(e, self.caminho))
+
+    def exibir(self, caminho, selecionado, imagem):
+        self.caminho = caminho
+        # O nome é encurtado para o card não ficar mais largo que a célula da grade
+        nome = os.path.basename(caminho)
+        limite = max(8, self.tamanho // 7)
+        self.lbl_name.configure(text=nome if len(nome) <= limite else nome[:limite - 1] + "…")
+        self.marcar(selecionado)
+        if imagem is None:
+            self.lbl_img.configure(image=self._reservado, text="...")
+        else:
+            self.mostrar_miniatura(imagem)
+
+    def marcar(self, selecionado):
+        self.configure(border_color=ctk.ThemeManager.theme["CTkButton"]["fg_color"][1] if selecionado else "gray50")
+
+    def mostrar_miniatura(self, imagem):
+        escala = self.tamanho / max(imagem.width, imagem.height)
+        tamanho = (max(1, round(imagem.width * escala)), max(1, round(imagem.height * escala)))
+        ctk_img = ctk.CTkImage(light_image=imagem, dark_image=imagem, size=tamanho)
+        self.lbl_img.configure(image=ctk_img, text="")
+
+    def mostrar_erro(self):
+        self.lbl_img.configure(image=self._reservado, text=f"Erro ao carregar\n{os.path.basename(self.caminho)}")
+
+class GradeResultados(ctk.CTkFrame):
+    """
+    Grade virtualizada dos resultados, agrupada por pessoa. Só existem widgets para as
+    linhas visíveis (mais LINHAS_EXTRAS acima e abaixo); ao rolar, os cards que saem
+    da tela são reaproveitados para os que entram. A posição de cada linha é calculada
+    a partir dos dados, então novos resultados apenas recalculam o layout (números) e
+    reposicionam os cards visíveis, sem recriar a grade.
+    'grupos' é o dicionário {grupo: [caminhos]} da janela principal, lido a cada layout.
+    """
+    def __init__(self, master, miniaturas, ao_clicar, ao_duplo_clique, ao_menu, tamanho=120, titulo="", texto_vazio=""):
+        super().__init__(master)
+        self.miniaturas = miniaturas
+        self._callbacks = (ao_clicar, ao_duplo_clique, ao_menu)
+        self.tamanho = tamanho
+        self.grupos = {}
+        self.selecionados = set()
+        self.texto_vazio = texto_vazio
+
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        ctk.CTkLabel(self, text=titulo).grid(row=0, column=0, columnspan=2, sticky="ew")
+        fundo = self._apply_appearance_mode(ctk.ThemeManager.theme["CTkFrame"]["fg_color"])
+        self.canvas = tk.Canvas(self, highlightthickness=0, bg=fundo, yscrollincrement=1)
+        self.canvas.grid(row=1, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._rolar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+
+        # Layout: posições y de cada linha, em ordem crescente
+        self._linhas = []   # ("cabecalho", nome) ou ("fotos", nome, [caminhos])
+        self._topos = []
+        self._colunas = 1
+        # Widgets em uso (chave -> (widget, item do canvas)) e livres para reaproveitar.
+        # Os cards são chaveados por (grupo, caminho): a mesma foto pode estar em vários grupos
+        self._cards = {}
+        self._cabecalhos = {}
+        self._cards_livres = []
+        self._cabecalhos_livres = []
+        self._texto_vazio_id = None
+        self._layout_agendado = None
+
+        self.canvas.bind("<Configure>", lambda e: self.agendar_layout())
+        self.bind_all("<MouseWheel>", self._ao_rolar_mouse, add="+")
+        self.bind_all("<Button-4>", self._ao_rolar_mouse, add="+")
+        self.bind_all("<Button-5>", self._ao_rolar_mouse, add="+")
+
+    # --- Dados ---
+    def definir_grupos(self, grupos):
+        self.grupos = grupos
+        self.canvas.yview_moveto(0)
+        self.agendar_layout()
+
+    def definir_tamanho(self, tamanho):
+        tamanho = int(tamanho)
+        if tamanho == self.tamanho:
+            return
+        self.tamanho = tamanho
+        # Os cards têm o tamanho fixo da miniatura; os poucos existentes são recriados
+        for card, item in list(self._cards.values()):
+            self.canvas.delete(item)
+            card.destroy()
+        for card, item in self._cards_livres:
+            self.canvas.delete(item)
+            card.destroy()
+        self._cards.clear()
+        self._cards_livres.clear()
+        self.agendar_layout()
+
+    def agendar_layout(self):
+        """Agrupa várias alterações seguidas em um único recálculo do layout."""
+        if self._layout_agendado is None:
+            self._layout_agendado = self.after(50, self._calcular_layout)
+
+    def atualizar_selecao(self, selecionados):
+        self.selecionados = selecionados
+        for card, _ in self._cards.values():
+            card.marcar(card.caminho in selecionados)
+
+    def aplicar_miniatura(self, caminho, imagem):
+        for card, _ in self._cards.values():
+            if card.caminho != caminho:
+                continue
+            if imagem is None:
+                card.mostrar_erro()
+            else:
+                card.mostrar_miniatura(imagem)
+
+    # --- Layout ---
+    def _altura_linha(self):
+        return self.tamanho + ALTURA_EXTRA_CARD + ESPACAMENTO
+
+    def _calcular_layout(self):
+        self._layout_agendado = None
+        largura = max(1, self.canvas.winfo_width())
+        self._colunas = max(1, largura // (self.tamanho + LARGURA_EXTRA_CARD + ESPACAMENTO))
+        self._linhas, self._topos = [], []
+        y = 0
+        altura_linha = self._altura_linha()
+        for nome, caminhos in sorted(self.grupos.items()):
+            if not caminhos:
+                continue
+            self._linhas.append(("cabecalho", nome))
+            self._topos.append(y)
+            y += ALTURA_CABECALHO
+            for inicio in range(0, len(caminhos), self._colunas):
+                self._linhas.append(("fotos", nome, caminhos[inicio:inicio + self._colunas]))
+                self._topos.append(y)
+                y += altura_linha
+        self.canvas.configure(scrollregion=(0, 0, largura, max(y, self.canvas.winfo_height())))
+        self._mostrar_texto_vazio(not self._linhas)
+        self._renderizar()
+
+    def _mostrar_texto_vazio(self, vazio):
+        if vazio and self._texto_vazio_id is None:
+            self._texto_vazio_id = self.canvas.create_text(20, 20, anchor="nw", text=self.texto_vazio, fill="gray", font=("", 16))
+        elif not vazio and self._texto_vazio_id is not None:
+            self.canvas.delete(self._texto_vazio_id)
+            self._texto_vazio_id = None
+
+    def _renderizar(self):
+        """Posiciona widgets apenas nas linhas visíveis, reaproveitando os que saíram da tela."""
+        topo = self.canvas.canvasy(0)
+        fundo = topo + self.canvas.winfo_height()
+        margem = LINHAS_EXTRAS * self._altura_linha()
+        primeira = max(0, bisect.bisect_right(self._topos, topo - margem) - 1)
+        ultima = bisect.bisect_right(self._topos, fundo + margem)
+
+        visiveis_cards, visiveis_cabecalhos = {}, {}
+        largura_celula = self.tamanho + LARGURA_EXTRA_CARD + ESPACAMENTO
+        for linha, y in zip(self._linhas[primeira:ultima], self._topos[primeira:ultima]):
+            if linha[0] == "cabecalho":
+                visiveis_cabecalhos[linha[1]] = y + 15
+            else:
+                for coluna, caminho in enumerate(linha[2]):
+                    visiveis_cards[(linha[1], caminho)] = (coluna * largura_celula + ESPACAMENTO // 2, y + ESPACAMENTO // 2)
+
+        for chave in [c for c in self._cards if c not in visiveis_cards]:
+            card, item = self._cards.pop(chave)
+            self.canvas.coords(item, *_FORA_DA_TELA)
+            self._cards_livres.append((card, item))
+        for nome in [n for n in self._cabecalhos if n not in visiveis_cabecalhos]:
+            lbl, item = self._cabecalhos.pop(nome)
+            self.canvas.coords(item, *_FORA_DA_TELA)
+            self._cabecalhos_livres.append((lbl, item))
+
+        for nome, y in visiveis_cabecalhos.items():
+            if nome not in self._cabecalhos:
+                if self._cabecalhos_livres:
+                    lbl, item = self._cabecalhos_livres.pop()
+                else:
+                    lbl = ctk.CTkLabel(self.canvas, font=ctk.CTkFont(size=16, weight="bold"), anchor="w")
+                    item = self.canvas.create_window(0, 0, window=lbl, anchor="nw")
+                lbl.configure(text=nome)
+                self._cabecalhos[nome] = (lbl, item)
+            lbl, item = self._cabecalhos[nome]
+            self.canvas.coords(item, 5, y)
+
+        for chave, (x, y) in visiveis_cards.items():
+            if chave not in self._cards:
+                if self._cards_livres:
+                    card, item = self._cards_livres.pop()
+                else:
+                    card = CardMiniatura(self.canvas, self.tamanho, *self._callbacks)
+                    item = self.canvas.create_window(0, 0, window=card, anchor="nw")
+                caminho = chave[1]
+                card.exibir(caminho, caminho in self.selecionados, self.miniaturas.solicitar(caminho, self.tamanho))
+                self._cards[chave] = (card, item)
+            card, item = self._cards[chave]
+            self.canvas.coords(item, x, y)
+
+    # --- Rolagem ---
+    def _rolar(self, *args):
+        self.canvas.yview(*args)
+        self._renderizar()
+
+    def _ao_rolar_mouse(self, event):
+        # bind_all recebe a roda do mouse de toda a janela; só rola se o ponteiro estiver na grade
+        if not str(event.widget).startswith(str(self.canvas)):
+            return
+        if event.num == 4:
+            passo = -60
+        elif event.num == 5:
+            passo = 60
+        elif sys.platform == "darwin":
+            passo = -event.delta * 10
+        else:
+            passo = -event.delta // 2
+        self.canvas.yview_scroll(int(passo), "units")
+        self._renderizar()
@@ -4,13 +4,24 @@ import os
 import shutil
 import threading
 import json
+import queue
 import subprocess
 import sys
 from PIL import Image, ImageTk
 
-from ..core.processing import ProcessingEngine
+from ..core.processing import ProcessingEngine, EVENTO_STATUS, EVENTO_RESULTADO, EVENTO_PREVIA, EVENTO_ERRO, EVENTO_FIM
+from ..core.config import ConfiguracaoAnalise, MAPEAMENTO_DOWNSCALE
+from ..core.clustering import MOTORES_AGRUPAMENTO
+from ..core.saida import MODOS_SAIDA
+from .miniaturas import ServicoMiniaturas
+from .grade_resultados import GradeResultados
 
 CONFIG_FILE = "fotofinder_config.json"
+# Intervalo (ms) em que a UI lê os eventos do engine e das miniaturas
+INTERVALO_EVENTOS_MS = 50
+# Limite de eventos tratados por leitura, para a janela continuar respondendo
+MAX_EVENTOS_POR_LEITURA = 2000
+EVENTO_MINIATURA = "miniatura"  # (caminho, imagem) - miniatura pronta no ServicoMiniaturas
 
 class PhotoFinderApp(ctk.CTk):
     def __init__(self):
@@ -20,25 +31,41 @@ class PhotoFinderApp(ctk.CTk):
         ctk.set_appearance_mode("Dark")
         ctk.set_default_color_theme("blue")
 
-        self.engine = ProcessingEngine(self)
-        self.stop_event = threading.Event()
+        # Eventos de outras threads (engine, cópias, miniaturas) passam por esta fila,
+        # lida pela thread da UI em intervalos fixos
+        self.fila_eventos = queue.SimpleQueue()
+        self._drenar_after_id = None
+        self.engine = ProcessingEngine(self._ao_evento_engine)
+        self.miniaturas = ServicoMiniaturas(lambda caminho, imagem: self.fila_eventos.put((EVENTO_MINIATURA, (caminho, imagem))))
         self.processing_thread = None
 
         # --- Variáveis de Estado da UI e Resultados ---
         self.results_data = {}  # Dicionário para armazenar os resultados: {'Grupo': ['path1', 'path2']}
-        self.thumbnail_widgets = {} # Mapeia file_path para seu widget de card
+        self.itens_resultados = set() # Pares (grupo, file_path) já exibidos, para evitar duplicatas
         self.selected_items = set() # Conjunto de file_paths selecionados
+        self.resultados_em_previa = False # True quando a grade mostra os originais de uma prévia de agrupamento
+        self._reagrupar_after_id = None
         self.thumbnail_size = ctk.IntVar(value=120)
         
         self.min_fotos_var = ctk.StringVar(value="2")
         self.downscale_var = ctk.StringVar(value="Rápido")
         self.precisao_var = ctk.StringVar(value="Equilibrado")
+        self.multiplas_pessoas_var = ctk.BooleanVar(value=False)
+        self.motor_agrupamento_var = ctk.StringVar(value="Automático")
+        self.hibrido_var = ctk.BooleanVar(value=False)
+        self.rajadas_var = ctk.BooleanVar(value=False)
+        self.prefiltro_var = ctk.BooleanVar(value=False)
+        self.usar_indice_var = ctk.BooleanVar(value=False)
+        self.recursivo_var = ctk.BooleanVar(value=True)
+        self.excluir_var = ctk.StringVar(value="")
+        self.modo_saida_var = ctk.StringVar(value="Copiar")
         
         self.load_settings()
         self.create_widgets()
         self.apply_loaded_settings()
         
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self._drenar_after_id = self.after(INTERVALO_EVENTOS_MS, self._drenar_eventos)
         self.on_mode_change()
 
     def create_widgets(self):
@@ -48,6 +75,7 @@ class PhotoFinderApp(ctk.CTk):
 
         self.create_sidebar()
         self.create_main_content_area()
+        self.min_fotos_var.trace_add("write", self.agendar_reagrupamento)
 
     def create_sidebar(self):
         sidebar_frame = ctk.CTkFrame(self, width=350, corner_radius=0)
@@ -74,28 +102,43 @@ class PhotoFinderApp(ctk.CTk):
         self.btn_selecionar_pasta.pack(fill="x", padx=10)
         self.lbl_caminho_origem = ctk.CTkLabel(path_frame, text="Nenhuma pasta selecionada", font=ctk.CTkFont(size=10), wraplength=300)
         self.lbl_caminho_origem.pack(fill="x", padx=10, pady=(0, 5))
+        self.chk_recursivo = ctk.CTkCheckBox(path_frame, text="Incluir subpastas", variable=self.recursivo_var, font=ctk.CTkFont(size=11))
+        self.chk_recursivo.pack(padx=10, pady=(0, 5), anchor="w")
+        self.entry_excluir = ctk.CTkEntry(path_frame, textvariable=self.excluir_var, placeholder_text="Ignorar (ex.: *_thumb*, Lixeira)", font=ctk.CTkFont(size=11))
+        self.entry_excluir.pack(fill="x", padx=10, pady=(0, 5))
+        self.btn_indexar = ctk.CTkButton(path_frame, text="📚 Indexar Biblioteca", command=self.indexar_biblioteca, fg_color="transparent", border_width=1)
+        self.btn_indexar.pack(fill="x", padx=10, pady=(0, 5))
         self.btn_selecionar_destino = ctk.CTkButton(path_frame, text="📂 Pasta de Destino...", command=self.selecionar_pasta_destino)
         self.btn_selecionar_destino.pack(fill="x", padx=10, pady=(5,0))
         self.lbl_caminho_destino = ctk.CTkLabel(path_frame, text="Nenhuma pasta selecionada", font=ctk.CTkFont(size=10), wraplength=300)
-        self.lbl_caminho_destino.pack(fill="x", padx=10, pady=(0, 10))
+        self.lbl_caminho_destino.pack(fill="x", padx=10, pady=(0, 5))
+        self.seg_button_modo_saida = ctk.CTkSegmentedButton(path_frame, variable=self.modo_saida_var, values=MODOS_SAIDA, font=ctk.CTkFont(size=10))
+        self.seg_button_modo_saida.pack(fill="x", padx=10, pady=(0, 10))
 
         settings_frame = ctk.CTkFrame(sidebar_frame)
         settings_frame.pack(fill="x", padx=20, pady=10)
         ctk.CTkLabel(settings_frame, text="Configurações da Análise", font=ctk.CTkFont(size=14, weight="bold")).pack(pady=(5, 10))
         ctk.CTkLabel(settings_frame, text="Otimização de Velocidade:", font=ctk.CTkFont(size=12)).pack(padx=10, anchor="w")
-        self.seg_button_downscale = ctk.CTkSegmentedButton(settings_frame, variable=self.downscale_var, values=["Original", "Rápido", "Muito Rápido"])
-        self.seg_button_downscale.pack(fill="x", padx=10, pady=(0, 10))
+        self.seg_button_downscale = ctk.CTkSegmentedButton(settings_frame, variable=self.downscale_var, values=["Original", "Rápido", "Muito Rápido", "Adaptativo"])
+        self.seg_button_downscale.pack(fill="x", padx=10, pady=(0, 5))
+        self.chk_hibrido = ctk.CTkCheckBox(settings_frame, text="Detectar reduzido, codificar na resolução original", variable=self.hibrido_var, font=ctk.CTkFont(size=11))
+        self.chk_hibrido.pack(padx=10, pady=(0, 5), anchor="w")
+        self.chk_rajadas = ctk.CTkCheckBox(settings_frame, text="Reaproveitar fotos repetidas (rajadas)", variable=self.rajadas_var, font=ctk.CTkFont(size=11))
+        self.chk_rajadas.pack(padx=10, pady=(0, 5), anchor="w")
+        self.chk_prefiltro = ctk.CTkCheckBox(settings_frame, text="Pular fotos sem rostos (pré-filtro rápido)", variable=self.prefiltro_var, font=ctk.CTkFont(size=11))
+        self.chk_prefiltro.pack(padx=10, pady=(0, 10), anchor="w")
         ctk.CTkLabel(settings_frame, text="Sensibilidade da Análise:", font=ctk.CTkFont(size=12)).pack(padx=10, anchor="w")
-        self.seg_button_precisao = ctk.CTkSegmentedButton(settings_frame, variable=self.precisao_var, values=["Preciso", "Equilibrado", "Abrangente"])
+        self.seg_button_precisao = ctk.CTkSegmentedButton(settings_frame, variable=self.precisao_var, values=["Preciso", "Equilibrado", "Abrangente"], command=self.agendar_reagrupamento)
         self.seg_button_precisao.pack(fill="x", padx=10, pady=(0, 10))
         
         self.btn_action = ctk.CTkButton(sidebar_frame, text="🚀 Iniciar Análise", command=self.iniciar_analise, height=45, font=ctk.CTkFont(size=16, weight="bold"))
         self.btn_action.pack(side="bottom", fill="x", padx=20, pady=20)
         
         self.settings_widgets = [
-            self.mode_selector, self.btn_selecionar_pasta, self.btn_selecionar_destino,
-            self.seg_button_downscale, self.seg_button_precisao, self.entry_min_fotos,
-            self.btn_selecionar_foto, self.entry_nome_pessoa, self.btn_selecionar_pasta_ref
+            self.mode_selector, self.btn_selecionar_pasta, self.chk_recursivo, self.entry_excluir, self.btn_indexar, self.btn_selecionar_destino, self.seg_button_modo_saida,
+            self.seg_button_downscale, self.chk_hibrido, self.chk_rajadas, self.chk_prefiltro, self.seg_button_precisao, self.entry_min_fotos,
+            self.option_motor_agrupamento, self.btn_selecionar_foto, self.entry_nome_pessoa, self.btn_selecionar_pasta_ref,
+            self.chk_multiplas_pessoas, self.chk_indice_individual, self.chk_indice_lote
         ]
 
     def create_main_content_area(self):
@@ -108,12 +151,11 @@ class PhotoFinderApp(ctk.CTk):
         toolbar = ctk.CTkFrame(main_frame, height=40)
         toolbar.grid(row=0, column=0, sticky="ew", pady=(0, 5))
         ctk.CTkLabel(toolbar, text="Zoom:").pack(side="left", padx=(10, 5))
-        ctk.CTkSlider(toolbar, from_=60, to=250, variable=self.thumbnail_size, command=self.redraw_results_grid).pack(side="left", fill="x", expand=True, padx=5)
+        ctk.CTkSlider(toolbar, from_=60, to=250, variable=self.thumbnail_size, command=lambda valor: self.grade.definir_tamanho(valor)).pack(side="left", fill="x", expand=True, padx=5)
 
-        self.scroll_frame = ctk.CTkScrollableFrame(main_frame, label_text="Resultados da Análise")
-        self.scroll_frame.grid(row=1, column=0, sticky="nsew")
-        self.lbl_no_results = ctk.CTkLabel(self.scroll_frame, text="Os resultados da análise aparecerão aqui.", font=ctk.CTkFont(size=16), text_color="gray")
-        self.lbl_no_results.pack(expand=True, padx=20, pady=20)
+        # Grade virtualizada: só cria widgets para as linhas visíveis
+        self.grade = GradeResultados(main_frame, self.miniaturas, self.on_thumbnail_click, self.open_image_viewer, self.show_context_menu, tamanho=self.thumbnail_size.get(), titulo="Resultados da Análise", texto_vazio="Os resultados da análise aparecerão aqui.")
+        self.grade.grid(row=1, column=0, sticky="nsew")
 
         # --- Barra de Status ---
         status_bar = ctk.CTkFrame(main_frame, height=30)
@@ -128,76 +170,9 @@ class PhotoFinderApp(ctk.CTk):
         self.progressbar.grid(row=0, column=2, sticky="e", padx=10, pady=5)
 
     def redraw_results_grid(self, event=None):
-        """Limpa e redesenha toda a grade de resultados com base nos dados e no tamanho do zoom."""
-        for widget in self.scroll_frame.winfo_children():
-            widget.destroy()
-        
-        self.thumbnail_widgets.clear()
-        if not self.results_data:
-            self.lbl_no_results = ctk.CTkLabel(self.scroll_frame, text="Os resultados da análise aparecerão aqui.", font=ctk.CTkFont(size=16), text_color="gray")
-            self.lbl_no_results.pack(expand=True, padx=20, pady=20)
-            return
-            
-        thumb_size = self.thumbnail_size.get()
-        padding = 10
-        # Força a atualização da largura do frame para um cálculo preciso das colunas
-        self.scroll_frame.update_idletasks()
-        frame_width = self.scroll_frame.winfo_width() - 20 # Desconta a barra de rolagem
-        cols = max(1, frame_width // (thumb_size + padding))
-        
-        current_row = 0
-        for group_name, items in sorted(self.results_data.items()):
-            if not items: continue
-
-            # --- Cabeçalho do Grupo ---
-            header = ctk.CTkLabel(self.scroll_frame, text=group_name, font=ctk.CTkFont(size=16, weight="bold"), anchor="w")
-            header.grid(row=current_row, column=0, columnspan=cols, sticky="ew", pady=(15, 5), padx=5)
-            current_row += 1
-            
-            # --- Grade de Miniaturas ---
-            col = 0
-            for file_path in items:
-                card = self.create_thumbnail_card(self.scroll_frame, file_path, thumb_size)
-                card.grid(row=current_row, column=col, padx=padding/2, pady=padding/2)
-                
-                col += 1
-                if col >= cols:
-                    col = 0
-                    current_row += 1
-            current_row += 1 if col == 0 else 2 # Espaçamento extra após o grupo
-        
-    def create_thumbnail_card(self, parent, file_path, size):
-        """Cria um widget 'card' para uma única miniatura."""
-        card_border_color = "gray50"
-        if file_path in self.selected_items:
-            card_border_color = ctk.ThemeManager.theme["CTkButton"]["fg_color"][1]
-
-        card = ctk.CTkFrame(parent, border_width=2, border_color=card_border_color)
-        
-        try:
-            img = Image.open(file_path)
-            img.thumbnail((size, size), Image.Resampling.LANCZOS)
-            ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=(img.width, img.height))
-            
-            lbl_img = ctk.CTkLabel(card, image=ctk_img, text="")
-            lbl_img.pack(padx=5, pady=5)
-            
-            filename = os.path.basename(file_path)
-            lbl_name = ctk.CTkLabel(card, text=filename, font=ctk.CTkFont(size=10))
-            lbl_name.pack(padx=5, pady=(0, 5), fill="x")
-
-            # --- Bindings de Eventos ---
-            for widget in [card, lbl_img, lbl_name]:
-                widget.bind("<Button-1>", lambda e, p=file_path: self.on_thumbnail_click(e, p))
-                widget.bind("<Double-Button-1>", lambda e, p=file_path: self.open_image_viewer(p))
-                widget.bind("<Button-3>", lambda e, p=file_path: self.show_context_menu(e, p))
-                
-        except Exception as e:
-            error_lbl = ctk.CTkLabel(card, text=f"Erro ao carregar\n{os.path.basename(file_path)}", wraplength=size)
-            error_lbl.pack(padx=5, pady=5, expand=True, fill="both")
-        
-        self.thumbnail_widgets[file_path] = card
-        return card
+        """Passa os dados atuais para a grade, que recalcula o layout e mostra só as linhas visíveis."""
+        self.grade.atualizar_selecao(self.selected_items)
+        self.grade.definir_grupos(self.results_data)
 
     # --- Funções de Manipulação de UI ---
     def on_mode_change(self, value=None):
@@ -214,13 +189,16 @@ class PhotoFinderApp(ctk.CTk):
         else:
             self.btn_action.configure(text="🚀 Iniciar Análise", command=self.iniciar_analise, fg_color=ctk.ThemeManager.theme["CTkButton"]["fg_color"], hover_color=ctk.ThemeManager.theme["CTkButton"]["hover_color"])
             for widget in self.settings_widgets: widget.configure(state="normal")
+        self.btn_copiar_grupos.configure(state="normal" if not is_running and self.engine.sessao is not None else "disabled")
             
     # --- Funções de Preparação e Finalização ---
     def preparar_ui_para_busca(self):
-        self.stop_event.clear()
+        self.engine.stop_event.clear()
         self.toggle_analysis_state(is_running=True)
         self.results_data.clear()
+        self.itens_resultados.clear()
         self.selected_items.clear()
+        self.resultados_em_previa = False
         self.update_selection_status()
         self.redraw_results_grid() # Limpa a tela e mostra a mensagem inicial
         self.progressbar.set(0)
@@ -228,52 +206,146 @@ class PhotoFinderApp(ctk.CTk):
     def finalizar_busca(self, mensagem_final):
         self.toggle_analysis_state(is_running=False)
         if mensagem_final: self.lbl_status.configure(text=mensagem_final)
-        self.redraw_results_grid() # Redesenha a grade final com todos os resultados
 
     def parar_busca(self):
-        self.stop_event.set()
+        self.engine.parar()
         self.lbl_status.configure(text="Parando análise... Por favor, aguarde.")
 
-    def adicionar_preview_foto(self, caminho_foto, texto_display):
+    # --- Eventos do ProcessingEngine ---
+    def _ao_evento_engine(self, tipo, *args):
+        """Recebe os eventos na thread de processamento; a UI os lê em _drenar_eventos."""
+        self.fila_eventos.put((tipo, args))
+
+    def _drenar_eventos(self):
+        """
+        Trata de uma vez os eventos acumulados desde a última leitura. Das atualizações
+        de status só a mais recente é aplicada; os resultados entram nos dados e a grade
+        recalcula o layout uma única vez. Os demais eventos seguem na ordem de chegada.
+        """
+        status = None
+        for _ in range(MAX_EVENTOS_POR_LEITURA):
+            try:
+                tipo, args = self.fila_eventos.get_nowait()
+            except queue.Empty:
+                break
+            if tipo == EVENTO_STATUS:
+                status = args
+            elif tipo in (EVENTO_RESULTADO, EVENTO_MINIATURA):
+                self._tratar_evento_engine(tipo, args)
+            else:
+                # Prévia, erro e fim devem ver o status e os resultados anteriores a eles
+                if status is not None:
+                    self.atualizar_status(*status)
+                    status = None
+                self._tratar_evento_engine(tipo, args)
+        if status is not None:
+            self.atualizar_status(*status)
+        self._drenar_after_id = self.after(INTERVALO_EVENTOS_MS, self._drenar_eventos)
+
+    def _tratar_evento_engine(self, tipo, args):
+        if tipo == EVENTO_STATUS: self.atualizar_status(*args)
+        elif tipo == EVENTO_MINIATURA: self.grade.aplicar_miniatura(*args)
+        elif tipo == EVENTO_RESULTADO:
+            caminho_destino, caminho_origem, grupo = args
+            if caminho_destino is None:
+                # Modo Manifesto: nada foi gravado, a grade mostra os originais (sem exclusão)
+                self.resultados_em_previa = True
+            self.adicionar_preview_foto(caminho_destino or caminho_origem, grupo)
+        elif tipo == EVENTO_PREVIA: self.mostrar_previa_grupos(*args)
+        elif tipo == EVENTO_ERRO: messagebox.showerror(*args)
+        elif tipo == EVENTO_FIM: self.finalizar_busca(*args)
+
+    def montar_configuracao(self):
+        """Lê os widgets e monta a configuração usada pelo ProcessingEngine."""
+        try:
+            min_fotos_por_grupo = int(self.min_fotos_var.get())
+        except (ValueError, TypeError):
+            min_fotos_por_grupo = 2
+        return ConfiguracaoAnalise(
+            pasta_origem=getattr(self, 'caminho_pasta_fotos', None),
+            pasta_destino=getattr(self, 'caminho_pasta_destino', None),
+            precisao=self.precisao_var.get(),
+            min_fotos_por_grupo=min_fotos_por_grupo,
+            downscale_factor=self.get_downscale_factor(),
+            hibrido=bool(self.hibrido_var.get()),
+            agrupar_rajadas=bool(self.rajadas_var.get()),
+            prefiltro=bool(self.prefiltro_var.get()),
+            motor_agrupamento=self.motor_agrupamento_var.get(),
+            recursivo=bool(self.recursivo_var.get()),
+            excluir=tuple(p.strip() for p in self.excluir_var.get().split(",") if p.strip()),
+            modo_saida=self.modo_saida_var.get(),
+            foto_referencia=getattr(self, 'caminho_foto_referencia', None),
+            nome_pessoa=self.entry_nome_pessoa.get().strip(),
+            pasta_referencias=getattr(self, 'caminho_pasta_referencia', None),
+            multiplas_pessoas=bool(self.multiplas_pessoas_var.get()),
+            usar_indice=bool(self.usar_indice_var.get()),
+        )
+
+    def mostrar_previa_grupos(self, grupos, isolados):
+        """Exibe os grupos da sessão de agrupamento (arquivos originais, ainda não copiados)."""
+        self.results_data = {f"Pessoa_{labelID + 1:02d}": list(paths) for labelID, paths in grupos.items()}
+        if isolados:
+            self.results_data["Isolados"] = list(isolados)
+        self.selected_items.clear()
+        self.update_selection_status()
+        self.resultados_em_previa = True
+        # results_data é um dicionário novo: a grade precisa recebê-lo
+        self.redraw_results_grid()
+
+    def agendar_reagrupamento(self, *args):
+        """Aguarda o usuário parar de editar antes de reagrupar a sessão atual."""
+        if self._reagrupar_after_id is not None:
+            self.after_cancel(self._reagrupar_after_id)
+        self._reagrupar_after_id = self.after(250, self.reagrupar_sessao)
+
+    def reagrupar_sessao(self):
+        self._reagrupar_after_id = None
+        if self.engine.sessao is None or self.mode_selector.get() != "Agrupar": return
+        if self.processing_thread and self.processing_thread.is_alive(): return
+        if not self.min_fotos_var.get(): return
+        # Na thread de processamento, para não travar a janela; a prévia chega por EVENTO_PREVIA
+        self.toggle_analysis_state(is_running=True)
+        self.processing_thread = threading.Thread(target=self.engine.reagrupar, args=(self.montar_configuracao(),), daemon=True)
+        self.processing_thread.start()
+
+    def copiar_grupos(self):
+        if self.engine.sessao is None: return
+        if not messagebox.askyesno("Copiar Grupos", "Copiar os arquivos de acordo com os grupos exibidos?"): return
+        self.preparar_ui_para_busca()
+        self.processing_thread = threading.Thread(target=self.engine.copiar_grupos, args=(self.montar_configuracao(),), daemon=True)
+        self.processing_thread.start()
+
+    def adicionar_preview_foto(self, caminho_foto, grupo):
         """Adiciona o resultado aos dados e atualiza a UI de forma otimizada."""
-        # 'Pessoa_01' from "path -> Pessoa_01"
-        group_name = texto_display.split(" -> ")[-1].replace("/", "_") 
-        if group_name not in self.results_data:
-            self.results_data[group_name] = []
-        
-        if caminho_foto not in self.results_data[group_name]:
-            self.results_data[group_name].append(caminho_foto)
-        
-        # Para evitar sobrecarga, redesenha a grade a cada X itens.
-        total_items = sum(len(v) for v in self.results_data.values())
-        if total_items % 10 == 1:
-             self.redraw_results_grid()
+        # 'Isolados_Rosto_001' from "Isolados/Rosto_001"
+        group_name = grupo.replace("/", "_")
+        if (group_name, caminho_foto) in self.itens_resultados:
+            return
+        self.itens_resultados.add((group_name, caminho_foto))
+        self.results_data.setdefault(group_name, []).append(caminho_foto)
+        # A grade só recalcula as posições (uma vez para vários resultados seguidos)
+        self.grade.agendar_layout()
 
     # --- Lógica de Interação com a Grade ---
     def on_thumbnail_click(self, event, file_path):
         ctrl_pressed = (event.state & 0x0004) != 0
-        card = self.thumbnail_widgets.get(file_path)
-        if not card: return
+        if file_path is None: return
 
         if not ctrl_pressed: # Clique simples, sem Ctrl
             # Se o item clicado for o único selecionado, deseleciona-o. Senão, seleciona apenas ele.
             if len(self.selected_items) == 1 and file_path in self.selected_items:
                 self.selected_items.clear()
-                card.configure(border_color="gray50")
             else:
-                for path in self.selected_items:
-                    if path in self.thumbnail_widgets: self.thumbnail_widgets[path].configure(border_color="gray50")
                 self.selected_items.clear()
                 self.selected_items.add(file_path)
-                card.configure(border_color=ctk.ThemeManager.theme["CTkButton"]["fg_color"][1])
         else: # Clique com Ctrl
             if file_path in self.selected_items:
                 self.selected_items.remove(file_path)
-                card.configure(border_color="gray50")
             else:
                 self.selected_items.add(file_path)
-                card.configure(border_color=ctk.ThemeManager.theme["CTkButton"]["fg_color"][1])
         
+        # Só os cards visíveis existem; a grade atualiza as bordas deles
+        self.grade.atualizar_selecao(self.selected_items)
         self.update_selection_status()
 
     def update_selection_status(self):
@@ -304,8 +376,10 @@ class PhotoFinderApp(ctk.CTk):
         label_excluir = f"Excluir Cópia" if num_selected == 1 else f"Excluir {num_selected} Cópias"
         
         menu.add_command(label=label_abrir, command=self.abrir_local_selecionado)
-        menu.add_separator()
-        menu.add_command(label=label_excluir, command=self.excluir_copia_selecionada)
+        # Na prévia do agrupamento os itens são os arquivos originais, que nunca devem ser excluídos
+        if not self.resultados_em_previa:
+            menu.add_separator()
+            menu.add_command(label=label_excluir, command=self.excluir_copia_selecionada)
         menu.tk_popup(event.x_root, event.y_root)
         
     def abrir_local_selecionado(self):
@@ -317,7 +391,7 @@ class PhotoFinderApp(ctk.CTk):
 
     def excluir_copia_selecionada(self):
         num_selected = len(self.selected_items)
-        if num_selected == 0: return
+        if num_selected == 0 or self.resultados_em_previa: return
         
         msg = f"Tem certeza que deseja excluir a cópia selecionada?" if num_selected == 1 else f"Tem certeza que deseja excluir as {num_selected} cópias selecionadas?"
         if messagebox.askyesno("Confirmar Exclusão", msg):
@@ -325,15 +399,17 @@ class PhotoFinderApp(ctk.CTk):
             for file_path in items_to_delete:
                 try:
                     os.remove(file_path)
-                    widget = self.thumbnail_widgets.pop(file_path, None)
-                    if widget: widget.destroy()
                     self.selected_items.remove(file_path)
                     # Remove o dado da fonte para não reaparecer
                     for group in self.results_data:
                         if file_path in self.results_data[group]:
                             self.results_data[group].remove(file_path)
+                            self.itens_resultados.discard((group, file_path))
                 except Exception as e:
                     messagebox.showerror("Erro", f"Não foi possível excluir o arquivo: {e}")
+            # A grade reposiciona os cards restantes, sem deixar buracos
+            self.grade.atualizar_selecao(self.selected_items)
+            self.grade.agendar_layout()
             self.update_selection_status()
 
     def iniciar_analise(self):
@@ -360,9 +436,16 @@ class PhotoFinderApp(ctk.CTk):
         
         if target_function:
             self.preparar_ui_para_busca()
-            self.processing_thread = threading.Thread(target=target_function, daemon=True)
+            self.processing_thread = threading.Thread(target=target_function, args=(self.montar_configuracao(),), daemon=True)
             self.processing_thread.start()
             
+    def indexar_biblioteca(self):
+        if not getattr(self, 'caminho_pasta_fotos', None):
+            messagebox.showerror("Campos Incompletos", "Por favor, escolha a Pasta de Origem."); return
+        self.preparar_ui_para_busca()
+        self.processing_thread = threading.Thread(target=self.engine.indexar_biblioteca, args=(self.montar_configuracao(),), daemon=True)
+        self.processing_thread.start()
+
     # --- Funções de setup da sidebar (inalteradas, mas necessárias) ---
     def setup_clustering_mode_controls(self, parent_frame):
         parent_frame.pack(fill="x", padx=20)
@@ -370,7 +453,13 @@ class PhotoFinderApp(ctk.CTk):
         validate_cmd = self.register(self._validate_numeric_input)
         self.entry_min_fotos = ctk.CTkEntry(parent_frame, textvariable=self.min_fotos_var, justify="center", validate="key", validatecommand=(validate_cmd, '%P'))
         self.entry_min_fotos.pack(fill="x", pady=(0, 5))
+        ctk.CTkLabel(parent_frame, text="Motor de agrupamento:", font=ctk.CTkFont(size=12)).pack(anchor="w")
+        self.option_motor_agrupamento = ctk.CTkOptionMenu(parent_frame, variable=self.motor_agrupamento_var, values=MOTORES_AGRUPAMENTO)
+        self.option_motor_agrupamento.pack(fill="x", pady=(0, 5))
         ctk.CTkLabel(parent_frame, text="Agrupa todas as pessoas automaticamente. Pode ser demorado.", font=ctk.CTkFont(size=10, slant="italic"), wraplength=300, justify="left").pack(anchor="w")
+        self.btn_copiar_grupos = ctk.CTkButton(parent_frame, text="📥 Copiar Grupos", command=self.copiar_grupos, state="disabled")
+        self.btn_copiar_grupos.pack(fill="x", pady=(5, 0))
+        ctk.CTkLabel(parent_frame, text="Após a análise, ajuste a sensibilidade e o mínimo de fotos para reagrupar instantaneamente.", font=ctk.CTkFont(size=10, slant="italic"), wraplength=300, justify="left").pack(anchor="w")
     
     def setup_individual_mode_controls(self, parent_frame):
         parent_frame.pack(fill="x", padx=20)
@@ -380,6 +469,8 @@ class PhotoFinderApp(ctk.CTk):
         self.preview_foto.pack(fill="x", pady=5)
         self.entry_nome_pessoa = ctk.CTkEntry(parent_frame, placeholder_text="Digite o nome da pessoa")
         self.entry_nome_pessoa.pack(fill="x", pady=5)
+        self.chk_indice_individual = ctk.CTkCheckBox(parent_frame, text="Buscar no índice da biblioteca", variable=self.usar_indice_var)
+        self.chk_indice_individual.pack(anchor="w", pady=(0, 5))
 
     def setup_batch_mode_controls(self, parent_frame):
         parent_frame.pack(fill="x", padx=20)
@@ -387,7 +478,11 @@ class PhotoFinderApp(ctk.CTk):
         self.btn_selecionar_pasta_ref.pack(fill="x")
         self.lbl_caminho_pasta_ref = ctk.CTkLabel(parent_frame, text="Nenhuma pasta selecionada", font=ctk.CTkFont(size=10))
         self.lbl_caminho_pasta_ref.pack()
-        ctk.CTkLabel(parent_frame, text="O nome de cada arquivo na pasta de referência será usado como nome da pessoa.", font=ctk.CTkFont(size=10, slant="italic"), wraplength=300, justify="left").pack(pady=5, anchor="w")
+        ctk.CTkLabel(parent_frame, text="O nome de cada arquivo na pasta de referência será usado como nome da pessoa. Subpastas reúnem várias fotos de uma mesma pessoa.", font=ctk.CTkFont(size=10, slant="italic"), wraplength=300, justify="left").pack(pady=5, anchor="w")
+        self.chk_multiplas_pessoas = ctk.CTkCheckBox(parent_frame, text="Copiar fotos de grupo para cada pessoa", variable=self.multiplas_pessoas_var)
+        self.chk_multiplas_pessoas.pack(anchor="w", pady=(0, 5))
+        self.chk_indice_lote = ctk.CTkCheckBox(parent_frame, text="Buscar no índice da biblioteca", variable=self.usar_indice_var)
+        self.chk_indice_lote.pack(anchor="w", pady=(0, 5))
 
     # --- Funções de utilidade e callbacks (restantes) ---
     def _validate_numeric_input(self, proposed_text):
@@ -398,12 +493,16 @@ class PhotoFinderApp(ctk.CTk):
     def on_closing(self):
         self.save_settings()
         if self.processing_thread and self.processing_thread.is_alive():
-            self.stop_event.set()
+            self.engine.parar()
             self.processing_thread.join()
+        self.engine.fechar()
+        self.miniaturas.fechar()
+        if self._drenar_after_id is not None:
+            self.after_cancel(self._drenar_after_id)
         self.destroy()
 
     def save_settings(self):
-        settings = {"caminho_pasta_fotos": getattr(self, 'caminho_pasta_fotos', None), "caminho_pasta_destino": getattr(self, 'caminho_pasta_destino', None), "nivel_precisao": self.precisao_var.get(), "min_fotos_grupo": self.min_fotos_var.get(), "downscale_option": self.downscale_var.get()}
+        settings = {"caminho_pasta_fotos": getattr(self, 'caminho_pasta_fotos', None), "caminho_pasta_destino": getattr(self, 'caminho_pasta_destino', None), "nivel_precisao": self.precisao_var.get(), "min_fotos_grupo": self.min_fotos_var.get(), "downscale_option": self.downscale_var.get(), "multiplas_pessoas": self.multiplas_pessoas_var.get(), "motor_agrupamento": self.motor_agrupamento_var.get(), "pipeline_hibrido": self.hibrido_var.get(), "reaproveitar_rajadas": self.rajadas_var.get(), "prefiltro": self.prefiltro_var.get(), "buscar_no_indice": self.usar_indice_var.get(), "incluir_subpastas": self.recursivo_var.get(), "ignorar": self.excluir_var.get(), "modo_saida": self.modo_saida_var.get()}
         try:
             with open(CONFIG_FILE, 'w') as f: json.dump(settings, f, indent=4)
         except Exception as e: print(f"Erro ao salvar configurações: {e}")
@@ -416,6 +515,15 @@ class PhotoFinderApp(ctk.CTk):
             self.precisao_var.set(settings.get("nivel_precisao", "Equilibrado"))
             self.min_fotos_var.set(settings.get("min_fotos_grupo", "2"))
             self.downscale_var.set(settings.get("downscale_option", "Rápido"))
+            self.multiplas_pessoas_var.set(settings.get("multiplas_pessoas", False))
+            self.motor_agrupamento_var.set(settings.get("motor_agrupamento", "Automático"))
+            self.hibrido_var.set(settings.get("pipeline_hibrido", False))
+            self.rajadas_var.set(settings.get("reaproveitar_rajadas", False))
+            self.prefiltro_var.set(settings.get("prefiltro", False))
+            self.usar_indice_var.set(settings.get("buscar_no_indice", False))
+            self.recursivo_var.set(settings.get("incluir_subpastas", True))
+            self.excluir_var.set(settings.get("ignorar", ""))
+            self.modo_saida_var.set(settings.get("modo_saida", "Copiar"))
         except (FileNotFoundError, json.JSONDecodeError):
             self.caminho_pasta_fotos, self.caminho_pasta_destino = None, None
 
@@ -424,18 +532,19 @@ class PhotoFinderApp(ctk.CTk):
         if self.caminho_pasta_destino: self.lbl_caminho_destino.configure(text=self.caminho_pasta_destino)
     
     def get_downscale_factor(self):
-        option = self.downscale_var.get()
-        if "Rápido" == option: return 0.5
-        if "Muito Rápido" == option: return 0.25
-        return 1.0
+        return MAPEAMENTO_DOWNSCALE.get(self.downscale_var.get(), 1.0)
         
-    def atualizar_status(self, texto, progresso):
+    def atualizar_status(self, texto, progresso=None):
         self.lbl_status.configure(text=texto)
-        self.progressbar.set(progresso)
+        if progresso is not None: self.progressbar.set(progresso)
 
     def selecionar_pasta_origem(self):
         caminho = filedialog.askdirectory(title="Selecione a pasta com as fotos")
-        if caminho: self.caminho_pasta_fotos = caminho; self.lbl_caminho_origem.configure(text=caminho)
+        if caminho:
+            self.caminho_pasta_fotos = caminho; self.lbl_caminho_origem.configure(text=caminho)
+            # A sessão de agrupamento pertence à pasta anterior
+            self.engine.descartar_sessao()
+            self.btn_copiar_grupos.configure(state="disabled")
 
     def selecionar_pasta_destino(self):
         caminho = filedialog.askdirectory(title="Selecione onde salvar as cópias")
@@ -0,0 +1,99 @@
+# app/ui/miniaturas.py
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from ..core.encoding_cache import CACHE_DIR
+from ..workers.decodificacao import carregar_miniatura
+
+PASTA_MINIATURAS = os.path.join(CACHE_DIR, "miniaturas")
+# As miniaturas são geradas nestes tamanhos e apenas escaladas na exibição,
+# para que o controle de zoom não gere tudo de novo a cada passo
+TAMANHOS_MINIATURA = (96, 160, 256)
+
+def tamanho_miniatura(lado):
+    """Menor tamanho de TAMANHOS_MINIATURA que atende 'lado'."""
+    for tamanho in TAMANHOS_MINIATURA:
+        if lado <= tamanho:
+            return tamanho
+    return TAMANHOS_MINIATURA[-1]
+
+class ServicoMiniaturas:
+    """
+    Gera e guarda as miniaturas da grade de resultados fora da thread da interface.
+    As miniaturas ficam em um LRU em memória, chaveado por (caminho, tamanho), com uma
+    cópia em disco em PASTA_MINIATURAS (chaveada também pelo mtime) para as próximas
+    execuções. solicitar() roda na thread da interface e não toca no disco: responde na
+    hora quando a miniatura já está na memória; senão agenda a geração em um pool de
+    threads, que confere o mtime, e chama ao_pronto(caminho, imagem) quando terminar
+    (imagem None se o arquivo não puder ser lido), a partir da thread do pool.
+    """
+    def __init__(self, ao_pronto, pasta_cache=PASTA_MINIATURAS, capacidade=3000, num_threads=4):
+        self.ao_pronto = ao_pronto
+        self.pasta_cache = pasta_cache
+        self.capacidade = capacidade
+        self._memoria = OrderedDict()
+        self._pendentes = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="miniaturas")
+
+    def _arquivo_disco(self, caminho, tamanho):
+        # O stat fica aqui, na thread do pool: em discos lentos ou de rede ele travaria a interface
+        try:
+            mtime = os.stat(caminho).st_mtime_ns
+        except OSError:
+            mtime = 0
+        nome = hashlib.sha1(f"{caminho}|{mtime}|{tamanho}".encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.pasta_cache, nome[:2], f"{nome}.jpg")
+
+    def _guardar(self, chave, imagem):
+        with self._lock:
+            self._memoria[chave] = imagem
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.capacidade:
+                self._memoria.popitem(last=False)
+
+    def solicitar(self, caminho, lado):
+        """Retorna a miniatura se já estiver na memória; senão agenda a geração e retorna None."""
+        chave = (caminho, tamanho_miniatura(lado))
+        with self._lock:
+            imagem = self._memoria.get(chave)
+            if imagem is not None:
+                self._memoria.move_to_end(chave)
+                return imagem
+            if chave in self._pendentes:
+                return None
+            self._pendentes.add(chave)
+        self._executor.submit(self._gerar, chave)
+        return None
+
+    def _gerar(self, chave):
+        caminho, tamanho = chave
+        arquivo = self._arquivo_disco(caminho, tamanho)
+        imagem = None
+        try:
+            try:
+                imagem = Image.open(arquivo)
+                imagem.load()
+            except (OSError, ValueError):
+                imagem = carregar_miniatura(caminho, tamanho)
+                try:
+                    os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+                    imagem.save(arquivo, "JPEG", quality=85)
+                except OSError:
+                    pass
+            self._guardar(chave, imagem)
+        except Exception:
+            imagem = None
+        finally:
+            with self._lock:
+                self._pendentes.discard(chave)
+        self.ao_pronto(caminho, imagem)
+
+    def fechar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
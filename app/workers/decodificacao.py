@@ -0,0 +1,133 @@
+import io
+from PIL import Image, ExifTags
+import numpy as np
+
+_TAG_ORIENTACAO = 0x0112
+# Posição e tamanho da miniatura JPEG no IFD1 do EXIF
+_TAG_MINIATURA_INICIO = 0x0201
+_TAG_MINIATURA_TAMANHO = 0x0202
+# Mesma tabela usada por ImageOps.exif_transpose
+_TRANSPOSICOES = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# Orientações EXIF que trocam largura e altura (rotações de 90/270 graus)
+_ORIENTACOES_TRANSPOSTAS = (5, 6, 7, 8)
+
+def _orientacao_exif(img):
+    try:
+        return img.getexif().get(_TAG_ORIENTACAO, 1)
+    except Exception:
+        return 1
+
+def carregar_imagem(caminho_imagem, downscale_factor=1.0):
+    """
+    Decodifica a imagem em RGB já na resolução reduzida e com a orientação EXIF aplicada.
+    Para JPEG usa a redução no próprio decodificador (draft, escalas 1/2, 1/4 e 1/8) e
+    termina o ajuste com um filtro barato; nos demais formatos usa reduce() para fatores
+    inteiros. Retorna (array RGB uint8, escala), onde escala é a razão entre a largura
+    processada e a largura original (já orientada), usada para converter as caixas dos rostos.
+    """
+    img = Image.open(caminho_imagem)
+    orientacao = _orientacao_exif(img)
+    largura_original, altura_original = img.size
+
+    if downscale_factor < 1.0:
+        alvo = (max(1, int(largura_original * downscale_factor)), max(1, int(altura_original * downscale_factor)))
+        if img.format == "JPEG":
+            # O decodificador escolhe a maior redução DCT que ainda fica >= alvo
+            img.draft("RGB", alvo)
+        else:
+            fator_inteiro = int(1 / downscale_factor)
+            if fator_inteiro > 1 and abs(fator_inteiro * downscale_factor - 1.0) < 1e-6:
+                img = img.reduce(fator_inteiro)
+        img = img.convert("RGB")
+        if img.size != alvo:
+            img = img.resize(alvo, Image.Resampling.BILINEAR)
+    else:
+        img = img.convert("RGB")
+
+    if orientacao in _TRANSPOSICOES:
+        img = img.transpose(_TRANSPOSICOES[orientacao])
+
+    if orientacao in _ORIENTACOES_TRANSPOSTAS:
+        largura_original = altura_original
+    return np.array(img), img.width / largura_original
+
+def fator_para_orcamento(caminho_imagem, orcamento_pixels):
+    """
+    Fator de redução (<= 1) que leva a imagem para no máximo 'orcamento_pixels' pixels.
+    Só lê o cabeçalho do arquivo.
+    """
+    with Image.open(caminho_imagem) as img:
+        largura, altura = img.size
+    return min(1.0, (orcamento_pixels / max(1, largura * altura)) ** 0.5)
+
+def _miniatura_exif(img, lado):
+    """
+    Retorna a miniatura JPEG embutida no EXIF (IFD1) se ela tiver pelo menos 'lado'
+    pixels no maior lado e a mesma proporção da foto; senão None.
+    """
+    try:
+        ifd1 = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+        inicio, tamanho = ifd1.get(_TAG_MINIATURA_INICIO), ifd1.get(_TAG_MINIATURA_TAMANHO)
+        dados = img.info.get("exif", b"")
+        if not inicio or not tamanho or not dados.startswith(b"Exif\x00\x00"):
+            return None
+        miniatura = Image.open(io.BytesIO(dados[6 + inicio:6 + inicio + tamanho]))
+        miniatura.load()
+    except Exception:
+        return None
+    if max(miniatura.size) < lado:
+        return None
+    # Câmeras costumam gravar 160x120 com faixas pretas em fotos 3:2; nesse caso não serve
+    if abs(miniatura.width / miniatura.height - img.width / img.height) > 0.02:
+        return None
+    return miniatura
+
+def carregar_miniatura(caminho_imagem, lado):
+    """
+    Gera uma miniatura RGB que cabe em lado x lado, com a orientação EXIF aplicada.
+    Usa a miniatura embutida no EXIF quando ela é grande o bastante; senão, decodifica
+    com a redução do próprio decodificador JPEG (draft) antes do ajuste final.
+    """
+    img = Image.open(caminho_imagem)
+    orientacao = _orientacao_exif(img)
+    miniatura = _miniatura_exif(img, lado) if img.format == "JPEG" else None
+    if miniatura is not None:
+        img = miniatura
+    elif img.format == "JPEG":
+        img.draft("RGB", (lado, lado))
+    img = img.convert("RGB")
+    img.thumbnail((lado, lado), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    if orientacao in _TRANSPOSICOES:
+        img = img.transpose(_TRANSPOSICOES[orientacao])
+    return img
+
+def carregar_assinatura(caminho_imagem):
+    """
+    Assinatura perceptual barata para achar fotos quase idênticas (rajadas).
+    Decodifica a imagem em tons de cinza já bem reduzida (draft) e retorna
+    (dHash de 64 bits, (largura, altura) originais já orientadas, miniatura 16x16 uint8).
+    """
+    img = Image.open(caminho_imagem)
+    orientacao = _orientacao_exif(img)
+    largura, altura = img.size
+    if img.format == "JPEG":
+        img.draft("L", (32, 32))
+    img = img.convert("L")
+    if orientacao in _TRANSPOSICOES:
+        img = img.transpose(_TRANSPOSICOES[orientacao])
+    if orientacao in _ORIENTACOES_TRANSPOSTAS:
+        largura, altura = altura, largura
+    # dHash: compara cada pixel com o vizinho da direita numa versão 9x8
+    pixels = np.asarray(img.resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    dhash = int(np.packbits(bits).view(">u8")[0])
+    miniatura = np.asarray(img.resize((16, 16), Image.Resampling.BILINEAR), dtype=np.uint8)
+    return dhash, (largura, altura), miniatura
@@ -1,55 +1,346 @@
-from PIL import Image
+import os
+import json
+import time
+import signal
+from contextlib import contextmanager
 import numpy as np
 
-try:
+from PIL import Image
+
+from ..core.encoding_cache import EncodingCache, chave_perfil, orcamento_adaptativo
+from ..core.arena import gravar_rostos
+from .decodificacao import carregar_imagem, carregar_assinatura, fator_para_orcamento
+
+# Perfil adaptativo: rostos menores que isto (altura em pixels, na imagem processada)
+# são codificados com o modelo de 68 pontos ("large"), que alinha melhor rostos pequenos
+LIMITE_ROSTO_PEQUENO = 80
+# Tentativas do perfil adaptativo quando nenhum rosto é encontrado (cada uma com mais resolução)
+TENTATIVAS_ADAPTATIVO = 2
+
+# Pré-filtro: detecção numa decodificação de até PIXELS_PREFILTRO pixels, para descartar
+# fotos sem rostos antes do processamento completo. O descarte fica no cache com este perfil
+PIXELS_PREFILTRO = 300_000
+PERFIL_PREFILTRO = f"prefiltro:{PIXELS_PREFILTRO}"
+
+# O face_recognition (dlib) só é importado nos workers, em inicializar_worker; o processo
+# principal usa apenas as funções em NumPy deste módulo
+face_recognition = None
+# Cada processo do Pool mantém a sua própria conexão com o cache de codificações
+_cache = None
+# Referências (caminho, (nomes, matriz)) carregadas uma única vez por worker
+_referencias_instaladas = (None, None)
+
+def inicializar_worker():
+    """Inicializador dos processos do Pool persistente."""
+    global face_recognition
     import face_recognition
-except ImportError:
-    print("Erro: Bibliotecas de reconhecimento facial não encontradas. Instale com 'pip install face_recognition'.")
-    exit()
+    # O Ctrl+C é tratado pelo processo principal, que encerra o Pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Carrega os modelos do dlib agora, e não na primeira imagem
+    face_recognition.face_locations(np.zeros((32, 32, 3), dtype=np.uint8))
+
+def _novo_registro(caminho_imagem):
+    """Registro de tempo/status devolvido junto com o resultado de cada imagem."""
+    return {"caminho": caminho_imagem, "status": "ok", "motivo": None, "cache_hit": False, "rostos": 0,
+            "etapas": {}, "total": 0.0, "inicio": time.time(), "pid": os.getpid()}
+
+@contextmanager
+def _medir(registro, etapa):
+    """Soma ao registro o tempo gasto no bloco, na etapa indicada."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if registro is not None:
+            registro["etapas"][etapa] = registro["etapas"].get(etapa, 0.0) + time.perf_counter() - inicio
+
+def _concluir_registro(registro, erro=None):
+    registro["total"] = time.time() - registro["inicio"]
+    if erro is not None:
+        registro["status"] = "erro"
+        registro["motivo"] = type(erro).__name__
+        registro["detalhe"] = str(erro)[:200]
+    elif not registro["rostos"] and registro["status"] == "ok":
+        registro["status"] = "sem_rosto"
+    return registro
+
+def registro_de_falha(caminho_imagem, motivo, detalhe, total, pid):
+    """
+    Registro de uma imagem que não terminou no worker (tempo limite esgotado, worker
+    encerrado ou exceção não tratada), montado pelo processo principal.
+    """
+    registro = _novo_registro(caminho_imagem)
+    registro.update(status="erro", motivo=motivo, detalhe=detalhe, total=total,
+                    inicio=time.time() - total, pid=pid)
+    return registro
+
+def _obter_referencias(referencias):
+    """
+    Aceita o par (nomes, matriz) ou o caminho publicado por PoolPersistente.publicar_referencias;
+    neste caso o arquivo é lido apenas na primeira tarefa de cada worker.
+    """
+    global _referencias_instaladas
+    if not isinstance(referencias, str):
+        return referencias
+    if _referencias_instaladas[0] != referencias:
+        with open(referencias + ".json", encoding="utf-8") as f:
+            nomes = json.load(f)
+        _referencias_instaladas = (referencias, (nomes, np.load(referencias, mmap_mode="r")))
+    return _referencias_instaladas[1]
+
+def _obter_cache(caminho_db, usar_hash=False):
+    global _cache
+    if _cache is None or (_cache.caminho_db, _cache.usar_hash) != (caminho_db, usar_hash):
+        _cache = EncodingCache(caminho_db, usar_hash)
+    return _cache
+
+def _detectar_e_codificar(caminho_imagem, downscale_factor, registro=None):
+    """Detecta e codifica na mesma resolução (reduzida pelo downscale_factor)."""
+    with _medir(registro, "decodificar"):
+        image_to_process, escala = carregar_imagem(caminho_imagem, downscale_factor)
+    with _medir(registro, "detectar"):
+        caixas_processadas = face_recognition.face_locations(image_to_process)
+    with _medir(registro, "codificar"):
+        encodings = face_recognition.face_encodings(image_to_process, known_face_locations=caixas_processadas)
+    caixas = [tuple(int(round(c / escala)) for c in caixa) for caixa in caixas_processadas]
+    return encodings, caixas
+
+def _detectar_adaptativo(caminho_imagem, orcamento_pixels, registro=None):
+    """
+    Perfil adaptativo: a escala de decodificação de cada imagem vem do orçamento de
+    pixels, para que o custo por imagem fique parecido entre fotos de 0,3 e de 50 MP.
+    Imagens bem menores que o orçamento usam mais um upsample na detecção (HOG) em vez
+    de perder os rostos pequenos; rostos pequenos são codificados com o modelo "large".
+    Se nenhum rosto for encontrado, tenta de novo com o dobro da resolução (ou mais um
+    upsample, se a imagem já estiver na resolução original).
+    """
+    fator = fator_para_orcamento(caminho_imagem, orcamento_pixels)
+    upsample = None
+    for tentativa in range(TENTATIVAS_ADAPTATIVO):
+        with _medir(registro, "decodificar"):
+            imagem, escala = carregar_imagem(caminho_imagem, fator)
+        pixels = imagem.shape[0] * imagem.shape[1]
+        if upsample is None:
+            upsample = 2 if pixels * 4 <= orcamento_pixels else 1
+        with _medir(registro, "detectar"):
+            caixas_processadas = face_recognition.face_locations(imagem, number_of_times_to_upsample=upsample)
+        if caixas_processadas or tentativa == TENTATIVAS_ADAPTATIVO - 1:
+            break
+        if fator < 1.0:
+            fator = min(1.0, fator * 2)
+        elif upsample < 2 and pixels <= orcamento_pixels:
+            upsample += 1
+        else:
+            break
+    modelo = "large" if any(base - topo < LIMITE_ROSTO_PEQUENO for topo, _, base, _ in caixas_processadas) else "small"
+    with _medir(registro, "codificar"):
+        encodings = face_recognition.face_encodings(imagem, known_face_locations=caixas_processadas, model=modelo)
+    if registro is not None:
+        registro["perfil"] = {"escala": round(escala, 4), "upsample": upsample, "modelo": modelo, "tentativas": tentativa + 1}
+    caixas = [tuple(int(round(c / escala)) for c in caixa) for caixa in caixas_processadas]
+    return encodings, caixas
+
+def _detectar_baixa_codificar_alta(caminho_imagem, downscale_factor, registro=None):
+    """
+    Pipeline híbrido: a detecção (HOG) roda numa cópia reduzida da imagem e as caixas
+    são levadas de volta para a resolução original, onde face_encodings processa apenas
+    essas regiões. A detecção custa o tempo da baixa resolução e as codificações mantêm
+    a qualidade da resolução completa.
+    """
+    with _medir(registro, "decodificar"):
+        imagem_completa, _ = carregar_imagem(caminho_imagem, 1.0)
+        altura, largura = imagem_completa.shape[:2]
+        alvo = (max(1, int(largura * downscale_factor)), max(1, int(altura * downscale_factor)))
+        reduzida = np.array(Image.fromarray(imagem_completa).resize(alvo, Image.Resampling.BILINEAR))
+        escala = alvo[0] / largura
+
+    with _medir(registro, "detectar"):
+        caixas_reduzidas = face_recognition.face_locations(reduzida)
+    caixas = []
+    for top, right, bottom, left in caixas_reduzidas:
+        caixas.append((
+            max(0, int(round(top / escala))),
+            min(largura - 1, int(round(right / escala))),
+            min(altura - 1, int(round(bottom / escala))),
+            max(0, int(round(left / escala))),
+        ))
+    with _medir(registro, "codificar"):
+        encodings = face_recognition.face_encodings(imagem_completa, known_face_locations=caixas)
+    return encodings, caixas
+
+def _descartar_no_prefiltro(caminho_imagem, cache, registro=None):
+    """
+    Pré-filtro barato: procura rostos numa decodificação minúscula (draft do JPEG) da
+    imagem. Retorna (descartar, cache_hit). Fotos descartadas são gravadas no cache com
+    PERFIL_PREFILTRO, para não serem verificadas de novo; imagens que já cabem no
+    orçamento do pré-filtro não são verificadas (não haveria economia).
+    """
+    if cache is not None:
+        with _medir(registro, "cache"):
+            if cache.get(caminho_imagem, PERFIL_PREFILTRO) is not None:
+                return True, True
+    with _medir(registro, "prefiltro"):
+        fator = fator_para_orcamento(caminho_imagem, PIXELS_PREFILTRO)
+        if fator >= 1.0:
+            return False, False
+        imagem, _ = carregar_imagem(caminho_imagem, fator)
+        if face_recognition.face_locations(imagem):
+            return False, False
+    if cache is not None:
+        with _medir(registro, "cache"):
+            cache.put(caminho_imagem, PERFIL_PREFILTRO, [], [])
+    return True, False
+
+def _extrair_encodings(caminho_imagem, downscale_factor, cache_db, hibrido=False, registro=None, prefiltro=False, cache_hash=False):
+    """
+    Retorna (encodings, caixas, cache_hit). Consulta o cache antes de decodificar a
+    imagem e grava o resultado nele depois da codificação. As caixas
+    (top, right, bottom, left) são convertidas para a resolução original.
+    Com prefiltro=True, fotos em que o pré-filtro não encontra rostos retornam sem
+    rostos e com o status "prefiltro" no registro. Com cache_hash=True, as entradas do
+    cache também são conferidas pelo hash do conteúdo do arquivo.
+    Os tempos de cada etapa são somados em 'registro', se informado.
+    """
+    perfil = chave_perfil(downscale_factor, hibrido)
+    cache = _obter_cache(cache_db, cache_hash) if cache_db else None
+    if cache is not None:
+        with _medir(registro, "cache"):
+            salvo = cache.get(caminho_imagem, perfil)
+        if salvo is not None:
+            encodings, caixas = salvo
+            if registro is not None:
+                registro["cache_hit"], registro["rostos"] = True, len(encodings)
+            return encodings, caixas, True
+
+    if prefiltro:
+        descartar, cache_hit = _descartar_no_prefiltro(caminho_imagem, cache, registro)
+        if descartar:
+            if registro is not None:
+                registro["status"], registro["cache_hit"] = "prefiltro", cache_hit
+            return [], [], cache_hit
+
+    orcamento = orcamento_adaptativo(downscale_factor)
+    if orcamento is not None:
+        encodings, caixas = _detectar_adaptativo(caminho_imagem, orcamento, registro)
+    elif hibrido and downscale_factor < 1.0:
+        encodings, caixas = _detectar_baixa_codificar_alta(caminho_imagem, downscale_factor, registro)
+    else:
+        encodings, caixas = _detectar_e_codificar(caminho_imagem, downscale_factor, registro)
+    if cache is not None:
+        with _medir(registro, "cache"):
+            cache.put(caminho_imagem, perfil, encodings, caixas)
+    if registro is not None:
+        registro["rostos"] = len(encodings)
+    return encodings, caixas, False
 
 def processar_imagem_cluster_worker(args):
     """
     Worker para extrair codificações de rosto de uma imagem para o processo de clusterização.
     Projetado para ser executado em um processo separado (multiprocessing).
+    Os rostos são gravados na arena deste worker em 'pasta_arena' (ver app/core/arena.py)
+    e só o bloco (pid, segmento, linha inicial, quantidade) volta pelo pipe.
+    Retorna ((caminho, bloco, cache_hit) ou None se a imagem não puder ser lida,
+    registro de tempo/status da imagem).
     """
-    caminho_imagem, downscale_factor = args
+    caminho_imagem, downscale_factor, cache_db, cache_hash, hibrido, prefiltro, pasta_arena = args
+    registro = _novo_registro(caminho_imagem)
     try:
-        if downscale_factor < 1.0:
-            img = Image.open(caminho_imagem).convert("RGB")
-            new_size = (int(img.width * downscale_factor), int(img.height * downscale_factor))
-            img.thumbnail(new_size, Image.Resampling.LANCZOS)
-            image_to_process = np.array(img)
-        else:
-            image_to_process = face_recognition.load_image_file(caminho_imagem)
-        
-        encodings = face_recognition.face_encodings(image_to_process)
-        if encodings:
-            return (caminho_imagem, encodings)
+        encodings, caixas, cache_hit = _extrair_encodings(caminho_imagem, downscale_factor, cache_db, hibrido, registro, prefiltro, cache_hash)
+        bloco = gravar_rostos(pasta_arena, encodings, caixas)
+        return (caminho_imagem, bloco, cache_hit), _concluir_registro(registro)
+    except Exception as e:
+        # Arquivos corrompidos ou não suportados são ignorados, mas o motivo vai no registro
+        return None, _concluir_registro(registro, e)
+
+def calcular_assinatura_worker(caminho_imagem):
+    """
+    Worker do pré-passo de rajadas: calcula a assinatura perceptual da imagem.
+    Retorna ((caminho, dhash, tamanho, miniatura, duração), None); dhash é None se a
+    imagem não puder ser lida (ela segue para o processamento normal, que registra a falha).
+    """
+    inicio = time.perf_counter()
+    try:
+        dhash, tamanho, miniatura = carregar_assinatura(caminho_imagem)
     except Exception:
-        # Ignora erros em arquivos de imagem corrompidos ou não suportados
-        pass
-    return None
+        dhash, tamanho, miniatura = None, None, None
+    return (caminho_imagem, dhash, tamanho, miniatura, time.perf_counter() - inicio), None
 
-def processar_imagem_busca_worker(caminho_imagem, known_encodings, tolerance, downscale_factor):
+def codificar_referencia_worker(args):
+    """
+    Worker do carregamento das referências: codifica uma foto de referência na
+    resolução original, usando o cache de codificações (chave: identidade do arquivo).
+    Se houver mais de um rosto, usa o maior.
+    Retorna ((caminho, encoding ou None se não houver rosto) ou None se a imagem não
+    puder ser lida, registro de tempo/status da imagem).
+    """
+    caminho_imagem, cache_db, cache_hash = args
+    registro = _novo_registro(caminho_imagem)
+    try:
+        encodings, caixas, _ = _extrair_encodings(caminho_imagem, 1.0, cache_db, False, registro, cache_hash=cache_hash)
+        if not len(encodings):
+            return (caminho_imagem, None), _concluir_registro(registro)
+        maior = max(range(len(caixas)), key=lambda i: (caixas[i][2] - caixas[i][0]) * (caixas[i][1] - caixas[i][3]))
+        return (caminho_imagem, encodings[maior]), _concluir_registro(registro)
+    except Exception as e:
+        return None, _concluir_registro(registro, e)
+
+def montar_matriz_referencias(known_encodings):
+    """
+    Empilha o dicionário {nome: encoding ou [encodings]} em (nomes, matriz float32 (R, 128)).
+    Uma pessoa com várias fotos de referência (galeria) ocupa várias linhas com o mesmo
+    nome; como cada rosto fica com a linha mais próxima, vale a menor distância da pessoa.
+    Deve ser chamado uma única vez por execução, antes de distribuir as tarefas.
+    """
+    nomes, linhas = [], []
+    for nome, encodings in known_encodings.items():
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        nomes.extend([nome] * len(encodings))
+        linhas.append(encodings)
+    matriz = np.concatenate(linhas) if linhas else np.zeros((0, 128), dtype=np.float32)
+    return nomes, matriz
+
+def comparar_com_referencias(unknown_encodings, referencias, tolerance, retornar_todos=False):
+    """
+    Calcula de uma só vez as distâncias entre todos os rostos da imagem e todas as
+    referências. Cada rosto é atribuído à referência mais próxima dentro da tolerância
+    (com galerias, a foto mais parecida de cada pessoa).
+    Retorna a lista de nomes encontrados: apenas o de menor distância, ou todas as
+    pessoas identificadas na foto quando retornar_todos=True.
+    """
+    nomes, matriz = referencias
+    if not len(unknown_encodings) or not len(nomes):
+        return []
+    rostos = np.asarray(unknown_encodings, dtype=np.float32)
+    distancias = np.linalg.norm(rostos[:, None, :] - matriz[None, :, :], axis=2)
+    melhor_ref = distancias.argmin(axis=1)
+    melhor_dist = distancias[np.arange(len(rostos)), melhor_ref]
+    validos = melhor_dist <= tolerance
+    if not validos.any():
+        return []
+    if not retornar_todos:
+        return [nomes[melhor_ref[np.where(validos, melhor_dist, np.inf).argmin()]]]
+    # Mantém a ordem por distância e remove pessoas repetidas
+    ordem = np.argsort(melhor_dist[validos])
+    encontrados = []
+    for idx in melhor_ref[validos][ordem]:
+        if nomes[idx] not in encontrados:
+            encontrados.append(nomes[idx])
+    return encontrados
+
+def processar_imagem_busca_worker(caminho_imagem, referencias, tolerance, downscale_factor, cache_db=None, retornar_todos=False, hibrido=False, prefiltro=False, cache_hash=False):
     """
     Worker para comparar rostos em uma imagem com um conjunto de codificações conhecidas.
     Projetado para ser executado em um processo separado (multiprocessing).
+    'referencias' é o par (nomes, matriz) gerado por montar_matriz_referencias ou o
+    caminho em que o engine o publicou.
+    Retorna ((caminho, [nomes das pessoas], cache_hit) ou None se a imagem não puder ser
+    lida, registro de tempo/status da imagem).
     """
+    registro = _novo_registro(caminho_imagem)
     try:
-        if downscale_factor < 1.0:
-            img = Image.open(caminho_imagem).convert("RGB")
-            new_size = (int(img.width * downscale_factor), int(img.height * downscale_factor))
-            img.thumbnail(new_size, Image.Resampling.LANCZOS)
-            image_to_process = np.array(img)
-        else:
-            image_to_process = face_recognition.load_image_file(caminho_imagem)
-            
-        unknown_encodings = face_recognition.face_encodings(image_to_process)
-        
-        for unknown_encoding in unknown_encodings:
-            for person_name, ref_encoding in known_encodings.items():
-                if face_recognition.compare_faces([ref_encoding], unknown_encoding, tolerance=tolerance)[0]:
-                    return (caminho_imagem, person_name)
-    except Exception:
-        pass
-    return None
\ No newline at end of file
+        unknown_encodings, _, cache_hit = _extrair_encodings(caminho_imagem, downscale_factor, cache_db, hibrido, registro, prefiltro, cache_hash)
+        with _medir(registro, "comparar"):
+            encontrados = comparar_com_referencias(unknown_encodings, _obter_referencias(referencias), tolerance, retornar_todos)
+        return (caminho_imagem, encontrados, cache_hit), _concluir_registro(registro)
+    except Exception as e:
+        return None, _concluir_registro(registro, e)
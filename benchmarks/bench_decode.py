@@ -0,0 +1,69 @@
+"""
+Micro-benchmark da decodificação com downscale.
+
+Compara o caminho antigo dos workers (decodificação completa + thumbnail LANCZOS)
+com carregar_imagem (redução no decodificador JPEG + filtro barato) e imprime o
+tempo por megapixel da imagem original para cada fator de downscale.
+
+Uso: python -m benchmarks.bench_decode [--largura 6000] [--altura 4000] [--repeticoes 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.workers.decodificacao import carregar_imagem
+
+FATORES = [0.5, 0.25, 0.125]
+
+def gerar_jpeg(caminho, largura, altura, seed=0):
+    """Gera um JPEG determinístico com gradientes e ruído (textura parecida com foto)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:altura, 0:largura]
+    base = np.stack([(x * 255 // largura), (y * 255 // altura), ((x + y) * 255 // (largura + altura))], axis=-1)
+    ruido = rng.integers(-20, 20, size=base.shape)
+    Image.fromarray(np.clip(base + ruido, 0, 255).astype(np.uint8)).save(caminho, quality=90)
+
+def decodificar_antigo(caminho, downscale_factor):
+    img = Image.open(caminho).convert("RGB")
+    new_size = (int(img.width * downscale_factor), int(img.height * downscale_factor))
+    img.thumbnail(new_size, Image.Resampling.LANCZOS)
+    return np.array(img)
+
+def decodificar_novo(caminho, downscale_factor):
+    return carregar_imagem(caminho, downscale_factor)[0]
+
+def medir(funcao, caminho, fator, repeticoes):
+    funcao(caminho, fator)  # aquecimento (cache de disco)
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao(caminho, fator)
+    return (time.perf_counter() - inicio) / repeticoes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--largura", type=int, default=6000)
+    parser.add_argument("--altura", type=int, default=4000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "amostra.jpg")
+        gerar_jpeg(caminho, args.largura, args.altura)
+        megapixels = args.largura * args.altura / 1e6
+        print(f"Imagem: {args.largura}x{args.altura} ({megapixels:.1f} MP), {args.repeticoes} repetições")
+        print(f"{'fator':>7} {'antes (ms/MP)':>15} {'depois (ms/MP)':>15} {'ganho':>7}")
+        for fator in FATORES:
+            antes = medir(decodificar_antigo, caminho, fator, args.repeticoes) * 1000 / megapixels
+            depois = medir(decodificar_novo, caminho, fator, args.repeticoes) * 1000 / megapixels
+            print(f"{fator:>7} {antes:>15.2f} {depois:>15.2f} {antes / depois:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
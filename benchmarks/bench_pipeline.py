@@ -0,0 +1,288 @@
+"""
+Benchmark das etapas do pipeline sobre um corpus sintético e determinístico.
+
+Gera (offline, só com Pillow/NumPy) um corpus de fotos com rostos desenhados em
+várias resoluções, fotos sem rosto e arquivos corrompidos, e mede imagens/s e
+rostos/s separadamente para cada etapa:
+
+- decodificar: carregar_imagem, por fator de downscale;
+- detectar:    face_recognition.face_locations na imagem já decodificada;
+- codificar:   face_recognition.face_encodings com as caixas já conhecidas;
+- comparar:    comparar_com_referencias (codificações sintéticas, várias pessoas);
+- agrupar:     SessaoAgrupamento + DBSCAN, para cada motor de agrupamento;
+- saida:       SaidaArquivos em cada modo de saída;
+- completo:    ProcessingEngine.executar_busca_cluster, por tamanho do Pool e downscale.
+
+Os rostos desenhados nem sempre são encontrados pelo detector HOG; para números
+mais realistas, passe uma pasta com recortes de rostos de uso livre em --rostos,
+que serão colados nas fotos geradas. O resultado pode ser gravado em JSON (--saida)
+e comparado com o de outro commit (--comparar).
+
+Uso: python -m benchmarks.bench_pipeline [--fotos 24] [--processos 1,2,4]
+                                         [--fatores 1.0,0.5,0.25] [--saida resultado.json]
+                                         [--comparar anterior.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import face_recognition
+
+from app.core.clustering import MOTORES_AGRUPAMENTO
+from app.core.config import ConfiguracaoAnalise
+from app.core.face_table import FaceTable
+from app.core.processing import ProcessingEngine
+from app.core.saida import MODOS_SAIDA, SaidaArquivos
+from app.core.sessao import SessaoAgrupamento
+from app.workers.decodificacao import carregar_imagem
+from app.workers.face_workers import comparar_com_referencias, montar_matriz_referencias
+
+RESOLUCOES = [(1600, 1200), (3000, 2000), (4000, 3000)]
+
+# --- Corpus sintético ---
+
+def _fundo(rng, largura, altura):
+    y, x = np.mgrid[0:altura, 0:largura]
+    base = np.stack([(x * 255 // largura), (y * 255 // altura), ((x + y) * 255 // (largura + altura))], axis=-1)
+    ruido = rng.integers(-20, 20, size=base.shape)
+    return Image.fromarray(np.clip(base + ruido, 0, 255).astype(np.uint8))
+
+def _desenhar_rosto(desenho, x, y, tamanho, rng):
+    """Desenha um rosto frontal simples (pele, olhos, sobrancelhas, nariz e boca)."""
+    pele = tuple(int(c) for c in rng.integers([170, 120, 90], [240, 190, 160]))
+    w, h = tamanho, int(tamanho * 1.3)
+    desenho.ellipse([x, y, x + w, y + h], fill=pele)
+    for cx in (x + w * 0.3, x + w * 0.7):
+        desenho.ellipse([cx - w * 0.08, y + h * 0.38, cx + w * 0.08, y + h * 0.46], fill=(250, 250, 250))
+        desenho.ellipse([cx - w * 0.04, y + h * 0.39, cx + w * 0.04, y + h * 0.45], fill=(40, 30, 20))
+        desenho.rectangle([cx - w * 0.1, y + h * 0.31, cx + w * 0.1, y + h * 0.33], fill=(60, 40, 30))
+    desenho.line([x + w * 0.5, y + h * 0.45, x + w * 0.45, y + h * 0.62, x + w * 0.55, y + h * 0.62], fill=(120, 80, 60), width=max(1, w // 60))
+    desenho.arc([x + w * 0.3, y + h * 0.65, x + w * 0.7, y + h * 0.8], 20, 160, fill=(150, 50, 50), width=max(1, w // 40))
+
+def gerar_corpus(pasta, num_fotos, seed=0, pasta_rostos=None):
+    """
+    Gera o corpus em 'pasta' e retorna {"com_rosto": [...], "sem_rosto": [...], "corrompidas": [...]}.
+    Cerca de 2/3 das fotos têm de 1 a 3 rostos; o restante não tem nenhum.
+    """
+    rng = np.random.default_rng(seed)
+    recortes = []
+    if pasta_rostos:
+        for nome in sorted(os.listdir(pasta_rostos)):
+            try:
+                recortes.append(Image.open(os.path.join(pasta_rostos, nome)).convert("RGB"))
+            except Exception:
+                pass
+    corpus = {"com_rosto": [], "sem_rosto": [], "corrompidas": []}
+    for i in range(num_fotos):
+        largura, altura = RESOLUCOES[i % len(RESOLUCOES)]
+        img = _fundo(rng, largura, altura)
+        num_rostos = 0 if i % 3 == 2 else int(rng.integers(1, 4))
+        desenho = ImageDraw.Draw(img)
+        for r in range(num_rostos):
+            tamanho = int(min(largura, altura) * rng.uniform(0.15, 0.25))
+            x = int(largura * (r + 0.2) / 3.5)
+            y = int(rng.integers(0, max(1, altura - int(tamanho * 1.4))))
+            if recortes:
+                recorte = recortes[int(rng.integers(len(recortes)))]
+                img.paste(recorte.resize((tamanho, int(tamanho * recorte.height / recorte.width))), (x, y))
+            else:
+                _desenhar_rosto(desenho, x, y, tamanho, rng)
+        caminho = os.path.join(pasta, f"foto_{i:03d}_{largura}x{altura}.jpg")
+        img.save(caminho, quality=90)
+        corpus["com_rosto" if num_rostos else "sem_rosto"].append(caminho)
+    # Arquivos corrompidos: JPEG truncado e bytes aleatórios com extensão de imagem
+    with open(corpus["com_rosto"][0], "rb") as f:
+        inicio_jpeg = f.read(4096)
+    for nome, conteudo in (("truncada.jpg", inicio_jpeg), ("lixo.jpg", rng.bytes(8192)), ("vazia.png", b"")):
+        caminho = os.path.join(pasta, nome)
+        with open(caminho, "wb") as f:
+            f.write(conteudo)
+        corpus["corrompidas"].append(caminho)
+    return corpus
+
+def codificacoes_sinteticas(num_pessoas, por_pessoa, seed=0):
+    """Codificações de 128 dimensões agrupadas por pessoa (centro + ruído pequeno)."""
+    rng = np.random.default_rng(seed)
+    centros = rng.normal(0, 0.09, size=(num_pessoas, 128))
+    rostos = np.repeat(centros, por_pessoa, axis=0) + rng.normal(0, 0.02, size=(num_pessoas * por_pessoa, 128))
+    return centros, rostos
+
+# --- Medições ---
+
+def registro(etapa, segundos, imagens, rostos=0, falhas=0, **parametros):
+    return {
+        "etapa": etapa, **parametros,
+        "imagens": imagens, "rostos": rostos, "falhas": falhas,
+        "segundos": round(segundos, 6),
+        "imagens_por_s": round(imagens / segundos, 3) if segundos > 0 else None,
+        "rostos_por_s": round(rostos / segundos, 3) if segundos > 0 and rostos else None,
+    }
+
+def medir_imagens(caminhos, fatores):
+    """Decodificação, detecção e codificação, cada uma cronometrada separadamente."""
+    resultados = []
+    for fator in fatores:
+        decodificadas, falhas, t_decod = [], 0, 0.0
+        for caminho in caminhos:
+            inicio = time.perf_counter()
+            try:
+                decodificadas.append(carregar_imagem(caminho, fator)[0])
+            except Exception:
+                falhas += 1
+            t_decod += time.perf_counter() - inicio
+        resultados.append(registro("decodificar", t_decod, len(caminhos), falhas=falhas, downscale=fator))
+
+        inicio = time.perf_counter()
+        caixas = [face_recognition.face_locations(img) for img in decodificadas]
+        t_detect = time.perf_counter() - inicio
+        num_rostos = sum(len(c) for c in caixas)
+        resultados.append(registro("detectar", t_detect, len(decodificadas), num_rostos, downscale=fator))
+
+        inicio = time.perf_counter()
+        for img, c in zip(decodificadas, caixas):
+            if c:
+                face_recognition.face_encodings(img, known_face_locations=c)
+        t_encode = time.perf_counter() - inicio
+        resultados.append(registro("codificar", t_encode, sum(1 for c in caixas if c), num_rostos, downscale=fator))
+    return resultados
+
+def medir_comparacao(num_pessoas=50, por_pessoa=20, rostos_por_foto=2, tolerancia=0.6):
+    centros, rostos = codificacoes_sinteticas(num_pessoas, por_pessoa)
+    referencias = montar_matriz_referencias({f"Pessoa_{i}": c for i, c in enumerate(centros)})
+    fotos = [list(rostos[i:i + rostos_por_foto]) for i in range(0, len(rostos), rostos_por_foto)]
+    inicio = time.perf_counter()
+    for encodings in fotos:
+        comparar_com_referencias(encodings, referencias, tolerancia, retornar_todos=True)
+    return [registro("comparar", time.perf_counter() - inicio, len(fotos), len(rostos), referencias=num_pessoas)]
+
+def medir_agrupamento(num_pessoas=200, por_pessoa=25, eps=0.5):
+    _, rostos = codificacoes_sinteticas(num_pessoas, por_pessoa, seed=1)
+    tabela = FaceTable()
+    for i in range(0, len(rostos), 2):
+        tabela.adicionar(f"/sintetico/foto_{i}.jpg", list(rostos[i:i + 2]), [(0, 1, 1, 0)] * len(rostos[i:i + 2]))
+    num_fotos = len(tabela.caminhos)
+    resultados = []
+    for motor in MOTORES_AGRUPAMENTO:
+        if motor == "Automático":
+            continue
+        inicio = time.perf_counter()
+        sessao = SessaoAgrupamento(tabela, 0.6, "/sintetico", motor)
+        sessao.agrupar(eps, 2)
+        sessao.grupos()
+        resultados.append(registro("agrupar", time.perf_counter() - inicio, num_fotos, len(tabela), motor=motor))
+    return resultados
+
+def medir_saida(caminhos, pasta_trabalho, num_threads=4):
+    resultados = []
+    for modo in MODOS_SAIDA:
+        destino = tempfile.mkdtemp(prefix=f"saida_{modo}_", dir=pasta_trabalho)
+        saida = SaidaArquivos(modo, destino, num_threads=num_threads)
+        inicio = time.perf_counter()
+        for i, caminho in enumerate(caminhos):
+            saida.enviar(caminho, f"Pessoa_{i % 5:02d}", f"Pessoa_{i % 5:02d}")
+        saida.finalizar()
+        resultados.append(registro("saida", time.perf_counter() - inicio, len(caminhos), falhas=len(saida.erros), modo=modo))
+    return resultados
+
+def medir_completo(pasta, processos, fatores, total_imagens):
+    resultados = []
+    for num_processos in processos:
+        engine = ProcessingEngine(num_processos=num_processos)
+        try:
+            engine.pool.obter()  # os workers sobem antes da medição
+            for fator in fatores:
+                # Sem cache nem diário: cada fator processa todas as imagens de novo
+                config = ConfiguracaoAnalise(pasta_origem=pasta, downscale_factor=fator, cache_db=None, retomar=False)
+                inicio = time.perf_counter()
+                engine.executar_busca_cluster(config)
+                segundos = time.perf_counter() - inicio
+                rostos = len(engine.sessao.tabela) if engine.sessao else 0
+                resultados.append(registro("completo", segundos, total_imagens, rostos, falhas=engine.estatisticas.total_falhas, processos=num_processos, downscale=fator))
+        finally:
+            engine.fechar()
+    return resultados
+
+# --- Relatório ---
+
+def ambiente():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "plataforma": platform.platform(),
+            "cpus": os.cpu_count(), "numpy": np.__version__}
+
+def _chave(r):
+    return tuple((k, r[k]) for k in ("etapa", "downscale", "processos", "motor", "modo", "referencias") if k in r)
+
+def imprimir(resultados, anterior=None):
+    base = {_chave(r): r for r in (anterior or [])}
+    print(f"{'etapa':<12} {'parâmetros':<26} {'imagens/s':>10} {'rostos/s':>10} {'falhas':>6} {'vs. anterior':>13}")
+    for r in resultados:
+        parametros = ", ".join(f"{k}={v}" for k, v in _chave(r)[1:])
+        comparacao = ""
+        antigo = base.get(_chave(r))
+        if antigo and antigo.get("imagens_por_s") and r["imagens_por_s"]:
+            comparacao = f"{r['imagens_por_s'] / antigo['imagens_por_s']:.2f}x"
+        rostos = f"{r['rostos_por_s']:.1f}" if r["rostos_por_s"] else "-"
+        print(f"{r['etapa']:<12} {parametros:<26} {r['imagens_por_s'] or 0:>10.1f} {rostos:>10} {r['falhas']:>6} {comparacao:>13}")
+
+def _lista(tipo):
+    return lambda texto: [tipo(v) for v in texto.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fotos", type=int, default=24, help="Fotos geradas no corpus (sem contar as corrompidas).")
+    parser.add_argument("--processos", type=_lista(int), default=[1, 2, 4], help="Tamanhos do Pool, separados por vírgula.")
+    parser.add_argument("--fatores", type=_lista(float), default=[1.0, 0.5, 0.25], help="Fatores de downscale, separados por vírgula.")
+    parser.add_argument("--rostos", help="Pasta com recortes de rostos (de uso livre) para colar nas fotos.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--etapas", type=_lista(str), default=["imagens", "comparar", "agrupar", "saida", "completo"])
+    parser.add_argument("--saida", help="Grava os resultados em JSON neste arquivo.")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior, para mostrar a variação.")
+    args = parser.parse_args()
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)["resultados"]
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as pasta_trabalho:
+        pasta_corpus = os.path.join(pasta_trabalho, "corpus")
+        os.makedirs(pasta_corpus)
+        corpus = gerar_corpus(pasta_corpus, args.fotos, args.seed, args.rostos)
+        todas = corpus["com_rosto"] + corpus["sem_rosto"] + corpus["corrompidas"]
+        print(f"Corpus: {len(corpus['com_rosto'])} com rosto, {len(corpus['sem_rosto'])} sem rosto, {len(corpus['corrompidas'])} corrompidas")
+
+        if "imagens" in args.etapas:
+            resultados += medir_imagens(todas, args.fatores)
+        if "comparar" in args.etapas:
+            resultados += medir_comparacao()
+        if "agrupar" in args.etapas:
+            resultados += medir_agrupamento()
+        if "saida" in args.etapas:
+            resultados += medir_saida(corpus["com_rosto"] + corpus["sem_rosto"], pasta_trabalho)
+        if "completo" in args.etapas:
+            resultados += medir_completo(pasta_corpus, args.processos, args.fatores, len(todas))
+
+    imprimir(resultados, anterior)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"ambiente": ambiente(), "parametros": vars(args), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em {args.saida}")
+
+if __name__ == "__main__":
+    main()